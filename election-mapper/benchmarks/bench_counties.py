@@ -0,0 +1,101 @@
+"""
+Benchmark of a full repaint of a county-scale US map.
+
+No county *.svg map ships with this repository, so a synthetic one is generated: ~3,100 county paths with FIPS code
+ids, grouped in one <g> per state inside <g id="counties">, same as MapperUS expects from FILE_COUNTIES.
+
+Usage:
+    python benchmarks/bench_counties.py [number of counties]
+"""
+# --- External Imports --- #
+from os import path
+from tempfile import mkstemp
+from time import perf_counter
+import os
+import random
+import sys
+
+sys.path.insert(0, path.join(path.dirname(path.abspath(__file__)), ".."))
+
+# --- Internal Imports --- #
+from mappers.electionUS import ElectionUS
+from mappers.storage import MemoryStorage
+
+N_STATES = 51
+
+
+def make_county_svg(filename, counties=3100, seed=0):
+    """
+    Write a synthetic county-scale map to <filename>.
+
+    :param filename: filepath of *.svg map to write
+    :type filename: str
+    :param counties: number of county paths
+    :type counties: int
+    :param seed: random seed of path geometry
+    :type seed: int
+
+    :return: list of county identifiers (FIPS codes)
+    :rtype: list[str]
+    """
+    rnd = random.Random(seed)
+    ids = []
+    lines = ['<?xml version="1.0" encoding="UTF-8" standalone="no"?>',
+             '<svg xmlns="http://www.w3.org/2000/svg" width="1000" height="600">',
+             '<title>US Counties</title>',
+             '<text id="cc" font-family="Arial" font-size="6" x="3" y="595">synthetic county map</text>',
+             '<g id="counties">']
+    per_state = -(-counties // N_STATES)
+    for st in range(N_STATES):
+        lines.append('\t<g id="S{0:02d}">'.format(st + 1))
+        for k in range(min(per_state, counties - len(ids))):
+            fips = "{0:02d}{1:03d}".format(st + 1, 2 * k + 1)
+            x, y = rnd.uniform(0, 990), rnd.uniform(0, 590)
+            d = "M{0:.1f},{1:.1f}".format(x, y) + "".join(
+                "l{0:.1f},{1:.1f}".format(rnd.uniform(-2, 2), rnd.uniform(-2, 2)) for _ in range(40)) + "z"
+            lines.append('\t\t<path id="{0}" fill="#C0C0C0" d="{1}"/>'.format(fips, d))
+            ids.append(fips)
+        lines.append('\t</g>')
+    lines += ['</g>', '</svg>']
+    with open(filename, "w") as f:
+        f.write("\n".join(lines))
+    return ids
+
+
+def main(counties=3100):
+    fd, svgfile = mkstemp(suffix=".svg", prefix="svgUSco")
+    os.close(fd)
+    try:
+        ids = make_county_svg(svgfile, counties)
+
+        t = perf_counter()
+        e = ElectionUS("counties", inmemory=True, config={"FILE_COUNTIES": svgfile}, storage=MemoryStorage())
+        t_init = perf_counter() - t
+
+        colors = [0xD22532, 0x244999, 0xFF8B98, 0x8AAFFF, 0xBBAA90]
+        t = perf_counter()
+        unknown = e.set_region_colors({fips: colors[k % len(colors)] for k, fips in enumerate(ids)})
+        t_repaint = perf_counter() - t
+
+        t = perf_counter()
+        e.flush()
+        t_flush = perf_counter() - t
+
+        t = perf_counter()
+        held = e.get_candidate_regions(0xD22532)
+        t_query = perf_counter() - t
+
+        assert not unknown and len(held) == len(ids[::len(colors)])
+        print("counties              : {0}".format(len(ids)))
+        print("construct (1st, parse): {0:8.2f} ms".format(t_init * 1e3))
+        print("full repaint          : {0:8.2f} ms".format(t_repaint * 1e3))
+        print("flush                 : {0:8.2f} ms ({1} bytes)".format(t_flush * 1e3, len(e.storage.read())))
+        print("candidate regions     : {0:8.2f} ms".format(t_query * 1e3))
+    finally:
+        os.remove(svgfile)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3100)
+
+# END OF FILE ////////////////////////////////////////////////////////////
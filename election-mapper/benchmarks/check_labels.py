@@ -0,0 +1,63 @@
+"""
+Checks of region label points (see MapperUS.get_region_label_point(...)).
+
+The label point of every region must hit-test back to that region (see MapperUS.get_region_at(...)), also where a
+region drawn on top covers part of it (e.g. DC over Maryland). Checked on the states map and on a synthetic
+county-scale map (see bench_counties.py).
+
+Usage:
+    python benchmarks/check_labels.py [number of counties]
+"""
+# --- External Imports --- #
+from os import path
+from tempfile import mkstemp
+import os
+import sys
+
+sys.path.insert(0, path.join(path.dirname(path.abspath(__file__)), ".."))
+
+# --- Internal Imports --- #
+from bench_counties import make_county_svg
+from mappers.mapperUS import MapperUS
+from mappers.storage import MemoryStorage
+
+
+def check_labels(mapper, name):
+    """
+    Check that the label point of every region of <mapper> hit-tests back to the region.
+
+    :return: identifiers of regions whose label point does not
+    :rtype: list[str]
+    """
+    wrong = []
+    for identifier in mapper.get_region_list():
+        point = mapper.get_region_label_point(identifier)
+        if point is not None and mapper.get_region_at(*point) != identifier:
+            wrong.append(identifier)
+    print("{0} {1} ({2} regions)".format("FAILED" if wrong else "ok", name, len(mapper.get_region_list())))
+    for identifier in wrong:
+        print("    {0}: label point {1} hits {2}".format(
+            identifier, mapper.get_region_label_point(identifier),
+            mapper.get_region_at(*mapper.get_region_label_point(identifier))))
+    return wrong
+
+
+def main():
+    counties = int(sys.argv[1]) if len(sys.argv) > 1 else 3100
+    wrong = check_labels(MapperUS(inmemory=True, storage=MemoryStorage()), "states")
+
+    fd, svgfile = mkstemp(suffix=".svg", prefix="svgUSco")
+    os.close(fd)
+    try:
+        make_county_svg(svgfile, counties)
+        mapper = MapperUS("counties", inmemory=True, config={"FILE_COUNTIES": svgfile}, storage=MemoryStorage())
+        wrong += check_labels(mapper, "counties")
+    finally:
+        os.remove(svgfile)
+    sys.exit(1 if wrong else 0)
+
+
+if __name__ == "__main__":
+    main()
+
+# END OF FILE ////////////////////////////////////////////////////////////
@@ -0,0 +1,80 @@
+"""
+Checks of the lazy map loader (see mappers.lazy).
+
+Every map template must load its path data lazily, also when the attribute pattern matches outside of a start tag
+(e.g. a commented-out path, or text): such matches are put back as they were written, they must not turn the lazy
+parse into an eager one.
+
+Usage:
+    python benchmarks/check_lazy.py
+"""
+# --- External Imports --- #
+from os import path
+from tempfile import mkstemp
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, path.join(path.dirname(path.abspath(__file__)), ".."))
+
+# --- Internal Imports --- #
+from mappers.lazy import LazyAttribute, parse
+
+TEMPLATES = ("svg/svgroUSst.svg",)
+SOURCE = b"""<svg xmlns="http://www.w3.org/2000/svg">
+<!-- <path id="old" d="M 9 9 z"/> -->
+<path id="a" d="M 0 0 L 1 1 z"/>
+<text id="t">x d="M 1 1" y</text>
+<path id="b" d='M 2 2 &quot;z'/>
+</svg>
+"""
+
+
+def check_templates():
+    """
+    Check that every 'd' attribute of the map templates is loaded as a LazyAttribute.
+    """
+    base = path.join(path.dirname(path.abspath(__file__)), "..")
+    for template in TEMPLATES:
+        filename = path.join(base, template)
+        if not path.exists(filename):
+            continue
+        lazy = parse(filename)
+        eager = ET.parse(filename)
+        values = [element.attrib["d"] for element in lazy.iter() if "d" in element.attrib]
+        assert values, template
+        assert all(isinstance(value, LazyAttribute) for value in values), template
+        assert [str(value) for value in values] == [element.attrib["d"] for element in eager.iter()
+                                                    if "d" in element.attrib], template
+        print("ok {0} ({1} lazy values)".format(template, len(values)))
+
+
+def check_stray_matches():
+    """
+    Check that matches in comments and texts keep the parse lazy and the text as written.
+    """
+    handle, filename = mkstemp(suffix=".svg")
+    try:
+        with os.fdopen(handle, "wb") as f:
+            f.write(SOURCE)
+        root = parse(filename).getroot()
+    finally:
+        os.remove(filename)
+    paths = {element.attrib["id"]: element.attrib["d"] for element in root.iter() if "d" in element.attrib}
+    assert sorted(paths) == ["a", "b"], paths
+    assert all(isinstance(value, LazyAttribute) for value in paths.values())
+    assert str(paths["a"]) == "M 0 0 L 1 1 z" and str(paths["b"]) == 'M 2 2 "z'
+    text = next(element for element in root.iter() if element.attrib.get("id") == "t")
+    assert text.text == 'x d="M 1 1" y', text.text
+    print("ok stray matches")
+
+
+def main():
+    check_templates()
+    check_stray_matches()
+
+
+if __name__ == "__main__":
+    main()
+
+# END OF FILE ////////////////////////////////////////////////////////////
@@ -0,0 +1,377 @@
+"""
+Benchmark suite of mapper and election operations.
+
+Every case is timed for at least --time seconds and reports operations per second, mean/min time per operation,
+peak memory allocated by one operation (tracemalloc) and bytes written to mapfiles per operation. Operations writing
+through to a mapfile use a temporary file storage, as by default.
+
+Results are printed and saved as a JSON report that is comparable across commits: pass an older report with --compare
+to print the change of each case and flag regressions.
+
+Usage:
+    python benchmarks/run.py [-k SUBSTRING] [--time SECONDS] [--counties N] [-o REPORT] [--compare OLD_REPORT]
+"""
+# --- External Imports --- #
+from datetime import datetime, timezone
+from os import path
+from tempfile import mkstemp
+from time import perf_counter
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tracemalloc
+
+sys.path.insert(0, path.join(path.dirname(path.abspath(__file__)), ".."))
+
+# --- Internal Imports --- #
+from bench_counties import make_county_svg
+from mappers.electionUS import ElectionUS
+from mappers.mapperUS import MapperUS
+from mappers.render import available_backends
+from mappers.storage import MemoryStorage, TempStorage
+
+CASES = []
+"""
+Registered benchmark cases in run order, as (name, setup) tuples. setup(options) -> (operation, cleanup | None).
+:type: list[(str, function)]
+"""
+
+COLORS = [0xD22532, 0x244999, 0xFF8B98, 0x8AAFFF, 0xBBAA90]
+
+
+def case(name):
+    """
+    Decorator registering a benchmark case.
+
+    :param name: name of case
+    :type name: str
+
+    :return: decorator
+    :rtype: function
+    """
+    def register(setup):
+        CASES.append((name, setup))
+        return setup
+    return register
+
+
+class CountingStorage(TempStorage):
+    """
+    Temporary file storage counting bytes written by all instances.
+    """
+
+    written = 0
+
+    def write(self, data):
+        CountingStorage.written += len(data)
+        super().write(data)
+
+
+def _bar_data(n, tick=0):
+    """
+    :return: set_bar(...) data of <n> candidates, votes varying with <tick>
+    :rtype: dict
+    """
+    data = {k: ["Cand{0}".format(k), COLORS[k % len(COLORS)], 40 - k + (tick * (k + 1)) % 7] for k in range(n)}
+    data["total"] = 538
+    data["tri"] = None
+    return data
+
+
+# ------------------------------- Cases ------------------------------- #
+
+@case("construct/MapperUS")
+def _construct_mapper(options):
+    def op():
+        MapperUS(storage=CountingStorage()).close()
+    return op, None
+
+
+@case("construct/ElectionUS")
+def _construct_election(options):
+    def op():
+        ElectionUS(storage=CountingStorage()).close()
+    return op, None
+
+
+@case("states/set_region_color x51")
+def _set_region_color(options):
+    e = ElectionUS(storage=CountingStorage())
+    regions = e.get_region_list()
+    k = [0]
+
+    def op():
+        k[0] += 1
+        for i, region in enumerate(regions):
+            e.set_region_color(region, COLORS[(i + k[0]) % len(COLORS)])
+    return op, e.close
+
+
+@case("states/set_region_colors x51")
+def _set_region_colors(options):
+    e = ElectionUS(storage=CountingStorage())
+    regions = e.get_region_list()
+    k = [0]
+
+    def op():
+        k[0] += 1
+        e.set_region_colors({region: COLORS[(i + k[0]) % len(COLORS)] for i, region in enumerate(regions)})
+    return op, e.close
+
+
+@case("election/get_candidate_regions")
+def _get_candidate_regions(options):
+    e = ElectionUS(storage=CountingStorage())
+    e.add_candidate("Trump", COLORS[0])
+    e.add_candidate("Clinton", COLORS[1])
+    regions = e.get_region_list()
+    e.set_region_colors({region: COLORS[i % 2] for i, region in enumerate(regions)})
+    k = [0]
+
+    def op():
+        # Recolor one state per call so the lookup cannot be answered from an unchanged map
+        k[0] += 1
+        e.set_region_color(regions[k[0] % len(regions)], COLORS[k[0] % 2])
+        e.get_candidate_regions("trump")
+    return op, e.close
+
+
+@case("election/add+remove_candidate")
+def _add_remove_candidate(options):
+    e = ElectionUS(storage=CountingStorage())
+    e.add_candidate("Trump", COLORS[0])
+
+    def op():
+        e.add_candidate("Clinton", COLORS[1])
+        e.remove_candidate("Clinton")
+    return op, e.close
+
+
+for _n in (2, 4, 8, 12):
+    def _set_bar(options, n=_n):
+        e = ElectionUS(storage=CountingStorage())
+        k = [0]
+
+        def op():
+            k[0] += 1
+            e.set_bar(_bar_data(n, k[0]))
+        return op, e.close
+    case("election/set_bar {0} candidates".format(_n))(_set_bar)
+
+
+@case("export/svg after 1 change")
+def _export_svg(options):
+    e = ElectionUS(inmemory=True, storage=MemoryStorage())
+    regions = e.get_region_list()
+    k = [0]
+
+    def op():
+        k[0] += 1
+        e.set_region_color(regions[k[0] % len(regions)], COLORS[k[0] % len(COLORS)])
+        e.export("svg")
+    return op, e.close
+
+
+@case("export/svg full")
+def _export_svg_full(options):
+    e = ElectionUS(inmemory=True, storage=MemoryStorage())
+
+    def op():
+        e._writer.invalidate()  # Drop serializer cache: cost of serializing the whole document
+        e.export("svg")
+    return op, e.close
+
+
+@case("export/png")
+def _export_png(options):
+    if not available_backends("png"):
+        return None, None
+    e = ElectionUS(inmemory=True, storage=MemoryStorage())
+
+    def op():
+        e.export("png")
+    return op, e.close
+
+
+def _counties(options, inmemory):
+    """
+    Set up an ElectionUS map of a synthetic county-scale map (see bench_counties.py).
+
+    :return: map, county identifiers, cleanup function
+    :rtype: (ElectionUS, list[str], function)
+    """
+    fd, svgfile = mkstemp(suffix=".svg", prefix="svgUSco")
+    os.close(fd)
+    ids = make_county_svg(svgfile, options.counties)
+    storage = MemoryStorage() if inmemory else CountingStorage()
+    e = ElectionUS("counties", inmemory=inmemory, config={"FILE_COUNTIES": svgfile}, storage=storage)
+
+    def cleanup():
+        e.close()
+        os.remove(svgfile)
+    return e, ids, cleanup
+
+
+@case("counties/set_region_colors all")
+def _counties_repaint(options):
+    e, ids, cleanup = _counties(options, inmemory=False)
+    k = [0]
+
+    def op():
+        k[0] += 1
+        e.set_region_colors({fips: COLORS[(i + k[0]) % len(COLORS)] for i, fips in enumerate(ids)})
+    return op, cleanup
+
+
+@case("counties/set_region_color x1")
+def _counties_one(options):
+    e, ids, cleanup = _counties(options, inmemory=False)
+    k = [0]
+
+    def op():
+        k[0] += 1
+        e.set_region_color(ids[k[0] % len(ids)], COLORS[k[0] % len(COLORS)])
+    return op, cleanup
+
+
+# ------------------------------- Runner ------------------------------- #
+
+def measure(op, min_time, min_rounds=3):
+    """
+    Measure operation <op>.
+
+    :param op: operation to measure
+    :type op: function
+    :param min_time: minimum total time in seconds
+    :type min_time: float
+    :param min_rounds: minimum number of calls
+    :type min_rounds: int
+
+    :return: results of case
+    :rtype: dict
+    """
+    op()  # Warm up (template cache, lazy indexes)
+
+    # Peak memory of one call
+    tracemalloc.start()
+    try:
+        op()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    # Timing (and bytes written) over many calls
+    CountingStorage.written = 0
+    times = []
+    start = perf_counter()
+    while len(times) < min_rounds or perf_counter() - start < min_time:
+        t = perf_counter()
+        op()
+        times.append(perf_counter() - t)
+    total = sum(times)
+    return {
+        "ops_per_sec": len(times) / total,
+        "mean_ms": total / len(times) * 1e3,
+        "min_ms": min(times) * 1e3,
+        "rounds": len(times),
+        "peak_kib": peak / 1024,
+        "bytes_written_per_op": CountingStorage.written / len(times),
+    }
+
+
+def _commit():
+    """
+    :return: current git commit of the repository, or None if unknown.
+    :rtype: None | str
+    """
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=path.dirname(path.abspath(__file__)),
+                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except OSError:
+        return None
+    return out.stdout.decode().strip() or None
+
+
+def compare(report, old, threshold):
+    """
+    Print change of ops/sec of every case between <old> and <report>.
+
+    :param report: new report
+    :type report: dict
+    :param old: old report
+    :type old: dict
+    :param threshold: relative slow-down flagged as regression (e.g. 0.1 = 10 %)
+    :type threshold: float
+
+    :return: names of regressed cases
+    :rtype: list[str]
+    """
+    regressions = []
+    print("\nvs. {0} ({1})".format(old["meta"].get("commit"), old["meta"].get("date")))
+    for name, result in report["results"].items():
+        before = old["results"].get(name)
+        if before is None:
+            continue
+        change = result["ops_per_sec"] / before["ops_per_sec"] - 1
+        flag = ""
+        if change < -threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print("{0:36s} {1:+8.1%}{2}".format(name, change, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark mapper and election operations.")
+    parser.add_argument("-k", dest="match", default="", help="only run cases whose name contains MATCH")
+    parser.add_argument("--time", type=float, default=1.0, help="minimum seconds per case (default: 1.0)")
+    parser.add_argument("--counties", type=int, default=3100, help="counties of synthetic map (default: 3100)")
+    parser.add_argument("-o", dest="output", default=None, help="JSON report to write")
+    parser.add_argument("--compare", default=None, help="JSON report to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1, help="regression threshold (default: 0.1)")
+    options = parser.parse_args(argv)
+
+    report = {
+        "meta": {
+            "commit": _commit(),
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "counties": options.counties,
+        },
+        "results": {},
+    }
+
+    print("{0:36s} {1:>12s} {2:>10s} {3:>10s} {4:>12s}".format("case", "ops/sec", "mean ms", "peak KiB", "bytes/op"))
+    for name, setup in CASES:
+        if options.match not in name:
+            continue
+        op, cleanup = setup(options)
+        if op is None:
+            print("{0:36s} skipped (not available)".format(name))
+            continue
+        try:
+            result = report["results"][name] = measure(op, options.time)
+        finally:
+            if cleanup is not None:
+                cleanup()
+        print("{0:36s} {ops_per_sec:12.1f} {mean_ms:10.3f} {peak_kib:10.1f} {bytes_written_per_op:12.0f}"
+              .format(name, **result))
+
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if options.compare:
+        with open(options.compare) as f:
+            regressions = compare(report, json.load(f), options.threshold)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# END OF FILE ////////////////////////////////////////////////////////////
@@ -0,0 +1,129 @@
+"""
+Stress check of the thread safety of election maps (see mapperUS.synchronized).
+
+Many threads share one ElectionUS and hammer set_region_color(...) and set_bar(...) while others serialize it. Every
+document written to the mapfile or returned by to_svg() must parse, and the final map must agree with the state
+returned by the getters.
+
+Usage:
+    python benchmarks/stress_threads.py [--threads N] [--rounds N] [--seed N]
+"""
+# --- External Imports --- #
+from os import path
+import argparse
+import random
+import sys
+import threading
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, path.join(path.dirname(path.abspath(__file__)), ".."))
+
+# --- Internal Imports --- #
+from mappers.electionUS import ElectionUS
+from mappers.storage import MemoryStorage
+
+CANDIDATES = (("A", 0xff0000), ("B", 0x0000ff), ("C", 0x00aa00))
+
+
+def _bar_data(rng):
+    """
+    :return: random data for set_bar(...).
+    :rtype: dict
+    """
+    data = {n: [name, color, rng.randrange(0, 180)] for n, (name, color) in enumerate(CANDIDATES)}  # Sum <= total
+    data["total"] = 538
+    data["tri"] = rng.choice((None, -1, 0x000000))
+    return data
+
+
+def _fills(svg):
+    """
+    :return: fill color of each region in SVG document <svg>, by region id.
+    :rtype: dict[str, int]
+    """
+    root = ET.fromstring(svg)
+    states = next(element for element in root.iter() if element.attrib.get("id") == "states")
+    return {element.attrib["id"]: int(element.attrib["fill"].lstrip("#"), 16)
+            for element in states if "fill" in element.attrib}
+
+
+def run(threads=16, rounds=200, seed=0):
+    """
+    Run the stress check.
+
+    :param threads: number of writing threads (as many reading threads serialize the map)
+    :type threads: int
+    :param rounds: changes made by each writing thread
+    :type rounds: int
+    :param seed: seed of random changes
+    :type seed: int
+
+    :return: errors raised in threads or found in the final map, empty if none
+    :rtype: list[str]
+    """
+    storage = MemoryStorage()
+    election = ElectionUS(storage=storage)  # Writes through to the mapfile on every change
+    for name, color in CANDIDATES:
+        election.add_candidate(name, color)
+    regions = election.get_region_list()
+    errors = []
+    start = threading.Barrier(2 * threads)
+
+    def write(k):
+        rng = random.Random(seed + k)
+        start.wait()
+        try:
+            for _ in range(rounds):
+                election.set_region_color(rng.choice(regions), rng.choice(CANDIDATES)[1])
+                election.set_bar(_bar_data(rng))
+        except Exception as e:
+            errors.append("writer {0}: {1!r}".format(k, e))
+
+    def read(k):
+        start.wait()
+        try:
+            for _ in range(rounds // 10):
+                ET.fromstring(election.to_svg())
+                ET.fromstring(storage.read())
+        except Exception as e:
+            errors.append("reader {0}: {1!r}".format(k, e))
+
+    workers = [threading.Thread(target=write, args=(k,)) for k in range(threads)]
+    workers += [threading.Thread(target=read, args=(k,)) for k in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    # Final map, from memory and from the mapfile, agrees with the getters
+    for source, svg in (("to_svg", election.to_svg()), ("mapfile", storage.read())):
+        try:
+            fills = _fills(svg)
+        except Exception as e:
+            errors.append("{0}: {1!r}".format(source, e))
+            continue
+        wrong = [identifier for identifier in regions
+                 if fills.get(identifier) != election.get_region_color(identifier)]
+        if wrong:
+            errors.append("{0}: regions {1} differ from get_region_color(...)".format(source, ", ".join(wrong)))
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--threads", type=int, default=16, help="number of writing threads")
+    parser.add_argument("--rounds", type=int, default=200, help="changes made by each writing thread")
+    parser.add_argument("--seed", type=int, default=0, help="seed of random changes")
+    args = parser.parse_args()
+
+    errors = run(args.threads, args.rounds, args.seed)
+    for error in errors:
+        print(error)
+    print("{0} ({1} threads, {2} rounds)".format("FAILED" if errors else "ok", args.threads, args.rounds))
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
+
+# END OF FILE ////////////////////////////////////////////////////////////
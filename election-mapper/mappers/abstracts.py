@@ -37,18 +37,18 @@ INFO
     :Authors: B\. Seid
 """
 from abc import ABCMeta, abstractmethod
-from os import remove
+from mappers import render
 
 class Mapper(metaclass=ABCMeta):
     """
     Abstract class class meant to be subclassed by specialized country 'mapper' classes.
     """
 
-    _mapfile = None
+    _storage = None
     """
-    filepath location of *.svg map to be dynamically edited during runtime.
+    storage of the *.svg map ('mapfile') to be dynamically edited during runtime (see 'storage.py').
     Should not be modified except at object __init__.
-    :type : str
+    :type : mappers.storage.Storage
     """
 
     _mapheight = None
@@ -64,27 +64,50 @@ class Mapper(metaclass=ABCMeta):
     """
 
     @abstractmethod
-    def __init__(self, mapfile):
+    def __init__(self, storage):
         """
         Constructor method.
 
-        :param mapfile: filename of *.svg map to edit
-        :type mapfile: str
+        :param storage: storage of *.svg map to edit
+        :type storage: mappers.storage.Storage
         """
-        self._mapfile = mapfile
+        self._storage = storage
 
-    @abstractmethod
-    def __del__(self):
-        """Destructor method."""
-        remove(self.map)
+    def close(self):
+        """
+        Release the mapfile's storage (e.g. delete temporary mapfile). Pending changes are NOT written.
+
+        :return:
+        :rtype: None
+        """
+        if self._storage is not None:
+            self._storage.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # Write pending changes once on leaving the 'with' block (if the mapfile outlives it), then release storage
+        if self._storage is not None and self._storage.persistent:
+            self.flush()
+        self.close()
+        return False
 
     @property
     def map(self):
         """
-        :return: mapfile filename.
-        :rtype: str
+        :return: mapfile filename, or None if mapfile is not on disk (in-memory storage or not written yet).
+        :rtype: None | str
         """
-        return self._mapfile
+        return self._storage.path if self._storage is not None else None
+
+    @property
+    def storage(self):
+        """
+        :return: storage of mapfile.
+        :rtype: mappers.storage.Storage
+        """
+        return self._storage
 
     @property
     def mapheight(self):
@@ -124,6 +147,87 @@ class Mapper(metaclass=ABCMeta):
         """
         raise NotImplementedError
 
+    @abstractmethod
+    def flush(self):
+        """
+        Write any pending (in memory) changes to the mapfile. Does nothing if there are no pending changes.
+
+        :return:
+        :rtype: None
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def save(self, filename=None):
+        """
+        Write any pending changes to the mapfile and, if given, a copy of the map to <filename>.
+
+        :param filename: filepath to save a copy of the map to. If None, only the mapfile is written.
+        :type filename: None | str
+
+        :return:
+        :rtype: None
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def to_svg(self, scale=1.0):
+        """
+        Serialize the map as it currently is in memory (including changes not yet flushed) to SVG.
+
+        :param scale: scale factor of the SVG's width and height (map content is scaled through its viewBox).
+        :type scale: float
+
+        :return: SVG document
+        :rtype: bytes
+        """
+        raise NotImplementedError
+
+    def export(self, format="svg", dest=None, scale=1.0, backend=None):
+        """
+        Render the map in memory to an image. No temporary files are written. See 'render.py' for backends.
+
+        :param format: "svg" | "png" | "jpg" | "webp"
+        :type format: str
+
+        :param dest: filepath or writable binary file object to write image to. If None, image is only returned.
+        :type dest: None | str | io.BufferedIOBase
+
+        :param scale: scale factor of image relative to the map's width and height.
+        :type scale: float
+
+        :param backend: name of rasterizer backend to use. If None, first available one.
+        :type backend: None | str
+
+        :return: image bytes
+        :rtype: bytes
+        """
+        if render._format(format) == "svg":
+            data = self.to_svg(scale=scale)
+        else:
+            data = render.render(self.to_svg(), format, scale=scale, backend=backend)
+        return self._write_dest(data, dest)
+
+    @staticmethod
+    def _write_dest(data, dest):
+        """
+        Write exported <data> to destination <dest> (if given). Private method for Mapper objects.
+
+        :param data: exported bytes
+        :type data: bytes
+        :param dest: filepath or writable binary file object. If None, nothing is written.
+        :type dest: None | str | io.BufferedIOBase
+
+        :return: <data>
+        :rtype: bytes
+        """
+        if isinstance(dest, str):
+            with open(dest, "wb") as f:
+                f.write(data)
+        elif dest is not None:
+            dest.write(data)
+        return data
+
     @abstractmethod
     def set_region_color(self, identifier, color):
         """
@@ -137,6 +241,8 @@ class Mapper(metaclass=ABCMeta):
 
         :return:
         :rtype: None
+
+        :raises ValueError: if color is not in RGB hex (0x000000 to 0xffffff)
         """
         raise NotImplementedError
 
@@ -159,6 +265,35 @@ class Mapper(metaclass=ABCMeta):
         """
         raise NotImplementedError
 
+    @abstractmethod
+    def set_region_colors(self, mapping):
+        """
+        Change the color of many states/providences at once. Changes are written once for the whole mapping.
+
+        :param mapping: dictionary of identifier -> color in RGB hex (0x??????)
+        :type mapping: dict[str, int]
+
+        :return: list of identifiers in <mapping> not found in the map.
+        :rtype: list[str]
+
+        :raises ValueError: if a color is not in RGB hex (0x000000 to 0xffffff). No region is changed then.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_region_numbers(self, mapping):
+        """
+        Change the **number** of many states/providences at once (if exists). Changes are written once for the
+        whole mapping.
+
+        :param mapping: dictionary of identifier -> (number, color). If color is None, color is unchanged.
+        :type mapping: dict[str, (int, None | int)]
+
+        :return: list of identifiers in <mapping> not found in the map.
+        :rtype: list[str]
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def get_region_color(self, identifier):
         """
@@ -172,6 +307,16 @@ class Mapper(metaclass=ABCMeta):
         """
         raise NotImplementedError
 
+    @abstractmethod
+    def get_all_region_colors(self):
+        """
+        Retrieve the colors of all regions at once.
+
+        :return: dictionary of identifier -> color of region in RGB hex (0x??????).
+        :rtype: dict[str, int]
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def get_region_number(self, identifier):
         """
@@ -185,6 +330,19 @@ class Mapper(metaclass=ABCMeta):
         """
         raise NotImplementedError
 
+    @abstractmethod
+    def get_region_geometry(self, identifier):
+        """
+        Retrieve outline of region <identifier> (e.g. SVG path data).
+
+        :param identifier: identifier of region
+        :type identifier: str
+
+        :return: outline of region, None if region not found.
+        :rtype: None | str
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def get_region_list(self):
         """
@@ -222,7 +380,7 @@ class Electoral(metaclass=ABCMeta):
         :param color: color in RGB hex (0x??????)
         :type color: int
 
-        :param picture: filepath of candidate picture to add
+        :param picture: filepath of candidate picture to add. If None, the default picture.
         :type picture: None | str
 
         :return:
@@ -282,7 +440,9 @@ class Electoral(metaclass=ABCMeta):
     def set_candidate_color(self, name, color):
         """
         Sets the candidate's color to <color>.\n
-        *** THIS METHOD SHOULD NOT CHANGE THE COLOR OF CANDIDATE'S "REGIONS".
+        *** THIS METHOD SHOULD NOT CHANGE THE COLOR OF CANDIDATE'S "REGIONS", except in class coloring mode
+        (CLASS_COLORS): regions then share the candidate's CSS class and follow its color (see
+        MapperUS.recolor_regions(...)).
 
         :param name: name of candidate
         :type name: str
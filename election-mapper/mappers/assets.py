@@ -0,0 +1,188 @@
+"""
+This module holds the asset pipeline of candidate pictures embedded in maps.
+
+A picture is read from disk, decoded and resized once per process, then kept as a "data:" URI in a process-wide LRU
+cache with a memory cap. Maps embedding the picture (see 'candpic_embed' in USconfig.conf) share the cached string:
+they do not depend on the picture's path once moved, and rasterizing them never re-reads or rescales the original.
+
+Pictures are resized to fit the picture box (e.g. candpic_w x candpic_h) keeping their aspect ratio, as an SVG
+<image> is drawn. Resizing requires 'Pillow'; without it, pictures are embedded as they are.
+
+Attribs:
+    DIR (str) - Absolute filepath for this module's directory\n
+    CACHE_BYTES (int) - Default memory cap of a picture cache in bytes
+
+Classes:
+    PictureCache: LRU cache of resized pictures as data URIs.
+
+Functions:
+    resolve(filename): Get absolute filepath of a picture.\n
+    data_uri(filename, width, height): Get (cached) data URI of a resized picture.
+"""
+# --- External Imports --- #
+from base64 import b64encode
+from collections import OrderedDict
+from io import BytesIO
+from mimetypes import guess_type
+from os import path
+from threading import Lock
+try:
+    from PIL import Image
+except ImportError:  # Optional, pictures are embedded without resizing
+    Image = None
+
+# Global parameters
+DIR = path.dirname(__file__)
+CACHE_BYTES = 32 * 1024 * 1024
+
+
+def resolve(filename):
+    """
+    Get absolute filepath of picture <filename>. Relative paths are looked up in the working directory first, then in
+    the package directory (where the default picture 'pics/q.png' is).
+
+    :param filename: filepath of picture
+    :type filename: str
+
+    :return: absolute filepath
+    :rtype: str
+
+    :raises FileNotFoundError: if picture is not found
+    """
+    candidates = [filename] if path.isabs(filename) else [filename, path.join(DIR, "..", filename)]
+    for candidate in candidates:
+        if path.isfile(candidate):
+            return path.abspath(candidate)
+    raise FileNotFoundError("Picture not found at '{0}'.".format(filename))
+
+
+def _encode(filename, width, height):
+    """
+    Read picture <filename> and resize it to fit <width> x <height>.
+
+    :return: MIME type and encoded picture
+    :rtype: (str, bytes)
+    """
+    with open(filename, "rb") as f:
+        data = f.read()
+    if Image is None:
+        return guess_type(filename)[0] or "application/octet-stream", data
+
+    image = Image.open(BytesIO(data))
+    photo = image.format == "JPEG"
+    ratio = min(width / image.width, height / image.height)
+    size = (max(1, round(image.width * ratio)), max(1, round(image.height * ratio)))
+    if size != image.size:
+        image = image.convert("RGB" if photo else "RGBA").resize(size, Image.LANCZOS)
+    out = BytesIO()
+    if photo:
+        image.save(out, format="JPEG", quality=90)
+        return "image/jpeg", out.getvalue()
+    image.save(out, format="PNG", optimize=True)
+    return "image/png", out.getvalue()
+
+
+class PictureCache:
+    """
+    LRU cache of resized pictures as data URIs, keyed by (filepath, modification time, width, height). Holds at most
+    <max_bytes> of URIs; least recently used pictures are dropped first. Safe to share between threads.
+    """
+
+    def __init__(self, max_bytes=CACHE_BYTES):
+        """
+        Constructor method for PictureCache.
+
+        :param max_bytes: memory cap in bytes. Pictures larger than the cap are never cached.
+        :type max_bytes: int
+        """
+        self.max_bytes = int(max_bytes)
+        self.hits = 0  # type: int
+        self.misses = 0  # type: int
+        self._entries = OrderedDict()  # Key -> data URI, least recently used first
+        self._size = 0
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        """
+        :return: bytes held by cached URIs.
+        :rtype: int
+        """
+        return self._size
+
+    def data_uri(self, filename, width, height):
+        """
+        Get data URI of picture <filename> resized to fit <width> x <height>, decoding it on first use only.
+
+        :param filename: filepath of picture (see resolve(...))
+        :type filename: str
+        :param width: width of picture box in pixels
+        :type width: int
+        :param height: height of picture box in pixels
+        :type height: int
+
+        :return: data URI ("data:<mime>;base64,...")
+        :rtype: str
+        """
+        filename = resolve(filename)
+        key = (filename, path.getmtime(filename), int(width), int(height))
+        with self._lock:
+            uri = self._entries.get(key)
+            if uri is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return uri
+            self.misses += 1
+
+        # Decode outside the lock; concurrent misses of one picture give equal URIs
+        mime, data = _encode(filename, int(width), int(height))
+        uri = "data:{0};base64,{1}".format(mime, b64encode(data).decode("ascii"))
+        if len(uri) <= self.max_bytes:
+            with self._lock:
+                if key not in self._entries:
+                    self._entries[key] = uri
+                    self._size += len(uri)
+                while self._size > self.max_bytes:
+                    _, dropped = self._entries.popitem(last=False)
+                    self._size -= len(dropped)
+        return uri
+
+    def clear(self):
+        """
+        Drop all cached pictures.
+
+        :return:
+        :rtype: None
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+_cache = PictureCache()
+"""
+Process-wide picture cache used by data_uri(...).
+:type: PictureCache
+"""
+
+
+def data_uri(filename, width, height):
+    """
+    Get data URI of picture <filename> resized to fit <width> x <height> from the process-wide cache.
+
+    :param filename: filepath of picture (see resolve(...))
+    :type filename: str
+    :param width: width of picture box in pixels
+    :type width: int
+    :param height: height of picture box in pixels
+    :type height: int
+
+    :return: data URI
+    :rtype: str
+    """
+    return _cache.data_uri(filename, width, height)
+
+# END OF FILE ////////////////////////////////////////////////////////////
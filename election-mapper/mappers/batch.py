@@ -0,0 +1,145 @@
+"""
+This module holds a batch renderer that builds many US election maps from one results snapshot in parallel.
+
+Each map is described by a 'spec' dictionary (see render_spec(...)). Specs are fanned out over a pool of worker
+processes which all start from the same pre-parsed ElectionUS templates (see MapperUS._template). Maps are built in
+memory ('inmemory' mode with a MemoryStorage, never flushed), so workers never write or collide on mapfiles.
+
+Functions:
+    render_spec(spec, format="svg", scale=1.0, config=None): Build and render a single map spec.\n
+    render_many(specs, workers=None, format="svg", scale=1.0, config=None): Render many map specs in parallel.
+"""
+# --- Internal Imports --- #
+from mappers.electionUS import ElectionUS
+from mappers.mapperUS import CONFIG_FILE
+from mappers.config import USConfig, load_config
+from mappers.storage import MemoryStorage
+# --- External Imports --- #
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from itertools import chain, islice
+import os
+
+
+def render_spec(spec, format="svg", scale=1.0, config=None):
+    """
+    Build an ElectionUS map from <spec> and render it. All keys of <spec> are optional:
+
+    spec = {
+        "stco": "states" | "counties",\n
+        "candidates": [(<name>, <color>[, <picture>]), ...],\n
+        "colors": {<identifier>: <color>, ...},\n
+        "numbers": {<identifier>: (<number>, <color | None>), ...},\n
+        "votes": {<name>: <votes>, ...},\n
+        "title": <title> | (<title>, <color>),\n
+        "bar": <data>,\n
+        "format": "svg" | "png" | "jpg" | "webp",\n
+        "scale": <scale>
+    }\n
+    <data> : see ElectionUS.set_bar(...)\n
+    "format" and "scale" override the function's arguments for this spec only.
+
+    :param spec: map specification
+    :type spec: dict
+    :param format: "svg" | "png" | "jpg" | "webp"
+    :type format: str
+    :param scale: scale factor of output image
+    :type scale: float
+    :param config: configuration (or dictionary of overrides) passed to ElectionUS
+    :type config: None | dict | mappers.config.USConfig
+
+    :return: image bytes
+    :rtype: bytes
+    """
+    e = ElectionUS(spec.get("stco", "states"), inmemory=True, config=config, storage=MemoryStorage())
+    for candidate in spec.get("candidates", ()):
+        e.add_candidate(*candidate)
+    if "colors" in spec:
+        e.set_region_colors(spec["colors"])
+    if "numbers" in spec:
+        e.set_region_numbers(spec["numbers"])
+    for name, votes in spec.get("votes", {}).items():
+        e.set_candidate_votes(name, votes)
+    if "title" in spec:
+        title = spec["title"]
+        e.set_title(*title) if isinstance(title, tuple) else e.set_title(title)
+    if "bar" in spec:
+        e.set_bar(spec["bar"])
+    return e.export(spec.get("format", format), scale=spec.get("scale", scale))
+
+
+def render_many(specs, workers=None, format="svg", scale=1.0, config=None):
+    """
+    Render many map specs in parallel, yielding results as they complete (NOT in input order).
+
+    <specs> may be any iterable, including a generator; only a bounded number of specs are in flight at once.
+
+    :param specs: iterable of map specifications (see render_spec(...))
+    :type specs: collections.Iterable[dict]
+    :param workers: number of worker processes. If None, number of CPUs. If 1 or less, render in this process.
+    :type workers: None | int
+    :param format: "svg" | "png" | "jpg" | "webp"
+    :type format: str
+    :param scale: scale factor of output images
+    :type scale: float
+    :param config: configuration (or dictionary of overrides) passed to ElectionUS
+    :type config: None | dict | mappers.config.USConfig
+
+    :return: generator of (index of spec in <specs>, image bytes)
+    :rtype: collections.Iterator[(int, bytes)]
+    """
+    # Resolve configuration once, so all workers use the same (picklable) config object
+    if not isinstance(config, USConfig):
+        config = load_config(CONFIG_FILE).replace(**(config or {}))
+    workers = (os.cpu_count() or 1) if workers is None else int(workers)
+
+    # Single process: no pool overhead
+    if workers <= 1:
+        for k, spec in enumerate(specs):
+            yield k, render_spec(spec, format, scale, config)
+        return
+
+    # Parse templates of the map types in the batch (all specs of a sequence, the first ones of an iterator) before
+    # starting workers. Forked workers inherit them, others parse them once in _init_worker.
+    if isinstance(specs, Sequence):
+        types = specs
+    else:
+        specs = iter(specs)
+        types = list(islice(specs, workers * 2))
+        specs = chain(types, specs)
+    types = tuple(sorted({str(spec.get("stco", "states")) for spec in types}))
+    for stco in types:
+        ElectionUS._template(stco, config)
+    specs = enumerate(specs)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(config, types)) as pool:
+        pending = {}
+
+        def _submit(n):
+            for k, spec in islice(specs, n):
+                pending[pool.submit(render_spec, spec, format, scale, config)] = k
+
+        _submit(workers * 2)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+            _submit(len(done))
+
+
+def _init_worker(config, types):
+    """
+    Worker process initializer: make sure the election templates of the batch are parsed once per worker.
+
+    :param config: configuration of templates
+    :type config: mappers.config.USConfig
+    :param types: map types of templates, "states" | "counties"
+    :type types: tuple[str]
+
+    :return:
+    :rtype: None
+    """
+    for stco in types:
+        ElectionUS._template(stco, config)
+
+# END OF FILE ////////////////////////////////////////////////////////////
@@ -0,0 +1,134 @@
+"""
+This module holds the compact SVG output of mapper objects, for maps served to many clients (see
+MapperUS.export_compact(...)).
+
+A compact map is written from a copy of the map's tree, the resident tree and its writer are never touched:
+    * Region paths are simplified to a tolerance and written with relative, rounded coordinates (see
+      geometry.simplify_ring(...) and geometry.format_path(...)). Simplified paths are cached per template and
+      tolerance.\n
+    * Fill colors used by several elements are collapsed into CSS classes of a single <style> element, e.g. one class
+      per candidate color (see ElectionUS._style_names(...)).\n
+    * Whitespace-only text between elements is dropped.\n
+    * The document may be precompressed with gzip or brotli, to be served with a matching 'Content-Encoding'.
+
+Attribs:
+    ENCODINGS (tuple[str]) - Supported content encodings
+
+Functions:
+    simplify_path(d, tolerance, decimals=1): Simplify SVG path data.\n
+    collapse_fills(root, names, style): Move fill colors of elements into CSS classes.\n
+    strip_whitespace(root): Drop whitespace-only text between elements.\n
+    compress(data, encoding): Compress a document for a content encoding.
+"""
+# --- Internal Imports --- #
+from mappers.geometry import format_path, parse_path, simplify_ring
+# --- External Imports --- #
+from collections import Counter
+import gzip
+try:
+    import brotli
+except ImportError:  # Optional, only needed for "br" encoding
+    brotli = None
+
+# Global parameters
+ENCODINGS = ("gzip", "br")
+
+
+def simplify_path(d, tolerance, decimals=1):
+    """
+    Simplify SVG path data <d>: curves are flattened and every subpath is simplified as a closed ring (region outlines
+    are closed shapes). See geometry.parse_path(...).
+
+    :param d: path data
+    :type d: str
+    :param tolerance: largest distance of a dropped vertex to the simplified outline, in path units. If 0, vertices
+        are only rounded.
+    :type tolerance: float
+    :param decimals: decimal places of coordinates
+    :type decimals: int
+
+    :return: simplified path data
+    :rtype: str
+    """
+    rings, _ = parse_path(d)
+    return format_path([simplify_ring(ring, tolerance) for ring in rings], decimals)
+
+
+def collapse_fills(root, names, style):
+    """
+    Move "#rrggbb" fill attributes used by at least two elements under <root> into CSS classes, and write their rules
+    to <style>. Elements keep their other classes.
+
+    :param root: root of tree to edit
+    :type root: xml.etree.Element
+    :param names: color in RGB hex (0x??????) -> class name, for each color in use (see MapperUS._style_names(...))
+    :type names: function
+    :param style: <style> element to write rules to
+    :type style: xml.etree.Element
+
+    :return: class name by color
+    :rtype: dict[int, str]
+    """
+    fills = {}
+    for element in root.iter():
+        fill = element.attrib.get("fill")
+        if isinstance(fill, str) and len(fill) == 7 and fill[0] == "#":
+            try:
+                fills[element] = int(fill[1:], 16)
+            except ValueError:
+                pass
+    counts = Counter(fills.values())
+    classes = names(sorted(color for color, n in counts.items() if n > 1))
+    for element, color in fills.items():
+        name = classes.get(color)
+        if name is not None:
+            del element.attrib["fill"]
+            element.attrib["class"] = (element.attrib["class"] + " " + name) if "class" in element.attrib else name
+    style.text = "".join(".{0}{{fill:#{1:06x}}}".format(name, color) for color, name in classes.items())
+    return classes
+
+
+def strip_whitespace(root):
+    """
+    Drop whitespace-only text and tails of elements under <root> (indentation of the source file).
+
+    :param root: root of tree to edit
+    :type root: xml.etree.Element
+
+    :return:
+    :rtype: None
+    """
+    for element in root.iter():
+        if element.text is not None and len(element) and not element.text.strip():
+            element.text = None
+        if element.tail is not None and not element.tail.strip():
+            element.tail = None
+
+
+def compress(data, encoding):
+    """
+    Compress document <data> for HTTP content encoding <encoding>. Output is deterministic (no timestamp), so equal
+    maps give equal bytes (e.g. for ETags). Levels trade a few percent of size for speed, as maps change often.
+
+    :param data: document
+    :type data: bytes
+    :param encoding: "gzip" | "br". If None, <data> is returned as it is.
+    :type encoding: None | str
+
+    :return: compressed document
+    :rtype: bytes
+
+    :raises ValueError: if encoding is not supported
+    :raises RuntimeError: if encoding is "br" and brotli is not installed
+    """
+    if encoding is None:
+        return data
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=6, mtime=0)
+    if encoding == "br":
+        if brotli is None:
+            raise RuntimeError("Encoding 'br' requires 'brotli'. Install it with 'pip install brotli'.")
+        return brotli.compress(data, quality=9)
+    raise ValueError("Invalid encoding '{0}'. Choose from {1}.".format(encoding, ", ".join(ENCODINGS)))
+
+# END OF FILE ////////////////////////////////////////////////////////////
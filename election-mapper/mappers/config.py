@@ -0,0 +1,285 @@
+"""
+This module holds the configuration loader used by the US mapper and electoral classes.
+
+Configuration files (e.g. 'config/USconfig.conf') are Python-syntax files of NAME = value lines. They are executed
+once per process, validated, converted to their proper types and stored as immutable config objects. A file is only
+executed again if its modification time changes.
+
+Classes:
+    USConfig: Immutable, typed configuration of US mapper and electoral objects.
+
+Functions:
+    load_config(filename): Load (or get cached) USConfig from a configuration file.
+"""
+# --- External Imports --- #
+from os import path
+from threading import Lock
+
+
+def _number(value):
+    """
+    Convert <value> to int if it is integral, otherwise to float.
+
+    :param value: value to convert
+    :type value: int | float | str
+
+    :return: converted value
+    :rtype: int | float
+    """
+    if isinstance(value, str):
+        value = float(value)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError("{0!r} is not a number".format(value))
+    return int(value) if float(value).is_integer() else float(value)
+
+
+def _hexcolor(value):
+    """
+    Validate <value> as a RGB hex color string without '#' (e.g. "c5b6a0").
+
+    :param value: value to validate
+    :type value: str
+
+    :return: color string
+    :rtype: str
+    """
+    value = str(value)
+    if len(value) != 6:
+        raise ValueError("{0!r} is not a 6 digit RGB hex color".format(value))
+    int(value, 16)
+    return value
+
+
+def _position(value):
+    """
+    Validate <value> as a translate position string (e.g. "(855 563)").
+
+    :param value: value to validate
+    :type value: str
+
+    :return: position string
+    :rtype: str
+    """
+    value = str(value)
+    spl = value.strip("()").split()
+    if not (value.startswith("(") and value.endswith(")")) or len(spl) != 2:
+        raise ValueError("{0!r} is not a position like '(x y)'".format(value))
+    [float(x) for x in spl]
+    return value
+
+
+def _printsize(value):
+    """
+    Validate <value> as a print size: "normal" or a positive number of pixels.
+
+    :param value: value to validate
+    :type value: str | int
+
+    :return: "normal" or size in pixels
+    :rtype: str | int
+    """
+    if value == "normal":
+        return value
+    value = int(value)
+    if value <= 0:
+        raise ValueError("Print size cannot be 0 or less pixels.")
+    return value
+
+
+def _flag(value):
+    """
+    Validate <value> as a boolean flag (True | False, or 1 | 0).
+
+    :param value: value to validate
+    :type value: bool | int
+
+    :return: flag
+    :rtype: bool
+    """
+    if value not in (True, False) or not isinstance(value, (bool, int)):
+        raise ValueError("{0!r} is not True or False".format(value))
+    return bool(value)
+
+
+def _directory(value):
+    """
+    Validate <value> as an existing directory, or None.
+
+    :param value: value to validate
+    :type value: None | str
+
+    :return: directory
+    :rtype: None | str
+    """
+    if value is None:
+        return value
+    value = str(value)
+    if not path.isdir(value):
+        raise ValueError("{0!r} is not a directory".format(value))
+    return value
+
+
+# Configuration name -> converter/validator, in configuration file order.
+_US_FIELDS = (
+    ("DEF_PRINT_H", _printsize), ("DEF_PRINT_W", _printsize),
+    ("SWC_CANDS", int), ("MAX_CANDS", int),
+    ("DIR_SAVEAS", _directory), ("FILE_STATES", str), ("FILE_COUNTIES", str), ("CLASS_COLORS", _flag),
+    ("NAMESPACE", str), ("XLINK", str),
+    ("ID_STATES", str), ("ID_COUNTIES", str), ("ID_NUMBERS", str), ("ID_CAND_NM", str), ("ID_CAND_SQ", str),
+    ("ID_CAND_PX", str), ("ID_CAND_EV", str), ("ID_BAR", str), ("ID_SHAPES", str), ("ID_STYLE", str),
+    ("candname_font", str), ("candname_size", int), ("candname_lbs", str), ("candname_pos1", _position),
+    ("candname_pos2", _position), ("candname_yadd", int), ("counties_xadd", int),
+    ("candsq_pos1", _position), ("candsq_pos2", _position), ("candsq_yadd", int), ("candsq_h", int),
+    ("candsq_w", int), ("candsq_sw", _number), ("candsq_c", _hexcolor),
+    ("candpic_ypos", int), ("candpic_h", int), ("candpic_w", int), ("candpic_sw", _number), ("candpic_dx", int),
+    ("candpic_dy", int), ("candpic_def", str), ("candpic_embed", _flag),
+    ("candev_font", str), ("candev_size", int), ("candev_lbs", str), ("candev_d", int), ("candev_c", _hexcolor),
+    ("candev_sw", _number), ("candev_anch", str), ("candev_botb", int),
+    ("title_font", str), ("title_size", int), ("title_anch", str), ("title_lbs", str), ("dist_tte", int),
+    ("dist_etb", int), ("dist_btm", int),
+    ("bar_h", int), ("bar_w", int), ("bar_c", _hexcolor), ("trg_h", int), ("trg_w", int), ("trg_d", int),
+    ("bar_tfont", str), ("bar_tsize", int), ("bar_tanch", str), ("bar_tlbs", str), ("bar_tc", _hexcolor),
+)
+
+
+class USConfig:
+    """
+    Immutable, typed configuration of US mapper and electoral objects.
+
+    Values are read as attributes (e.g. cfg.bar_w). Use replace(...) to get a copy with some values overridden.
+    """
+
+    __slots__ = tuple(name for name, _ in _US_FIELDS)
+
+    def __init__(self, **values):
+        """
+        Constructor method for USConfig. Converts and validates all values.
+
+        :param values: all configuration values by name
+        :type values: dict
+
+        :raises ValueError: if a value is missing, unknown or invalid
+        """
+        unknown = set(values) - set(self.__slots__)
+        if unknown:
+            raise ValueError("Unknown configuration values: {0}".format(", ".join(sorted(unknown))))
+
+        for name, convert in _US_FIELDS:
+            if name not in values:
+                raise ValueError("Missing configuration value: {0}".format(name))
+            try:
+                object.__setattr__(self, name, convert(values[name]))
+            except (TypeError, ValueError) as v:
+                raise ValueError("Invalid configuration value {0}. MSG: {1}".format(name, v))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("USConfig objects are immutable. Use replace(...) instead.")
+
+    def __delattr__(self, name):
+        raise AttributeError("USConfig objects are immutable.")
+
+    def _values(self):
+        """
+        :return: tuple of all values in field order
+        :rtype: tuple
+        """
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        if not isinstance(other, USConfig):
+            return NotImplemented
+        return self._values() == other._values()
+
+    def __hash__(self):
+        return hash(self._values())
+
+    def __reduce__(self):
+        # Slots are set through object.__setattr__ in __init__; pickle/copy must go through it too
+        return _make_config, (self.asdict(),)
+
+    def __repr__(self):
+        return "USConfig({0})".format(", ".join("{0}={1!r}".format(n, getattr(self, n)) for n in self.__slots__))
+
+    def asdict(self):
+        """
+        :return: dictionary of all configuration values by name.
+        :rtype: dict
+        """
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def replace(self, **overrides):
+        """
+        Get a copy of this configuration with some values overridden. This object is left unchanged.
+
+        :param overrides: configuration values to override by name
+        :type overrides: dict
+
+        :return: new configuration object
+        :rtype: USConfig
+        """
+        if not overrides:
+            return self
+        values = self.asdict()
+        values.update(overrides)
+        return USConfig(**values)
+
+
+def _make_config(values):
+    """
+    Rebuild a USConfig from a dictionary of values (used when unpickling).
+
+    :param values: all configuration values by name
+    :type values: dict
+
+    :return: configuration object
+    :rtype: USConfig
+    """
+    return USConfig(**values)
+
+
+_cache = {}
+"""
+Loaded configurations keyed by absolute filepath.
+:type: dict[str, (float, USConfig)]
+"""
+
+_cache_lock = Lock()
+"""
+Lock guarding _cache while a configuration file is (re)loaded.
+:type: threading.Lock
+"""
+
+
+def load_config(filename):
+    """
+    Load configuration file <filename> as a USConfig. The file is executed once per process and cached; it is only
+    reloaded if its modification time has changed since it was last loaded.
+
+    :param filename: filepath of configuration file
+    :type filename: str
+
+    :return: configuration object
+    :rtype: USConfig
+    """
+    filename = path.abspath(filename)
+    mtime = path.getmtime(filename)
+    cached = _cache.get(filename)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    with _cache_lock:
+        cached = _cache.get(filename)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        # Execute configuration file in its own namespace and keep configuration values only
+        namespace = {}
+        with open(filename) as f:
+            exec(f.read(), namespace)
+        values = {k: v for k, v in namespace.items() if k in USConfig.__slots__}
+
+        cfg = USConfig(**values)
+        _cache[filename] = (mtime, cfg)
+        return cfg
+
+# END OF FILE ////////////////////////////////////////////////////////////
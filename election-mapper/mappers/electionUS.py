@@ -10,84 +10,136 @@ Attribs:
 Classes:
     ElectionUS (MapperUS, Electoral): Class of 'mapperUS' and 'Electoral' object specialized for US election maps only.
 
+Live results:
+    apply_update(delta) applies one result 'delta' (region colors, numbers, candidate votes, title, bars) with a single
+    write and returns a change-set of the elements it changed. stream(...) and astream(...) consume an (async) iterable
+    of deltas, coalesce the deltas received within a time window and yield a change-set or full SVG per window.
+
+Thread safety:
+    Same as MapperUS: every public method runs under the object's lock (see mapperUS.synchronized).
+
 Info:
     :Date: 2017-02-08
     :Authors: B\. Seid
 """
 # --- Internal Imports --- #
 from mappers.abstracts import Electoral
-from mappers.mapperUS import MapperUS
+from mappers.assets import data_uri
+from mappers.mapperUS import MapperUS, synchronized
 # --- External Imports --- #
 from os import path
+from time import monotonic
+import asyncio
+import re
 import xml.etree.ElementTree as ET
 
 # Global parameters
 DIR = path.dirname(__file__)
 CONFIG_FILE = path.join(DIR, "../config/USconfig.conf")
+_DELTA_KEYS = ("colors", "numbers", "votes", "title", "bar", "bars")  # See ElectionUS.apply_update
+_BAR_FIXED = ("blank-bar", "triup", "tridown")  # Ids of elements every bar starts with
 
 
 class ElectionUS(MapperUS, Electoral):
 
-    def __init__(self, stco="states"):
+    _bars = None
+    """
+    Ids of this map's bar groups, default (electoral vote) bar first. See add_bar(...).
+    :type: list[str]
+    """
+
+    def __init__(self, stco="states", inmemory=False, config=None, storage=None):
         """
         Constructor method for ElectionUS.
 
         :param stco: "states" | "counties"
         :type stco: str
+
+        :param inmemory: If True, keep changes in memory until flush()/save() is called.
+        :type inmemory: bool
+
+        :param config: configuration to use instead of .conf file, or dictionary of values overriding it.
+        :type config: None | dict | mappers.config.USConfig
+
+        :param storage: storage of mapfile (see 'storage.py'), or filepath to save mapfile to.
+            If None, a temporary file in configuration's DIR_SAVEAS directory.
+        :type storage: None | str | mappers.storage.Storage
         """
-        # Set up initial svg map
-        MapperUS.__init__(self, stco)
+        # Set up initial svg map. Election elements are part of the cached template (see _build_template).
+        MapperUS.__init__(self, stco, inmemory, config, storage)
+        self._bars = [self._cfg.ID_BAR]
 
-        # Modify svg map for 'election' mode
-        ET.register_namespace("", self._cfg["NAMESPACE"])
+    @classmethod
+    def _build_template(cls, stco, cfg):
+        """
+        Parse base map template and add all 'election' elements to it.
+        Private class method for ElectionUS objects.
 
-        # Add election elements to map
-        self._add_election_elements()
+        :param stco: "states" | "counties"
+        :type stco: str
+        :param cfg: configuration of template
+        :type cfg: mappers.config.USConfig
 
-    def _add_election_elements(self):
+        :return: parsed and election-decorated template
+        :rtype: xml.etree.ElementTree.ElementTree
+        """
+        tree = super()._build_template(stco, cfg)
+        cls._add_election_elements(tree.getroot(), cfg, stco)
+        return tree
+
+    @staticmethod
+    def _add_election_elements(root, cfg, stco="states"):
         """
         Private function to add all necessary 'election' elements to svg map.
 
+        :param root: root element of svg map
+        :type root: xml.etree.Element
+        :param cfg: configuration of svg map
+        :type cfg: mappers.config.USConfig
+        :param stco: "states" | "counties"
+        :type stco: str
+
         :return:
         :rtype: None
         """
+        mapwidth = int(root.attrib["width"])
+
         # Add to map height -------------------- #
         # <dy> = extra translation distance for current map elements
-        dy = int(self._cfg["dist_tte"]) + \
-            int(self._cfg["dist_etb"]) + \
-            int(self._cfg["dist_btm"]) + \
-            int(self._cfg["bar_h"]) + \
-            int(self._cfg["trg_h"])
-        self.mapheight = self.mapheight + \
-            dy + \
-            int(self._cfg["candpic_h"]) * 1.2 + \
-            int(self._cfg["candev_d"]) + \
-            int(self._cfg["candev_botb"])
+        dy = cfg.dist_tte + \
+            cfg.dist_etb + \
+            cfg.dist_btm + \
+            cfg.bar_h + \
+            cfg.trg_h
+        mapheight = int(int(root.attrib["height"]) +
+                        dy +
+                        cfg.candpic_h * 1.2 +
+                        cfg.candev_d +
+                        cfg.candev_botb)
+        root.attrib["height"] = str(mapheight)
 
         # Translate all current elements down by <dy> to create room -------------------- #
-        tree = ET.parse(self.map)
-        root = tree.getroot()
         for ele in root[1:]:  # exclude <title> element
             ele.attrib["transform"] = ElectionUS._update_translation("translate(0 {y})", y=dy)
 
         # Translate "CC" text to very bottom
-        cc = MapperUS._parse_tag(root, "cc")[0]
-        cc.attrib["transform"] = ElectionUS._update_translation("translate(0 {y}", y=self.mapheight-5)
-        cc.attrib["y"] = "0"
+        for cc in MapperUS._parse_tag(root, "cc")[:1]:  # (if exists)
+            cc.attrib["transform"] = ElectionUS._update_translation("translate(0 {y}", y=mapheight-5)
+            cc.attrib["y"] = "0"
 
         # Add blank title ;text; element -------------------- #
         titleattribs = {
             "id": "title",
-            "x": str(self.mapwidth / 2),
-            "y": str(self._cfg["dist_tte"]),
-            "font-family": self._cfg["title_font"],
-            "font-size": str(self._cfg["title_size"]),
-            "font-weight": self._cfg["title_lbs"],
-            "text-anchor": self._cfg["title_anch"],
+            "x": str(mapwidth / 2),
+            "y": str(cfg.dist_tte),
+            "font-family": cfg.title_font,
+            "font-size": str(cfg.title_size),
+            "font-weight": cfg.title_lbs,
+            "text-anchor": cfg.title_anch,
             "fill": "#000000"
         }
         ele_title_txt = ET.Element(
-            "{namespace}text".format(namespace="{" + self._cfg["NAMESPACE"] + "}"),
+            "{namespace}text".format(namespace="{" + cfg.NAMESPACE + "}"),
             attrib=titleattribs
         )
         ele_title_txt.text = " "
@@ -95,12 +147,12 @@ class ElectionUS(MapperUS, Electoral):
 
         # Add blank bar elements (blank bar + triangles) -------------------- #
         # General element
-        xpos_bar = (self.mapwidth - int(self._cfg["bar_w"])) / 2
-        ypos_bar = int(self._cfg["dist_tte"]) + int(self._cfg["dist_etb"])
+        xpos_bar = (mapwidth - cfg.bar_w) / 2
+        ypos_bar = cfg.dist_tte + cfg.dist_etb
         ele_bar = ET.Element(
-            "{namespace}g".format(namespace="{" + self._cfg["NAMESPACE"] + "}"),
+            "{namespace}g".format(namespace="{" + cfg.NAMESPACE + "}"),
             attrib={
-                "id": self._cfg["ID_BAR"],
+                "id": cfg.ID_BAR,
                 "transform": "translate({x} {y})".format(x=xpos_bar, y=ypos_bar)
             }
         )
@@ -111,20 +163,20 @@ class ElectionUS(MapperUS, Electoral):
             "rect",
             attrib={
                 "id": "blank-bar",
-                "height": str(self._cfg["bar_h"]),
-                "width": str(self._cfg["bar_w"]),
-                "fill": "#{c}".format(c=self._cfg["bar_c"]),
+                "height": str(cfg.bar_h),
+                "width": str(cfg.bar_w),
+                "fill": "#{c}".format(c=cfg.bar_c),
                 "x": "0",
                 "y": "0",
             }
         )
 
         # Blank triangles
-        bw = int(self._cfg["bar_w"])
-        bh = int(self._cfg["bar_h"])
-        td = int(self._cfg["trg_d"])
-        tw = int(self._cfg["trg_w"])
-        th = int(self._cfg["trg_h"])
+        bw = cfg.bar_w
+        bh = cfg.bar_h
+        td = cfg.trg_d
+        tw = cfg.trg_w
+        th = cfg.trg_h
         pointsup = "{ax},{ay} {bx},{by} {cx},{cy}".format(
             ax=bw/2,
             ay=td*-1,
@@ -147,7 +199,7 @@ class ElectionUS(MapperUS, Electoral):
             attrib={
                 "id": "triup",
                 "points": pointsup,
-                "fill": "#{c}".format(c=self._cfg["bar_c"])
+                "fill": "#{c}".format(c=cfg.bar_c)
             }
         )
         ET.SubElement(
@@ -156,64 +208,66 @@ class ElectionUS(MapperUS, Electoral):
             attrib={
                 "id": "tridown",
                 "points": pointsdown,
-                "fill": "#{c}".format(c=self._cfg["bar_c"])
+                "fill": "#{c}".format(c=cfg.bar_c)
             }
         )
 
         # Append all elements
         root.append(ele_bar)
 
+        # Counties' map needs extra x-pos translate for candidate names and squares
+        xadd = cfg.counties_xadd if stco == "counties" else 0
+
         # Add candidate names list element -------------------- #
+        namex, namey = cfg.candname_pos1.strip("()").split()
         ele_names = ET.Element(
-            "{namespace}g".format(namespace="{" + self._cfg["NAMESPACE"] + "}"),
+            "{namespace}g".format(namespace="{" + cfg.NAMESPACE + "}"),
             attrib={
-                "id": self._cfg["ID_CAND_NM"],
-                "transform": "translate{0}".format(self._cfg["candname_pos1"]),
-                "font-family": self._cfg["candname_font"],
-                "font-size": str(self._cfg["candname_size"]),
-                "font-weight": self._cfg["candname_lbs"]
+                "id": cfg.ID_CAND_NM,
+                "transform": "translate({x} {y})".format(x=int(namex) + xadd, y=namey),
+                "font-family": cfg.candname_font,
+                "font-size": str(cfg.candname_size),
+                "font-weight": cfg.candname_lbs
             }
         )
         root.append(ele_names)
 
         # Add candidate squares list element -------------------- #
+        sqx, sqy = cfg.candsq_pos1.strip("()").split()
         ele_sqrs = ET.Element(
-            "{namespace}g".format(namespace="{" + self._cfg["NAMESPACE"] + "}"),
+            "{namespace}g".format(namespace="{" + cfg.NAMESPACE + "}"),
             attrib={
-                "id": self._cfg["ID_CAND_SQ"],
-                "transform": "translate{0}".format(self._cfg["candsq_pos1"])
+                "id": cfg.ID_CAND_SQ,
+                "transform": "translate({x} {y})".format(x=int(sqx) + xadd, y=sqy)
             }
         )
         root.append(ele_sqrs)
 
         # Add candidate pictures list element -------------------- #
         ele_pics = ET.Element(
-            "{namespace}g".format(namespace="{" + self._cfg["NAMESPACE"] + "}"),
+            "{namespace}g".format(namespace="{" + cfg.NAMESPACE + "}"),
             attrib={
-                "id": self._cfg["ID_CAND_PX"],
-                "transform": "translate(0 {y})".format(y=self._cfg["candpic_ypos"])
+                "id": cfg.ID_CAND_PX,
+                "transform": "translate(0 {y})".format(y=cfg.candpic_ypos)
             }
         )
         root.append(ele_pics)
 
         # Add candidate votes list element -------------------- #
         ele_votes = ET.Element(
-            "{namespace}g".format(namespace="{" + self._cfg["NAMESPACE"] + "}"),
+            "{namespace}g".format(namespace="{" + cfg.NAMESPACE + "}"),
             attrib={
-                "id": self._cfg["ID_CAND_EV"],
+                "id": cfg.ID_CAND_EV,
                 "transform": "translate(0 {y})".format(
-                    y=int(self._cfg["candpic_ypos"]) + int(self._cfg["candev_d"]) + int(self._cfg["candpic_h"])
+                    y=cfg.candpic_ypos + cfg.candev_d + cfg.candpic_h
                 ),
-                "font-family": self._cfg["candev_font"],
-                "font-size": str(self._cfg["candev_size"]),
-                "font-weight": self._cfg["candev_lbs"]
+                "font-family": cfg.candev_font,
+                "font-size": str(cfg.candev_size),
+                "font-weight": cfg.candev_lbs
             }
         )
         root.append(ele_votes)
 
-        # Write to file
-        tree.write(self.map)
-
     @staticmethod
     def _update_translation(cur_translate, x=None, y=None):
         """
@@ -241,22 +295,20 @@ class ElectionUS(MapperUS, Electoral):
         y = int(spl[-1].rstrip(")")) if y is None else y
         return "translate({x} {y})".format(x=x, y=y)
 
+    @synchronized
     def remove_candidate(self, name):
-        tree = ET.parse(self.map)
-        root = tree.getroot()
-
         # ********** REMOVE SINGLE CANDIDATE FIRST ********** #
-        namelist = MapperUS._parse_tag(root, self._cfg["ID_CAND_NM"])[0]
-        squarelist = MapperUS._parse_tag(root, self._cfg["ID_CAND_SQ"])[0]
-        piclist = MapperUS._parse_tag(root, self._cfg["ID_CAND_PX"])[0]
-        votelist = MapperUS._parse_tag(root, self._cfg["ID_CAND_EV"])[0]
+        namelist = self._find(self._cfg.ID_CAND_NM)
+        squarelist = self._find(self._cfg.ID_CAND_SQ)
+        piclist = self._find(self._cfg.ID_CAND_PX)
+        votelist = self._find(self._cfg.ID_CAND_EV)
 
         # Check list lengths
         n = len(namelist)
         if len(squarelist) != n | len(piclist) != n | len(votelist) != n:
             raise Exception("Candidate lists do not match.")
 
-        # Go through each list and find first instance of <name> xml element to remove
+        # Go through each list and find indexed <name> xml element to remove
         def _remove_from_list(_name, _list):
             """
             Remove a candidate from given Element list.
@@ -265,33 +317,23 @@ class ElectionUS(MapperUS, Electoral):
             :param _name: name of candidate
             :type _name: (str)
             :param _list: list of candidate attributes
-            :type _list: list[xml.etree.Element]
+            :type _list: xml.etree.Element
             :return:
             :rtype: None
             """
-            for _x in _list:
-                if _x.attrib["id"].lower() == str(_name).lower():
-                    _list.remove(_x)
-                    return
+            _x = self._members[_list.attrib["id"]].get(str(_name).lower())
+            if _x is not None:
+                _list.remove(_x)
 
         _remove_from_list(name, namelist)
         _remove_from_list(name, squarelist)
         _remove_from_list(name+"-pic", piclist)
         _remove_from_list(name+"-border", piclist)
         _remove_from_list(name+"-votes", votelist)
-
-        # Write to file
-        tree.write(self.map)
+        self._reindex(self._cfg.ID_CAND_NM, self._cfg.ID_CAND_SQ, self._cfg.ID_CAND_PX, self._cfg.ID_CAND_EV)
+        self._rename_classes()
 
         # ********** UPDATE REST OF CANDIDATES ********** #
-        # Reload parse
-        tree = ET.parse(self.map)
-        root = tree.getroot()
-        namelist = MapperUS._parse_tag(root, self._cfg["ID_CAND_NM"])[0]
-        squarelist = MapperUS._parse_tag(root, self._cfg["ID_CAND_SQ"])[0]
-        piclist = MapperUS._parse_tag(root, self._cfg["ID_CAND_PX"])[0]
-        votelist = MapperUS._parse_tag(root, self._cfg["ID_CAND_EV"])[0]
-
         # Check list lengths
         n = len(namelist)
         if len(squarelist) != n | int(len(piclist)/2) != n | len(votelist) != n:  # Check all lists before proceeding
@@ -300,16 +342,16 @@ class ElectionUS(MapperUS, Electoral):
         # Update candidate positions
         k = 0
         for c in namelist:
-            c.attrib["y"] = str(k * int(self._cfg["candname_yadd"]))
+            c.attrib["y"] = str(k * self._cfg.candname_yadd)
             k += 1
 
         k = 0
         for c in squarelist:
-            c.attrib["y"] = str(k * int(self._cfg["candsq_yadd"]))
+            c.attrib["y"] = str(k * self._cfg.candsq_yadd)
             k += 1
 
         j, k = 0, 0  # Picture list has twice as many elements (pictures + borders)
-        dxt = int(self._cfg["candpic_w"]) + int(self._cfg["candpic_dx"])
+        dxt = self._cfg.candpic_w + self._cfg.candpic_dx
         for c in piclist:
             c.attrib["x"] = str(k * dxt)
             j += 1
@@ -322,8 +364,8 @@ class ElectionUS(MapperUS, Electoral):
             k += 1
 
         # Update picture list and vote list translations (required every time)
-        pw = int(self._cfg["candpic_w"])
-        pdx = int(self._cfg["candpic_dx"])
+        pw = self._cfg.candpic_w
+        pdx = self._cfg.candpic_dx
         lw = pw * n + pdx * (n - 1)
         t1 = int((self.mapwidth / 2) - (lw / 2))  # picture list x-translate
         t2 = int(t1 + pw / 2)  # vote list x-translate
@@ -332,22 +374,20 @@ class ElectionUS(MapperUS, Electoral):
         votelist.attrib["transform"] = ElectionUS._update_translation(votelist.attrib["transform"], x=t2)
 
         # Update name list and square list translations, if # of candidates goes back below switch case
-        if n < self._cfg["SWC_CANDS"]:
+        if n < self._cfg.SWC_CANDS:
             pass  # TODO : Add routine for updating translation of names/squares going below switch case
 
-        # Write and exit function
-        tree.write(self.map)
+        # Write and exit function (remaining candidates moved, re-serialize all of them)
+        self._modified(*namelist.iter(), *squarelist.iter(), *piclist.iter(), *votelist.iter())
         return
 
+    @synchronized
     def get_candidate_list(self):
-        tree = ET.parse(self.map)
-        root = tree.getroot()
-
         # Check list lengths
-        namelist = MapperUS._parse_tag(root, self._cfg["ID_CAND_NM"])[0]
-        squarelist = MapperUS._parse_tag(root, self._cfg["ID_CAND_SQ"])[0]
-        piclist = MapperUS._parse_tag(root, self._cfg["ID_CAND_PX"])[0]
-        votelist = MapperUS._parse_tag(root, self._cfg["ID_CAND_EV"])[0]
+        namelist = self._find(self._cfg.ID_CAND_NM)
+        squarelist = self._find(self._cfg.ID_CAND_SQ)
+        piclist = self._find(self._cfg.ID_CAND_PX)
+        votelist = self._find(self._cfg.ID_CAND_EV)
         n = len(namelist)
         if len(squarelist) != n | len(piclist) != n | len(votelist) != n:
             raise Exception("Candidate lists do not match.")
@@ -359,84 +399,70 @@ class ElectionUS(MapperUS, Electoral):
             ret_list.append(k)
         return ret_list
 
+    @synchronized
     def get_candidate_regions(self, name):
-        tree = ET.parse(self.map)
-        root = tree.getroot()
-
-        # Get candidate's color
-        squarelist = MapperUS._parse_tag(root, self._cfg["ID_CAND_SQ"])[0]
-        ck_color = None
-        for sq in squarelist:
-            if sq.attrib["id"].lower() == name.lower():
-                ck_color = int(sq.attrib["fill"].strip("#"), 16)
-                break
-
-        # Check region list, append IDENTIFIERS only (not Elements)
-        cand_regions = []
-        for region in self.get_region_list():
-            if self.get_region_color(region) == ck_color:
-                cand_regions.append(region)
-
-        # Return list
-        return cand_regions
+        # Get candidate's color (or use <name> as color if integer)
+        if isinstance(name, int):
+            ck_color = name
+        else:
+            sq = self._members[self._cfg.ID_CAND_SQ].get(name.lower())
+            if sq is None:
+                return []
+            ck_color = int(sq.attrib["fill"].strip("#"), 16)
 
-    def set_title(self, title=None, color=None):
-        tree = ET.parse(self.map)
-        root = tree.getroot()
+        # Look up regions by color in reverse color index, IDENTIFIERS only (not Elements)
+        return self.get_color_regions(ck_color)
 
+    @synchronized
+    def set_title(self, title=None, color=None):
         # Set values
-        element = MapperUS._parse_tag(root, "title")[0]
+        element = self._find("title")
         element.text = str(title)
         if color is not None:
             element.attrib["fill"] = "#{:06x}".format(int(color, 16) if isinstance(color, str) else color)
 
         # Write to file and return
-        tree.write(self.map)
+        self._modified(element)
         return
 
+    @synchronized
     def set_candidate_votes(self, name, votes, color=None):
-        tree = ET.parse(self.map)
-        root = tree.getroot()
-
         # Check list and set values
-        votelist = MapperUS._parse_tag(root, self._cfg["ID_CAND_EV"])[0]
-        for element in votelist:
-            if element.attrib["id"].lower() == str(name.lower() + "-votes"):
-                element.text = str(votes)
-                if color is not None:
-                    element.attrib["fill"] = "#{:06x}".format(int(color, 16) if isinstance(color, str) else color)
-
-        # Write to file and return
-        tree.write(self.map)
+        element = self._members[self._cfg.ID_CAND_EV].get(str(name.lower() + "-votes"))
+        if element is not None:
+            element.text = str(votes)
+            if color is not None:
+                element.attrib["fill"] = "#{:06x}".format(int(color, 16) if isinstance(color, str) else color)
+
+            # Write to file
+            self._modified(element)
         return
 
+    @synchronized
     def add_candidate(self, name, color, picture=None):
         # Check picture. If none, go to default.
         if picture is None:
-            picture = self._cfg["candpic_def"]
-        else:
-            pass  # Do nothing. Relative paths work at this time.
+            picture = self._cfg.candpic_def
+        if self._cfg.candpic_embed:
+            # Resized and encoded once per process, shared by all maps (see 'assets.py')
+            picture = data_uri(picture, self._cfg.candpic_w, self._cfg.candpic_h)
 
         # ----- NOTES: -----
         # If number of candidates is 5 or less, stay with 'position 1' (near Florida, default selection)
         # If number of candidates exceeds 5, switch to 'position 2' (far right side of map)
-        tree = ET.parse(self.map)
-        root = tree.getroot()
-
         # Get candidate-names list, candidate-squares list
-        namelist = MapperUS._parse_tag(root, self._cfg["ID_CAND_NM"])[0]
-        squarelist = MapperUS._parse_tag(root, self._cfg["ID_CAND_SQ"])[0]
-        piclist = MapperUS._parse_tag(root, self._cfg["ID_CAND_PX"])[0]
-        votelist = MapperUS._parse_tag(root, self._cfg["ID_CAND_EV"])[0]
+        namelist = self._find(self._cfg.ID_CAND_NM)
+        squarelist = self._find(self._cfg.ID_CAND_SQ)
+        piclist = self._find(self._cfg.ID_CAND_PX)
+        votelist = self._find(self._cfg.ID_CAND_EV)
 
         # Check list to see if name is already added
-        for c in namelist:
-            if c.attrib["id"].lower() == str(name.lower()):
-                raise ValueError("Name already exists in candidate list.")
+        if str(name.lower()) in self._members[self._cfg.ID_CAND_NM]:
+            raise ValueError("Name already exists in candidate list.")
 
         # *** Check current amount of candidates ***
-        swccase = self._cfg["SWC_CANDS"]
-        maxcase = self._cfg["MAX_CANDS"]
+        swccase = self._cfg.SWC_CANDS
+        maxcase = self._cfg.MAX_CANDS
         n = len(namelist)
         if len(squarelist) != n | len(piclist) != n | len(votelist) != n:  # Check all lists before proceeding
             raise Exception("Candidate lists do not match.")
@@ -447,9 +473,9 @@ class ElectionUS(MapperUS, Electoral):
         # Before switch case -------------------------------------------------- #
         elif (n < swccase) & (n >= 0):
             # Get coordinates
-            ynplus = int(self._cfg["candname_yadd"])
-            ysplus = int(self._cfg["candsq_yadd"])
-            xpplus = int(self._cfg["candpic_w"]) + int(self._cfg["candpic_dx"])
+            ynplus = self._cfg.candname_yadd
+            ysplus = self._cfg.candsq_yadd
+            xpplus = self._cfg.candpic_w + self._cfg.candpic_dx
 
             # Add candidate-name subelement to svg xml
             nameattributes = {
@@ -466,11 +492,11 @@ class ElectionUS(MapperUS, Electoral):
                 "id": str(name).lower(),
                 "x": "0",
                 "y": str(ysplus * n),
-                "height": str(self._cfg["candsq_h"]),
-                "width": str(self._cfg["candsq_w"]),
+                "height": str(self._cfg.candsq_h),
+                "width": str(self._cfg.candsq_w),
                 "fill": "#{:06x}".format(int(color, 16) if isinstance(color, str) else color),
-                "stroke": "#{c}".format(c=self._cfg["candsq_c"]),
-                "stroke-width": str(self._cfg["candsq_sw"])
+                "stroke": "#{c}".format(c=self._cfg.candsq_c),
+                "stroke-width": str(self._cfg.candsq_sw)
             }
             ET.SubElement(squarelist, "rect", attrib=sqattributes)
 
@@ -479,19 +505,19 @@ class ElectionUS(MapperUS, Electoral):
                 "id": str(name).lower() + "-pic",
                 "x": str(xpplus * n),
                 "y": "0",
-                "height": str(self._cfg["candpic_h"]),
-                "width": str(self._cfg["candpic_w"]),
-                "{ns}href".format(ns="{" + self._cfg["XLINK"] + "}"): picture
+                "height": str(self._cfg.candpic_h),
+                "width": str(self._cfg.candpic_w),
+                "{ns}href".format(ns="{" + self._cfg.XLINK + "}"): picture
             }
             borderattributes = {
                 "id": str(name).lower() + "-border",
                 "x": str(xpplus * n),
                 "y": "0",
-                "height": str(self._cfg["candpic_h"]),
-                "width": str(self._cfg["candpic_w"]),
+                "height": str(self._cfg.candpic_h),
+                "width": str(self._cfg.candpic_w),
                 "fill": "none",
                 "stroke": "#{:06x}".format(int(color, 16) if isinstance(color, str) else color),
-                "stroke-width": str(self._cfg["candpic_sw"])
+                "stroke-width": str(self._cfg.candpic_sw)
             }
             ET.SubElement(piclist, "image", attrib=picattributes)
             ET.SubElement(piclist, "rect", attrib=borderattributes)
@@ -502,17 +528,17 @@ class ElectionUS(MapperUS, Electoral):
                 "x": str(xpplus * n),
                 "y": "0",
                 "fill": "#{:06x}".format(int(color, 16) if isinstance(color, str) else color),
-                "stroke": "#{c}".format(c=self._cfg["candev_c"]),
-                "stroke-width": str(self._cfg["candev_sw"]),
-                "text-anchor": self._cfg["candev_anch"]
+                "stroke": "#{c}".format(c=self._cfg.candev_c),
+                "stroke-width": str(self._cfg.candev_sw),
+                "text-anchor": self._cfg.candev_anch
             }
             v = ET.SubElement(votelist, "text", attrib=voteattributes)
             v.text = "0"  # Start with zero votes
 
             # Change picture list and vote list x-position translations based on new candidate list
             n += 1
-            pw = int(self._cfg["candpic_w"])
-            pdx = int(self._cfg["candpic_dx"])
+            pw = self._cfg.candpic_w
+            pdx = self._cfg.candpic_dx
             lw = pw*n + pdx*(n-1)
             t1 = int((self.mapwidth / 2) - (lw / 2))  # picture list x-translate
             t2 = int(t1 + pw/2)  # vote list x-translate
@@ -520,8 +546,10 @@ class ElectionUS(MapperUS, Electoral):
             piclist.attrib["transform"] = ElectionUS._update_translation(piclist.attrib["transform"], x=t1)
             votelist.attrib["transform"] = ElectionUS._update_translation(votelist.attrib["transform"], x=t2)
 
-            # Write to file and exit
-            tree.write(self.map)
+            # Index new elements, write to file and exit
+            self._reindex(self._cfg.ID_CAND_NM, self._cfg.ID_CAND_SQ, self._cfg.ID_CAND_PX, self._cfg.ID_CAND_EV)
+            self._rename_classes()  # Regions of the candidate's color now carry its class
+            self._modified(namelist, squarelist, piclist, votelist)
             return
         # At or above switch case -------------------------------------------------- #
         elif n >= swccase:
@@ -533,42 +561,57 @@ class ElectionUS(MapperUS, Electoral):
         else:
             raise Exception("Invalid candidate lists.")
 
+    @synchronized
     def set_candidate_color(self, name, color):
-        tree = ET.parse(self.map)
-        root = tree.getroot()
-
         # Prepare color string
-        ckstr = "#{:06x}".format(int(color, 16) if isinstance(color, str) else color)
-
-        # Get lists that have associated colors
-        squarelist = MapperUS._parse_tag(root, self._cfg["ID_CAND_SQ"])[0]
-        piclist = MapperUS._parse_tag(root, self._cfg["ID_CAND_PX"])[0]
-        votelist = MapperUS._parse_tag(root, self._cfg["ID_CAND_EV"])[0]
-        barlist = MapperUS._parse_tag(root, self._cfg["ID_BAR"])[0]
-
-        # Check lists and update lists
-        for element in squarelist:
-            if element.attrib["id"].lower() == name.lower():
-                element.attrib["fill"] = ckstr
-                break
-        for element in piclist:
-            if element.attrib["id"].lower() == str(name.lower() + "-border"):
-                element.attrib["stroke"] = ckstr
-                break
-        for element in votelist:
-            if element.attrib["id"].lower() == str(name.lower() + "-votes"):
-                element.attrib["fill"] = ckstr
-                break
-        for element in barlist:
-            if element.attrib["id"].lower() == str(name.lower() + "-bar"):
-                element.attrib["fill"] = ckstr
-                break
-
-        # Write to file and return
-        tree.write(self.map)
+        color = int(color, 16) if isinstance(color, str) else color
+        ckstr = "#{:06x}".format(color)
+        square = self._members[self._cfg.ID_CAND_SQ].get(str(name.lower()))
+        old = int(square.attrib["fill"].lstrip("#"), 16) if square is not None else None
+
+        # Look up elements that have associated colors and update them
+        changed = []
+        targets = [(self._cfg.ID_CAND_SQ, "", "fill"),
+                   (self._cfg.ID_CAND_PX, "-border", "stroke"),
+                   (self._cfg.ID_CAND_EV, "-votes", "fill")]
+        for gid, suffix, attrib in targets + [(bar, "-bar", "fill") for bar in self._bars]:
+            element = self._members[gid].get(str(name.lower() + suffix))
+            if element is not None:
+                element.attrib[attrib] = ckstr
+                changed.append(element)
+
+        # Write to file once and return
+        with self._batch():
+            if self._style is not None and old is not None:
+                # Class coloring mode (CLASS_COLORS): the candidate's regions follow its color, changing the
+                # stylesheet only (see MapperUS.recolor_regions(...))
+                self.recolor_regions(old, color)
+            if changed:
+                self._modified(*changed)
         return
 
-    def set_bar(self, data):
+    def _style_names(self, colors):
+        """
+        Name the CSS classes of fill colors in compact exports after candidates: a candidate's color becomes class
+        "cand-<id>" (e.g. "cand-clinton"), shared by its regions, square, votes and bar segments. Other colors are
+        named by MapperUS. Private method for ElectionUS objects, called holding the object's lock.
+
+        :param colors: colors in RGB hex (0x??????), ascending
+        :type colors: list[int]
+
+        :return: class name by color
+        :rtype: dict[int, str]
+        """
+        names = super()._style_names(colors)
+        candidates = {}
+        for identifier, square in self._members.get(self._cfg.ID_CAND_SQ, {}).items():
+            color = int(square.attrib["fill"].lstrip("#"), 16)
+            candidates.setdefault(color, "cand-" + re.sub(r"[^a-z0-9_-]", "-", identifier.lower()))
+        names.update((color, candidates[color]) for color in colors if color in candidates)
+        return names
+
+    @synchronized
+    def set_bar(self, data, bar=None):
         """
         Update vote bar with <data> given. See below for exact data format.\n
 
@@ -588,126 +631,396 @@ class ElectionUS(MapperUS, Electoral):
             \t-1 = Reset to default.\n
             \tIf none, leave color unchanged.
 
+        With more than 2 candidates, candidates are ordered by votes (most first, ties in order of <data>).
+        The bar is updated in place: only elements whose values changed are rewritten.
+
         :param data: User values needed to set up the election 'bar'.
         :type data: dict
+        :param bar: id of bar to update (see add_bar(...)). If None, the default (electoral vote) bar.
+        :type bar: None | str
 
         :return:
         :rtype: None
         """
-        # TODO : Maybe do multiple bars?
-        # Verify data ------------------------- #
+        bar = self._cfg.ID_BAR if bar is None else str(bar)
+        if bar not in self._bars:
+            raise ValueError("Unknown bar '{0}'. Add it with add_bar(...) first.".format(bar))
+
+        # Verify data and create candidate list ------------------------- #
         try:
-            for n in range(0, len(data)-2):
-                    str(data[n][0])  # <nameN>
-                    int(data[n][1])  # <colorN>
-                    int(data[n][2])  # <votesN>
-            int(data["total"])  # <total>
-            if data["tri"] is not None:
-                int(data["tri"])  # <colorT>
+            cand_list = [_CandidateInfo(str(data[n][0]), int(data[n][1]), int(data[n][2]), n)
+                         for n in range(0, len(data)-2)]
+            total = int(data["total"])  # <total>
+            tri = None if data["tri"] is None else int(data["tri"])  # <colorT>
         except ValueError as v:
             raise ValueError("Invalid data given. MSG: {0}".format(v))
 
         # Verify total votes >= votes1 + votes2 + ... + votesN ------------------------- #
-        summation = 0
-        for n in range(0, len(data)-2):
-            summation += int(data[n][2])
-        if summation > data["total"]:
+        if sum(candidate.votes for candidate in cand_list) > total:
             raise ValueError("All candidate votes are greater than total votes given in <data>.")
 
-        # TODO : Verify integers as colors ------------------------- #
-
-        # Purge all non-default bar elements and reset default elements ------------------------- #
-        tree = ET.parse(self.map)
-        root = tree.getroot()
-        barlist = MapperUS._parse_tag(root, self._cfg["ID_BAR"])[0]
-
-        for element in barlist.findall(".//"):  # Prevent 'skipping' over iteration
-            # Purge non-default elements
-            if element.attrib["id"] not in ["blank-bar", "triup", "tridown"]:
-                barlist.remove(element)
-            # Reset triangles if needed
-            if (element.attrib["id"] in ["triup", "tridown"]) & (data["tri"] is not None):
-                if int(data["tri"]) < 0:
-                    element.attrib["fill"] = "#{c}".format(c=self._cfg["bar_c"])
-        tree.write(self.map)
-
-        # Create candidate list ------------------------- #
-        cand_list = []
-        for n in range(0, len(data)-2):
-            cand_list.append(
-                # <nameN>, <colorN>, <votesN>
-                _CandidateInfo(name=data[n][0], color=data[n][1], votes=data[n][2])
-            )
         if len(cand_list) > 2:  # Do not sort if list is 2 or less.
             cand_list = ElectionUS._sort_by_votes(ls=cand_list, reverse=True)
 
-        # Calculate variables ------------------------- #
-        total = data["total"]
-        rect_tot_h = int(self._cfg["bar_h"])  # Height for all bars
-        rect_tot_w = int(self._cfg["bar_w"])  # Width of total bar
+        # Update bar in a single pass, re-using existing elements ------------------------- #
+        barlist = self._find(bar)
+        existing = dict(self._members[bar])
+        children = [child for child in barlist if child.attrib.get("id") in _BAR_FIXED]
+        changed = []
+
+        # Triangles: reset or set color if needed
+        if tri is not None:
+            fill = "#{c}".format(c=self._cfg.bar_c) if tri < 0 else "#{:06x}".format(tri)
+            for tid in ("triup", "tridown"):
+                self._update_element(existing[tid], "polygon", {"fill": fill}, changed=changed)
+
+        rect_tot_h = self._cfg.bar_h  # Height for all bars
+        rect_tot_w = self._cfg.bar_w  # Width of total bar
+        y_num_pos = int(int(rect_tot_h / 2) + int(0.8 * self._cfg.bar_tsize) / 2)  # 0.8 = shift text up slightly
+        cur_x = 0  # current x-position of next bar
         for candidate in cand_list:
-            votesN = candidate.votes
-            if votesN < 0:
-                votesN = 0
-            percent = votesN / total
+            percent = max(candidate.votes, 0) / total
             candidate.bar = int(rect_tot_w * percent)
-
-        # Add new elements ------------------------- #
-        # Add candidate colored bars
-        tree = ET.parse(self.map)
-        root = tree.getroot()
-        barlist = MapperUS._parse_tag(root, self._cfg["ID_BAR"])[0]
-
-        cur_x = 0  # current x-position to add new bar
-        for candidate in cand_list:
-            # Add new colored bar element
-            ET.SubElement(
-                barlist,
-                "rect",
-                attrib={
-                    "id": candidate.name.lower() + "-bar",
-                    "height": str(rect_tot_h),
-                    "width": str(candidate.bar),
-                    "fill": "#{:06x}".format(candidate.color),
-                    "x": str(cur_x),
-                    "y": "0",
-                }
-            )
-            # Add new number element on top of bar element
-            x_num_pos = int(cur_x + candidate.bar/2)  # Put center of rectangle
-            y_num_pos = int(int(rect_tot_h / 2) + int(0.8 * self._cfg["bar_tsize"]) / 2)  # 0.8 = shift text up slightly
-            e = ET.SubElement(
-                barlist,
-                "text",
-                attrib={
-                    "id": candidate.name.lower() + "-numb",
-                    "x": str(x_num_pos),
-                    "y": str(y_num_pos),
-                    "font-family": self._cfg["bar_tfont"],
-                    "font-size": str(self._cfg["bar_tsize"]),
-                    "text-anchor": self._cfg["bar_tanch"],
-                    "font-weight": self._cfg["bar_tlbs"],
-                    "fill": "#{c}".format(c=self._cfg["bar_tc"])
-                }
-            )
-            e.text = str(candidate.votes)
+            name = candidate.name.lower()
+
+            # Colored bar element
+            children.append(self._update_element(existing.pop(name + "-bar", None), "rect", {
+                "id": name + "-bar",
+                "height": str(rect_tot_h),
+                "width": str(candidate.bar),
+                "fill": "#{:06x}".format(candidate.color),
+                "x": str(cur_x),
+                "y": "0",
+            }, changed=changed))
+
+            # Number element on top of bar element, centered
+            children.append(self._update_element(existing.pop(name + "-numb", None), "text", {
+                "id": name + "-numb",
+                "x": str(int(cur_x + candidate.bar/2)),
+                "y": str(y_num_pos),
+                "font-family": self._cfg.bar_tfont,
+                "font-size": str(self._cfg.bar_tsize),
+                "text-anchor": self._cfg.bar_tanch,
+                "font-weight": self._cfg.bar_tlbs,
+                "fill": "#{c}".format(c=self._cfg.bar_tc)
+            }, str(candidate.votes), changed))
             cur_x += candidate.bar
         # TODO : Maybe add names too?
 
-        # If triangle color should be changed...
-        if (data["tri"] is not None) and (int(data["tri"]) >= 0):
-            triangles = barlist.findall(".//{ns}polygon".format(ns="{" + self._cfg["NAMESPACE"] + "}"))
-            for ele in triangles:
-                ele.attrib["fill"] = "#{:06x}".format(data["tri"])
+        # Candidates added, removed or reordered: replace children and re-index
+        if list(barlist) != children:
+            barlist[:] = children
+            self._reindex(bar)
+            changed.append(barlist)
 
         # Write and return ------------------------- #
-        tree.write(self.map)
+        if changed:
+            self._modified(*changed)
         return
 
+    @staticmethod
+    def _update_element(element, tag, attrib, text=None, changed=None):
+        """
+        Set <attrib> and <text> of <element>, or create a new element if None.
+        Private method for ElectionUS objects.
+
+        :param element: element to update, or None
+        :type element: None | xml.etree.Element
+        :param tag: tag of element to create
+        :type tag: str
+        :param attrib: attributes to set
+        :type attrib: dict[str, str]
+        :param text: text to set. If None, text is left unchanged.
+        :type text: None | str
+        :param changed: list to append the element to if it was created or changed
+        :type changed: None | list[xml.etree.Element]
+
+        :return: updated or new element
+        :rtype: xml.etree.Element
+        """
+        if element is None:
+            element = ET.Element(tag, attrib=attrib)
+            element.text = text
+        elif any(element.attrib.get(k) != v for k, v in attrib.items()) or (text is not None and element.text != text):
+            element.attrib.update(attrib)
+            if text is not None:
+                element.text = text
+        else:
+            return element
+        if changed is not None:
+            changed.append(element)
+        return element
+
+    @synchronized
+    def add_bar(self, identifier, y=None):
+        """
+        Add another bar (e.g. popular vote or seats) drawn like the default bar. Set it with set_bar(data, bar=...).
+
+        :param identifier: id of new bar
+        :type identifier: str
+        :param y: y-position of new bar. If None, below the last bar.
+        :type y: None | int | float
+
+        :return:
+        :rtype: None
+        """
+        identifier = str(identifier)
+        if identifier in self._ids:
+            raise ValueError("Id '{0}' already exists in map.".format(identifier))
+
+        # Place below last bar (leaving room for triangles), or at <y>
+        cfg = self._cfg
+        root = self._tree.getroot()
+        last = self._find(self._bars[-1])
+        x, last_y = last.attrib["transform"].strip()[len("translate("):].rstrip(")").split()
+        if y is None:
+            y = float(last_y) + cfg.bar_h + 2 * (cfg.trg_d + cfg.trg_h)
+        group = ET.Element(last.tag, attrib={"id": identifier, "transform": "translate({x} {y:g})".format(x=x, y=y)})
+
+        # Copy blank bar and triangles of default bar, in default color
+        for child in self._find(cfg.ID_BAR):
+            if child.attrib.get("id") in _BAR_FIXED:
+                attrib = dict(child.attrib)
+                attrib["fill"] = "#{c}".format(c=cfg.bar_c)
+                ET.SubElement(group, child.tag, attrib=attrib)
+
+        root.insert(list(root).index(last) + 1, group)
+        self._ids[identifier] = group
+        self._bars.append(identifier)
+        self._reindex(identifier)
+        self._modified(group)
+
+    @synchronized
+    def remove_bar(self, identifier):
+        """
+        Remove a bar added with add_bar(...). The default bar cannot be removed.
+
+        :param identifier: id of bar
+        :type identifier: str
+
+        :return:
+        :rtype: None
+        """
+        identifier = str(identifier)
+        if identifier not in self._bars[1:]:
+            raise ValueError("Unknown bar '{0}'.".format(identifier))
+        root = self._tree.getroot()
+        root.remove(self._ids.pop(identifier))
+        self._members.pop(identifier, None)
+        self._bars.remove(identifier)
+        self._modified(root)
+
+    @synchronized
+    def get_bar_list(self):
+        """
+        :return: ids of this map's bars, default bar first.
+        :rtype: list[str]
+        """
+        return list(self._bars)
+
+    @synchronized
+    def apply_update(self, delta):
+        """
+        Apply a result delta to the map, writing the mapfile once. All keys of <delta> are optional:
+
+        delta = {
+            "colors": {<identifier>: <color>, ...},\n
+            "numbers": {<identifier>: (<number>, <color | None>), ...},\n
+            "votes": {<name>: <votes>, ...},\n
+            "title": <title> | (<title>, <color>),\n
+            "bar": <data>,\n
+            "bars": {<bar id>: <data>, ...}
+        }\n
+        <data> : see set_bar(...). "bar" sets the default bar, "bars" any bars (see add_bar(...)).
+
+        The returned change-set maps "<group id>/<element id>" (e.g. "states/TX", "numbers/TX", "cand-ev/trump-votes")
+        or "<element id>" (e.g. "title") to {<attribute>: <new value | None if removed>, "#text": <new text>} of
+        the changed elements only. In class coloring mode, regions change "class" and the stylesheet is keyed by its
+        id ("region-colors" by default). A changed bar is replaced as a whole: {"#svg": <markup of bar group>} keyed by bar id.
+
+        :param delta: result delta
+        :type delta: dict
+
+        :return: change-set (empty if nothing changed)
+        :rtype: dict[str, dict[str, None | str]]
+        """
+        unknown = set(delta) - set(_DELTA_KEYS)
+        if unknown:
+            raise ValueError("Invalid delta keys: {0}".format(", ".join(sorted(map(str, unknown)))))
+
+        cfg = self._cfg
+        regions = self._regions()
+        rgid = cfg.ID_STATES if cfg.ID_STATES in self._members else cfg.ID_COUNTIES
+        numbers = self._members.get(cfg.ID_NUMBERS, {})
+        votes = self._members[cfg.ID_CAND_EV]
+        bars = dict(delta.get("bars", {}))
+        if "bar" in delta:
+            bars[cfg.ID_BAR] = delta["bar"]
+
+        # Snapshot elements the delta may change (region state projected into the tree first)
+        self._project()
+        watched = [(rgid + "/" + i, regions[i]) for i in delta.get("colors", ()) if i in regions]
+        watched += [(cfg.ID_NUMBERS + "/" + i, numbers[i]) for i in delta.get("numbers", ()) if i in numbers]
+        watched += [(cfg.ID_CAND_EV + "/" + k, votes[k])
+                    for k in (str(name).lower() + "-votes" for name in delta.get("votes", ())) if k in votes]
+        if "title" in delta:
+            watched.append(("title", self._find("title")))
+        if self._style is not None:
+            watched.append((cfg.ID_STYLE, self._style))  # New colors add rules (class coloring mode)
+        before = [(key, element, dict(element.attrib), element.text) for key, element in watched]
+        markups = {bar: self._writer.fragment(self._find(bar)) for bar in bars if bar in self._bars}
+
+        # Apply delta, written once
+        with self._batch():
+            if "colors" in delta:
+                self.set_region_colors(delta["colors"])
+            if "numbers" in delta:
+                self.set_region_numbers(delta["numbers"])
+            for name, v in delta.get("votes", {}).items():
+                self.set_candidate_votes(name, v)
+            if "title" in delta:
+                title = delta["title"]
+                self.set_title(*title) if isinstance(title, tuple) else self.set_title(title)
+            for bar, data in bars.items():
+                self.set_bar(data, bar=bar)
+            self._project()
+
+        # Compare snapshots
+        changes = {}
+        for key, element, attrib, text in before:
+            diff = {k: v for k, v in element.attrib.items() if attrib.get(k) != v}
+            diff.update({k: None for k in attrib if k not in element.attrib})
+            if element.text != text:
+                diff["#text"] = element.text
+            if diff:
+                changes.setdefault(key, {}).update(diff)
+        for bar, before in markups.items():
+            markup = self._writer.fragment(self._find(bar))
+            if markup != before:
+                changes[bar] = {"#svg": markup.decode("utf-8")}
+        return changes
+
+    def stream(self, updates, window=0.0, diffs=True):
+        """
+        Apply a stream of result deltas (see apply_update(...)), coalescing all deltas received within <window> seconds
+        of the first one into a single update.
+
+        A window is closed when a delta arrives after its deadline (or <updates> is exhausted), as a blocking iterable
+        cannot be timed out. Use astream(...) to close windows on time.
+
+        :param updates: iterable of result deltas
+        :type updates: collections.Iterable[dict]
+        :param window: coalescing window in seconds. If 0, every delta is applied on its own.
+        :type window: float
+        :param diffs: If True, yield change-sets. If False, yield full SVG documents.
+        :type diffs: bool
+
+        :return: generator of change-sets | SVG documents, one per window that changed the map
+        :rtype: collections.Iterator[dict | bytes]
+        """
+        pending, deadline = None, None
+        for delta in updates:
+            if pending is not None and monotonic() >= deadline:
+                result = self._apply_pending(pending, diffs)
+                pending = None
+                if result:
+                    yield result
+            if pending is None:
+                pending, deadline = {}, monotonic() + window
+            _merge_delta(pending, delta)
+            if window <= 0:
+                result = self._apply_pending(pending, diffs)
+                pending = None
+                if result:
+                    yield result
+
+        if pending is not None:
+            result = self._apply_pending(pending, diffs)
+            if result:
+                yield result
+
+    async def astream(self, updates, window=0.0, diffs=True):
+        """
+        Asynchronous version of stream(...). Windows are closed on time, whether or not more deltas arrive.
+
+        :param updates: async iterable (or iterable) of result deltas
+        :type updates: collections.AsyncIterable[dict] | collections.Iterable[dict]
+        :param window: coalescing window in seconds. If 0, every delta is applied on its own.
+        :type window: float
+        :param diffs: If True, yield change-sets. If False, yield full SVG documents.
+        :type diffs: bool
+
+        :return: async generator of change-sets | SVG documents, one per window that changed the map
+        :rtype: collections.AsyncIterator[dict | bytes]
+        """
+        if not hasattr(updates, "__aiter__"):
+            updates = _aiter(updates)
+        updates = updates.__aiter__()
+        loop = asyncio.get_running_loop()
+        pending, deadline, receiving = None, None, None
+
+        try:
+            while True:
+                # Keep one pending receive across timeouts (cancelling it could lose a delta)
+                if receiving is None:
+                    receiving = asyncio.ensure_future(updates.__anext__())
+                timeout = None if pending is None else max(0.0, deadline - loop.time())
+                done, _ = await asyncio.wait((receiving,), timeout=timeout)
+
+                if done:
+                    try:
+                        delta = receiving.result()
+                    except StopAsyncIteration:
+                        break
+                    receiving = None
+                    if pending is None:
+                        pending, deadline = {}, loop.time() + window
+                    _merge_delta(pending, delta)
+                    if loop.time() < deadline:
+                        continue
+
+                # Window closed
+                result = self._apply_pending(pending, diffs)
+                pending = None
+                if result:
+                    yield result
+
+            if pending is not None:
+                result = self._apply_pending(pending, diffs)
+                if result:
+                    yield result
+        finally:
+            # Consumer closed early (aclose() or break): drop the pending receive
+            if receiving is not None and not receiving.done():
+                receiving.cancel()
+                try:
+                    await receiving
+                except asyncio.CancelledError:
+                    pass
+
+    def _apply_pending(self, delta, diffs):
+        """
+        Apply coalesced <delta> for stream(...) and astream(...).
+        Private method for ElectionUS objects.
+
+        :param delta: coalesced result delta
+        :type delta: dict
+        :param diffs: If True, return change-set. If False, full SVG document.
+        :type diffs: bool
+
+        :return: change-set | SVG document, or None if nothing changed
+        :rtype: None | dict | bytes
+        """
+        with self._lock:
+            changes = self.apply_update(delta)
+            if not changes:
+                return None
+            return changes if diffs else self.to_svg()
+
     @staticmethod
     def _sort_by_votes(ls, reverse=False):
         """
-        Sorts a list of candidates w/ infos by votes.
+        Sorts a list of candidates w/ infos by votes. Candidates with equal votes keep their order in <ls>.
 
         :param ls: unsorted list of candidates
         :type ls: list[_CandidateInfo]
@@ -718,43 +1031,57 @@ class ElectionUS(MapperUS, Electoral):
         :return: sorted list of candidates
         :rtype: list[_CandidateInfo]
         """
-        # Selection sort
-        n = len(ls)
-        # a[j ... n-1]
-        for j in range(0, n-1):
-            iMin = j
-            for i in range(j+1, n):
-                if int(ls[i]) < int(ls[iMin]):
-                    iMin = i
-            if iMin != j:
-                # swap(a,b)
-                tmp = ls[j]
-                ls[j] = ls[iMin]
-                ls[iMin] = tmp
-
-        # Return list
-        if reverse:
-            return ls[::-1]
+        sign = -1 if reverse else 1
+        return sorted(ls, key=lambda c: (sign * c.votes, c.index))
+
+
+def _merge_delta(pending, delta):
+    """
+    Merge result <delta> into <pending> delta. Mappings are merged by key, other values replaced (later wins).
+
+    :param pending: coalesced delta, updated in place
+    :type pending: dict
+    :param delta: newer delta
+    :type delta: dict
+
+    :return:
+    :rtype: None
+    """
+    for key, value in delta.items():
+        if key not in _DELTA_KEYS:
+            raise ValueError("Invalid delta key '{0}'.".format(key))
+        if key in ("colors", "numbers", "votes", "bars"):
+            pending.setdefault(key, {}).update(value)
         else:
-            return ls
+            pending[key] = value
+
+
+async def _aiter(iterable):
+    """
+    Wrap a regular <iterable> as an async iterator.
+
+    :param iterable: iterable to wrap
+    :type iterable: collections.Iterable
+
+    :return: async iterator of items of <iterable>
+    :rtype: collections.AsyncIterator
+    """
+    for item in iterable:
+        yield item
 
 
 class _CandidateInfo:
     """
     Private utility class for ElectionUS class.
     """
-    name = ""  # Name of candidate
-    color = 0  # Color of candidate
-    votes = 0  # Votes of candidate
-    bar = 0    # Length of bar of candidate (set later)
-
-    def __init__(self, name, color, votes):
-        self.name = name  # type: str
-        self.color = color  # type: int
-        self.votes = votes  # type: int
-        self.bar = 0  # type: int
-
-    def __int__(self):
-        return self.votes
+
+    __slots__ = ("name", "color", "votes", "index", "bar")
+
+    def __init__(self, name, color, votes, index=0):
+        self.name = name  # type: str  # Name of candidate
+        self.color = color  # type: int  # Color of candidate
+        self.votes = votes  # type: int  # Votes of candidate
+        self.index = index  # type: int  # Position of candidate in input (tie-breaker)
+        self.bar = 0  # type: int  # Length of bar of candidate (set later)
 
 # END OF FILE ////////////////////////////////////////////////////////////
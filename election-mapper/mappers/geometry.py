@@ -0,0 +1,797 @@
+"""
+This module holds the geometry helpers of mapper objects: SVG path data and transforms, bounding boxes of map elements
+in map (root) coordinates, region outlines for hit-testing and label placement, and a grid index of boxes.
+
+Bounding boxes of paths include the control points of curves, so they may be slightly larger than the drawn outline
+but never smaller. Boxes are (xmin, ymin, xmax, ymax) tuples.
+
+Outlines parse path data once into NumPy arrays of vertices (curves flattened, transforms applied) and require 'numpy'.
+Without it, MapGeometry still holds bounding boxes and their index (see path_points(...)), but no outlines.
+
+Attribs:
+    IDENTITY (tuple[float]) - Identity transform\n
+    STEPS (int) - Number of segments of a flattened curve\n
+    LABEL_LINES (int) - Number of horizontal lines searched for the label point of a region covered by others
+
+Classes:
+    Outline: Outline of a path as rings of vertices.\n
+    GridIndex: Uniform grid index of bounding boxes.\n
+    MapGeometry: Outlines, bounding boxes and index of a map's regions.
+
+Functions:
+    parse_transform(text): Parse an SVG transform attribute to a matrix.\n
+    multiply(m, n): Compose two transforms.\n
+    path_points(d): Get end and control points of SVG path data.\n
+    parse_path(d, steps=STEPS): Parse SVG path data to arrays of vertices.\n
+    transform_points(points, matrix): Apply a transform to an array of points.\n
+    simplify_ring(ring, tolerance): Simplify a ring of vertices (Douglas-Peucker).\n
+    format_path(rings, decimals=1): Write rings of vertices as compact SVG path data.\n
+    points_bbox(points, matrix=IDENTITY): Get bounding box of transformed points.\n
+    text_bbox(x, y, chars, font_size, matrix=IDENTITY): Estimate bounding box of a text.\n
+    ancestors(root): Get parent of every element of a tree.\n
+    ctm(element, parents): Get transform from element to root coordinates.\n
+    union(boxes): Get bounding box of boxes.\n
+    intersects(a, b): Check if two boxes overlap.
+"""
+# --- External Imports --- #
+from math import ceil, cos, floor, radians, sin, sqrt, tan
+import re
+try:
+    import numpy as np
+except ImportError:  # Optional, outlines (hit-testing, label placement) require it
+    np = None
+
+# Global parameters
+STEPS = 8
+LABEL_LINES = 32
+
+IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+"""
+Identity transform (a, b, c, d, e, f): x' = a*x + c*y + e, y' = b*x + d*y + f.
+:type: tuple[float]
+"""
+
+_NUMBER = r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?"
+_PATH_TOKEN = re.compile(r"([MmLlHhVvCcSsQqTtAaZz])|(" + _NUMBER + ")")
+_TRANSFORM = re.compile(r"(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)")
+_PATH_RUN = re.compile(r"([LlHhVvCcSsQqTtAa])((?:[^MmLlHhVvCcSsQqTtAaZz]|\1)*)|([MmZz])([^MmLlHhVvCcSsQqTtAaZz]*)")
+_ARITY = {"M": 2, "L": 2, "H": 1, "V": 1, "C": 6, "S": 4, "Q": 4, "T": 2, "A": 7, "Z": 0}
+
+
+def multiply(m, n):
+    """
+    Compose transforms <m> and <n> (apply <n> first, then <m>).
+
+    :param m: outer transform
+    :type m: tuple[float]
+    :param n: inner transform
+    :type n: tuple[float]
+
+    :return: composed transform
+    :rtype: tuple[float]
+    """
+    a, b, c, d, e, f = m
+    a2, b2, c2, d2, e2, f2 = n
+    return (a * a2 + c * b2, b * a2 + d * b2, a * c2 + c * d2, b * c2 + d * d2,
+            a * e2 + c * f2 + e, b * e2 + d * f2 + f)
+
+
+def parse_transform(text):
+    """
+    Parse SVG transform attribute <text> (e.g. "scale(0.80) translate(-73 161) rotate(-12)").
+
+    :param text: transform attribute
+    :type text: None | str
+
+    :return: transform matrix
+    :rtype: tuple[float]
+
+    :raises ValueError: if a transform function has the wrong number of arguments
+    """
+    matrix = IDENTITY
+    for name, args in _TRANSFORM.findall(text or ""):
+        v = [float(x) for x in re.findall(_NUMBER, args)]
+        try:
+            if name == "matrix":
+                m = tuple(v) if len(v) == 6 else None
+            elif name == "translate":
+                m = (1.0, 0.0, 0.0, 1.0, v[0], v[1] if len(v) > 1 else 0.0)
+            elif name == "scale":
+                m = (v[0], 0.0, 0.0, v[1] if len(v) > 1 else v[0], 0.0, 0.0)
+            elif name == "rotate":
+                r = radians(v[0])
+                m = (cos(r), sin(r), -sin(r), cos(r), 0.0, 0.0)
+                if len(v) == 3:  # Rotate about (cx, cy)
+                    m = multiply(multiply((1.0, 0.0, 0.0, 1.0, v[1], v[2]), m), (1.0, 0.0, 0.0, 1.0, -v[1], -v[2]))
+            elif name == "skewX":
+                m = (1.0, 0.0, tan(radians(v[0])), 1.0, 0.0, 0.0)
+            else:
+                m = (1.0, tan(radians(v[0])), 0.0, 1.0, 0.0, 0.0)
+        except IndexError:
+            m = None
+        if m is None:
+            raise ValueError("Invalid transform '{0}({1})'.".format(name, args))
+        matrix = multiply(matrix, m)
+    return matrix
+
+
+def path_points(d):
+    """
+    Get end points and control points of SVG path data <d> in absolute coordinates. Arcs contribute their end points
+    extended by their radii, which covers the arc.
+
+    :param d: path data
+    :type d: str
+
+    :return: list of (x, y) points
+    :rtype: list[(float, float)]
+    """
+    points = []
+    x = y = sx = sy = 0.0
+    cx = cy = 0.0  # Last control point, reflected by S | T
+    prev = None
+    cmd = None
+    args = []
+    tokens = _PATH_TOKEN.findall(d)
+    tokens.append(("M", ""))  # Sentinel flushing the last command
+    for command, number in tokens:
+        if number:
+            args.append(float(number))
+            continue
+        if cmd is not None:
+            upper = cmd.upper()
+            rel = cmd != upper
+            arity = _ARITY[upper]
+            if arity == 0:
+                x, y = sx, sy
+                prev = upper
+            for k in range(0, len(args) - arity + 1, arity) if arity else ():
+                a = args[k:k + arity]
+                ox, oy = (x, y) if rel else (0.0, 0.0)
+                if upper == "H":
+                    x = a[0] + (x if rel else 0.0)
+                elif upper == "V":
+                    y = a[0] + (y if rel else 0.0)
+                elif upper == "A":
+                    rx, ry = abs(a[0]), abs(a[1])
+                    points.extend(((x - rx, y - ry), (x + rx, y + ry)))
+                    x, y = a[5] + ox, a[6] + oy
+                    points.extend(((x - rx, y - ry), (x + rx, y + ry)))
+                else:
+                    if upper in "ST":
+                        # Implicit first control point: reflection of the previous one (or the current point)
+                        if (upper == "S" and prev in ("C", "S")) or (upper == "T" and prev in ("Q", "T")):
+                            cx, cy = 2 * x - cx, 2 * y - cy
+                        else:
+                            cx, cy = x, y
+                        points.append((cx, cy))
+                    for j in range(0, arity - 2, 2):  # Explicit control points
+                        cx, cy = a[j] + ox, a[j + 1] + oy
+                        points.append((cx, cy))
+                    x, y = a[-2] + ox, a[-1] + oy
+                points.append((x, y))
+                prev = upper
+                if upper == "M":
+                    sx, sy = x, y
+                    upper = "L"  # Further pairs are line-tos
+        cmd = command
+        args = []
+    return points
+
+
+def parse_path(d, steps=STEPS):
+    """
+    Parse SVG path data <d> into rings (subpaths) of absolute vertices. Curves are flattened into <steps> segments
+    each, arcs are replaced by their chord. Consecutive segments of one command (e.g. "l1,2l3,4") are parsed as one
+    array, so long outlines cost a few NumPy operations rather than a Python loop over their points.
+
+    :param d: path data
+    :type d: str
+    :param steps: number of segments of a flattened curve
+    :type steps: int
+
+    :return: rings as arrays of shape (n, 2), control points of curves and arcs as an array of shape (m, 2)
+        (see path_points(...))
+    :rtype: (list[numpy.ndarray], numpy.ndarray)
+
+    :raises RuntimeError: if numpy is not installed
+    """
+    if np is None:
+        raise RuntimeError("Outlines require 'numpy'. Install it with 'pip install numpy'.")
+
+    # Runs of one command (e.g. "l1,2l3,4" = "l1,2 3,4"), except move-tos (starting rings) and close-paths
+    runs = [(a or c, b or d) for a, b, c, d in _PATH_RUN.findall(d)]
+
+    rings, ring, controls = [], None, []
+    x = y = sx = sy = 0.0
+    prev, last = None, None  # Previous command and its last control point, reflected by S | T
+    t = np.arange(1, steps + 1) / steps
+    for command, args in runs:
+        upper = command.upper()
+        rel = command != upper
+        if upper == "Z":
+            if ring is not None:
+                rings.append(ring)
+                ring = None
+            x, y, prev = sx, sy, upper
+            continue
+        arity = _ARITY[upper]
+        v = np.array(re.findall(_NUMBER, args), dtype=float)
+        n = len(v) // arity
+        if n == 0:
+            continue
+        v = v[:n * arity].reshape(n, arity)
+
+        if upper == "M":
+            if ring is not None:
+                rings.append(ring)
+            pts = np.cumsum(v, axis=0) + (x, y) if rel else v  # Further pairs are line-tos
+            ring = [pts]
+            sx, sy = pts[0]
+        else:
+            if ring is None:  # Drawing on after a close-path
+                ring = [np.array([[x, y]])]
+            if upper == "L":
+                pts = np.cumsum(v, axis=0) + (x, y) if rel else v
+            elif upper in "HV":
+                k = 0 if upper == "H" else 1
+                pts = np.empty((n, 2))
+                pts[:, k] = np.cumsum(v[:, 0]) + (x, y)[k] if rel else v[:, 0]
+                pts[:, 1 - k] = (x, y)[1 - k]
+            else:
+                pts = np.cumsum(v[:, -2:], axis=0) + (x, y) if rel else v[:, -2:]
+                starts = np.vstack(((x, y), pts[:-1]))
+                if upper == "A":
+                    radii = np.abs(v[:, 0:2])
+                    controls += [starts - radii, starts + radii, pts - radii, pts + radii]
+                else:
+                    explicit = v[:, :-2].reshape(n, (arity - 2) // 2, 2)
+                    if rel:
+                        explicit = explicit + starts[:, None, :]
+                    if upper in "ST":
+                        # Implicit first control point: reflection of the previous one (or the current point)
+                        first = starts.copy()
+                        for k in range(n):
+                            before = prev if k == 0 else upper
+                            if (upper == "S" and before in ("C", "S")) or (upper == "T" and before in ("Q", "T")):
+                                first[k] = 2 * starts[k] - last
+                            last = explicit[k, -1] if upper == "S" else first[k]
+                        explicit = np.concatenate((first[:, None, :], explicit), axis=1)
+                    controls.append(explicit.reshape(-1, 2))
+                    last = explicit[-1, -1]
+                    pts = _bezier(starts, explicit, pts, t)
+            ring.append(pts)
+        x, y = float(pts[-1, 0]), float(pts[-1, 1])
+        prev = upper
+    if ring is not None:
+        rings.append(ring)
+    return ([np.concatenate(r) for r in rings],
+            np.concatenate(controls) if controls else np.empty((0, 2)))
+
+
+def _bezier(starts, controls, ends, t):
+    """
+    Flatten Bezier curves from <starts> to <ends> with <controls> (shape (n, order - 1, 2)) at parameters <t>.
+
+    :return: points of curves, in order, without start points
+    :rtype: numpy.ndarray
+    """
+    p = np.concatenate((starts[:, None, :], controls, ends[:, None, :]), axis=1)
+    order = p.shape[1] - 1
+    i = np.arange(order + 1)
+    coefficients = np.array([1, 1]) if order == 1 else np.array([1, 2, 1]) if order == 2 else np.array([1, 3, 3, 1])
+    weights = coefficients * (1 - t[:, None]) ** (order - i) * t[:, None] ** i  # Bernstein polynomials
+    return np.einsum("si,nij->nsj", weights, p).reshape(-1, 2)
+
+
+def transform_points(points, matrix):
+    """
+    Apply transform <matrix> to array of points <points> (shape (n, 2)).
+
+    :return: transformed points
+    :rtype: numpy.ndarray
+    """
+    a, b, c, d, e, f = matrix
+    return points @ np.array([[a, b], [c, d]]) + (e, f)
+
+
+def simplify_ring(ring, tolerance):
+    """
+    Simplify ring <ring> (closed, shape (n, 2)) with the Douglas-Peucker algorithm: drop vertices closer than
+    <tolerance> to the simplified outline. The ring keeps at least 3 vertices, so no region disappears.
+
+    :param ring: vertices of ring
+    :type ring: numpy.ndarray
+    :param tolerance: largest distance of a dropped vertex to the simplified outline
+    :type tolerance: float
+
+    :return: kept vertices, in order
+    :rtype: numpy.ndarray
+    """
+    n = len(ring)
+    if n <= 3 or tolerance <= 0:
+        return ring
+    points = np.vstack((ring, ring[0:1]))  # Closed polyline, split at the vertex farthest from the start first
+    xs, ys = points[:, 0].tolist(), points[:, 1].tolist()
+    keep = [False] * (n + 1)
+    keep[0] = keep[n] = True
+    far = 1 + int(np.argmax(np.hypot(*(ring[1:] - ring[0]).T)))
+    keep[far] = True
+    kept = 2
+    stack = [(0, far), (far, n)]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        ax, ay = xs[i], ys[i]
+        dx, dy = xs[j] - ax, ys[j] - ay
+        length = sqrt(dx * dx + dy * dy)
+        if j - i < 32:
+            # Short spans: plain Python beats NumPy's per-call overhead
+            if length:
+                dist = [abs(dx * (ys[m] - ay) - dy * (xs[m] - ax)) / length for m in range(i + 1, j)]
+            else:
+                dist = [sqrt((xs[m] - ax) ** 2 + (ys[m] - ay) ** 2) for m in range(i + 1, j)]
+            k = max(range(len(dist)), key=dist.__getitem__)
+        else:
+            rel = points[i + 1:j] - (ax, ay)
+            dist = np.abs(dx * rel[:, 1] - dy * rel[:, 0]) / length if length else np.hypot(rel[:, 0], rel[:, 1])
+            k = int(dist.argmax())
+        if dist[k] > tolerance or kept < 3:
+            keep[i + 1 + k] = True
+            kept += 1
+            stack += [(i, i + 1 + k), (i + 1 + k, j)]
+    return ring[np.array(keep[:n])]
+
+
+def format_path(rings, decimals=1):
+    """
+    Write closed rings of vertices as compact SVG path data: an absolute move-to per ring, then relative line-tos
+    rounded to <decimals> places (computed from rounded vertices, so rounding errors do not add up).
+
+    :param rings: rings of vertices, as arrays of shape (n, 2)
+    :type rings: list[numpy.ndarray]
+    :param decimals: decimal places of coordinates
+    :type decimals: int
+
+    :return: path data (e.g. "M836 447.2l-.3-1 1.1-.8z")
+    :rtype: str
+    """
+    scale = 10 ** decimals
+    out = []
+    for ring in rings:
+        q = np.round(np.asarray(ring) * scale).astype(np.int64)
+        q = q[np.concatenate(([True], np.any(q[1:] != q[:-1], axis=1)))]  # Drop repeated vertices
+        if len(q) > 1 and (q[-1] == q[0]).all():
+            q = q[:-1]
+        if len(q) < 2:
+            continue
+        steps = np.diff(q, axis=0)
+        out.append("M" + _join(q[0].tolist(), decimals) + "l" + _join(steps.ravel().tolist(), decimals) + "z")
+    return "".join(out)
+
+
+def _join(values, decimals):
+    """
+    Write integers <values> scaled by 10^-<decimals> as SVG numbers, separated by a minus sign or a space.
+
+    :rtype: str
+    """
+    out = []
+    for v in values:
+        if decimals:
+            whole, frac = divmod(abs(v), 10 ** decimals)
+            text = str(frac).rjust(decimals, "0").rstrip("0")
+            text = (str(whole) if whole or not text else "") + ("." + text if text else "")
+        else:
+            text = str(abs(v))
+        if v < 0:
+            out.append("-" + text)
+        else:
+            out.append(" " + text if out else text)
+    return "".join(out)
+
+
+def points_bbox(points, matrix=IDENTITY):
+    """
+    Get bounding box of <points> transformed by <matrix>.
+
+    :param points: list of (x, y) points
+    :type points: list[(float, float)]
+    :param matrix: transform
+    :type matrix: tuple[float]
+
+    :return: bounding box, None if no points
+    :rtype: None | (float, float, float, float)
+    """
+    if not points:
+        return None
+    a, b, c, d, e, f = matrix
+    if b == 0 and c == 0:
+        xs = [a * x + e for x, _ in points]
+        ys = [d * y + f for _, y in points]
+    else:
+        xs = [a * x + c * y + e for x, y in points]
+        ys = [b * x + d * y + f for x, y in points]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def text_bbox(x, y, chars, font_size, matrix=IDENTITY):
+    """
+    Estimate bounding box of a text of <chars> characters at (<x>, <y>), for any text anchor.
+
+    :param x: x of text anchor
+    :type x: float
+    :param y: y of text baseline
+    :type y: float
+    :param chars: number of characters
+    :type chars: int
+    :param font_size: font size
+    :type font_size: float
+    :param matrix: transform to apply
+    :type matrix: tuple[float]
+
+    :return: bounding box
+    :rtype: (float, float, float, float)
+    """
+    w = chars * font_size * 0.7  # Wider than most glyphs; anchor may be start, middle or end
+    return points_bbox([(x - w, y - font_size), (x + w, y + font_size * 0.3)], matrix)
+
+
+def ancestors(root):
+    """
+    :return: parent of every element of the tree under <root> (root excluded).
+    :rtype: dict[xml.etree.Element, xml.etree.Element]
+    """
+    return {child: parent for parent in root.iter() for child in parent}
+
+
+def ctm(element, parents, cache=None):
+    """
+    Get the transform from coordinates of <element> (its own transform included) to root coordinates.
+
+    :param element: element of tree
+    :type element: xml.etree.Element
+    :param parents: parent map of tree (see ancestors(...))
+    :type parents: dict[xml.etree.Element, xml.etree.Element]
+    :param cache: transforms of elements already computed, filled in by this function (e.g. shared by siblings)
+    :type cache: None | dict[xml.etree.Element, tuple[float]]
+
+    :return: transform
+    :rtype: tuple[float]
+    """
+    if cache is not None and element in cache:
+        return cache[element]
+    parent = parents.get(element)
+    matrix = ctm(parent, parents, cache) if parent is not None else IDENTITY
+    if "transform" in element.attrib:
+        matrix = multiply(matrix, parse_transform(element.attrib["transform"]))
+    if cache is not None:
+        cache[element] = matrix
+    return matrix
+
+
+def union(boxes):
+    """
+    :return: bounding box of all <boxes> (None entries skipped), None if there are none.
+    :rtype: None | (float, float, float, float)
+    """
+    boxes = [box for box in boxes if box is not None]
+    if not boxes:
+        return None
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+
+def intersects(a, b):
+    """
+    :return: True if boxes <a> and <b> overlap (touching included).
+    :rtype: bool
+    """
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+class Outline:
+    """
+    Outline of a path in map coordinates, filled with the even-odd rule. Requires 'numpy'.
+        * rings - rings (closed subpaths) of vertices, as arrays of shape (n, 2)\n
+        * bbox - bounding box of vertices and control points, None if outline is empty
+    """
+
+    __slots__ = ("rings", "bbox")
+
+    def __init__(self, rings, controls=None):
+        """
+        Constructor method for Outline.
+
+        :param rings: rings of vertices, as arrays of shape (n, 2)
+        :type rings: list[numpy.ndarray]
+        :param controls: control points of curves, only widening the bounding box
+        :type controls: None | numpy.ndarray
+        """
+        self.rings = [np.asarray(ring, dtype=float) for ring in rings if len(ring)]
+        points = self.rings + ([controls] if controls is not None and len(controls) else [])
+        self.bbox = None
+        if points:
+            points = np.concatenate(points)
+            (x0, y0), (x1, y1) = points.min(axis=0).tolist(), points.max(axis=0).tolist()
+            self.bbox = (x0, y0, x1, y1)
+
+    @classmethod
+    def from_path(cls, d, matrix=IDENTITY, steps=STEPS):
+        """
+        Build outline of SVG path data <d> transformed by <matrix> (see parse_path(...)).
+
+        :param d: path data
+        :type d: str
+        :param matrix: transform to map coordinates (see ctm(...))
+        :type matrix: tuple[float]
+        :param steps: number of segments of a flattened curve
+        :type steps: int
+
+        :return: outline
+        :rtype: Outline
+        """
+        rings, controls = parse_path(d, steps)
+        if matrix != IDENTITY:
+            rings = [transform_points(ring, matrix) for ring in rings]
+            controls = transform_points(controls, matrix)
+        return cls(rings, controls)
+
+    def contains(self, x, y):
+        """
+        Check if point (<x>, <y>) is inside the outline (even-odd rule, crossing count over all edges at once).
+
+        :return: True if point is inside
+        :rtype: bool
+        """
+        box = self.bbox
+        if box is None or not (box[0] <= x <= box[2] and box[1] <= y <= box[3]):
+            return False
+        return len(self._crossings(y, x)) % 2 == 1
+
+    def _crossings(self, y, right_of=None):
+        """
+        Get x of intersections of the outline's edges with horizontal line <y>, optionally only those right of
+        <right_of>. Private method for Outline objects.
+
+        :rtype: numpy.ndarray
+        """
+        found = []
+        for ring in self.rings:
+            xs, ys = ring[:, 0], ring[:, 1]
+            x2, y2 = np.roll(xs, -1), np.roll(ys, -1)
+            cross = (ys > y) != (y2 > y)
+            if cross.any():
+                xs, ys, x2, y2 = xs[cross], ys[cross], x2[cross], y2[cross]
+                found.append(xs + (y - ys) * (x2 - xs) / (y2 - ys))
+        found = np.concatenate(found) if found else np.empty(0)
+        return found if right_of is None else found[found > right_of]
+
+    def label_point(self):
+        """
+        Get a point inside the outline to place a label at: the centroid of its largest ring if inside, otherwise
+        the middle of the widest inner span of the outline on the centroid's horizontal line.
+
+        :return: (x, y) of label, None if outline is empty
+        :rtype: None | (float, float)
+        """
+        if not self.rings:
+            return None
+        best, cx, cy = 0.0, None, None
+        for ring in self.rings:
+            xs, ys = ring[:, 0], ring[:, 1]
+            x2, y2 = np.roll(xs, -1), np.roll(ys, -1)
+            cross = xs * y2 - x2 * ys
+            area = cross.sum() / 2
+            if abs(area) > best:
+                best = abs(area)
+                cx, cy = float(((xs + x2) * cross).sum() / (6 * area)), float(((ys + y2) * cross).sum() / (6 * area))
+        if cx is None:  # Degenerate rings
+            box = self.bbox
+            return (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+        if self.contains(cx, cy):
+            return cx, cy
+        spans = self.spans(cy)
+        if not spans:
+            box = self.bbox
+            return (box[0] + box[2]) / 2, cy
+        x0, x1 = max(spans, key=lambda span: span[1] - span[0])
+        return (x0 + x1) / 2, cy
+
+    def spans(self, y):
+        """
+        Get the inner spans of the outline on horizontal line <y> (even-odd rule).
+
+        :param y: y of line
+        :type y: float
+
+        :return: (x start, x end) of each span, ascending
+        :rtype: list[(float, float)]
+        """
+        xs = np.sort(self._crossings(y)).tolist()
+        return list(zip(xs[0::2], xs[1::2]))  # Inner spans are every other pair of crossings
+
+
+class GridIndex:
+    """
+    Uniform grid index of bounding boxes. Each cell lists the boxes overlapping it (about one box per cell), so point
+    and box queries only test the few boxes of the cells they cover.
+    """
+
+    __slots__ = ("boxes", "extent", "cell", "_cells")
+
+    def __init__(self, boxes, cell=None):
+        """
+        Constructor method for GridIndex.
+
+        :param boxes: boxes to index by position (None entries are skipped)
+        :type boxes: collections.Iterable[None | (float, float, float, float)]
+        :param cell: side of cells. If None, sized for about one box per cell.
+        :type cell: None | float
+        """
+        self.boxes = tuple(boxes)
+        self.extent = union(self.boxes)
+        self._cells = {}
+        self.cell = 1.0
+        if self.extent is None:
+            return
+        x0, y0, x1, y1 = self.extent
+        n = sum(box is not None for box in self.boxes)
+        self.cell = float(cell) if cell else max(sqrt((x1 - x0) * (y1 - y0) / n), (x1 - x0) / n, (y1 - y0) / n, 1e-9)
+        for k, box in enumerate(self.boxes):
+            if box is not None:
+                for key in self._keys(box):
+                    self._cells.setdefault(key, []).append(k)
+
+    def _keys(self, box):
+        """
+        :return: keys (column, row) of the grid cells covered by <box>. Private method for GridIndex objects.
+        :rtype: list[(int, int)]
+        """
+        x0, y0 = self.extent[0:2]
+        c = self.cell
+        cols = range(int(floor((box[0] - x0) / c)), int(floor((box[2] - x0) / c)) + 1)
+        rows = range(int(floor((box[1] - y0) / c)), int(floor((box[3] - y0) / c)) + 1)
+        return [(i, j) for i in cols for j in rows]
+
+    def query(self, box):
+        """
+        Get boxes overlapping <box>.
+
+        :param box: box to query
+        :type box: (float, float, float, float)
+
+        :return: positions of overlapping boxes, ascending
+        :rtype: list[int]
+        """
+        if self.extent is None or not intersects(self.extent, box):
+            return []
+        # Clip to the extent, so large query boxes cover no empty cells
+        box = (max(box[0], self.extent[0]), max(box[1], self.extent[1]),
+               min(box[2], self.extent[2]), min(box[3], self.extent[3]))
+        found = set()
+        for key in self._keys(box):
+            found.update(self._cells.get(key, ()))
+        return sorted(k for k in found if intersects(self.boxes[k], box))
+
+    def at(self, x, y):
+        """
+        :return: positions of boxes containing point (<x>, <y>), ascending.
+        :rtype: list[int]
+        """
+        return self.query((x, y, x, y))
+
+
+class MapGeometry:
+    """
+    Geometry of a map's regions by region position (map order), in map coordinates: outlines, bounding boxes of
+    regions and of their numbers, and a grid index of region boxes. Built once per template and shared by all maps
+    using it (see MapperUS._geometry()).
+    """
+
+    __slots__ = ("outlines", "boxes", "number_boxes", "index")
+
+    def __init__(self, paths, number_boxes, steps=STEPS):
+        """
+        Constructor method for MapGeometry.
+
+        :param paths: path data and transform to map coordinates of each region, None if region has no geometry
+        :type paths: list[None | (str, tuple[float])]
+        :param number_boxes: bounding box of each region's number, None if region has no number
+        :type number_boxes: list[None | (float, float, float, float)]
+        :param steps: number of segments of a flattened curve
+        :type steps: int
+        """
+        if np is not None:
+            self.outlines = tuple(Outline.from_path(p[0], p[1], steps) if p is not None else None for p in paths)
+            self.boxes = tuple(outline.bbox if outline is not None else None for outline in self.outlines)
+        else:
+            self.outlines = None
+            self.boxes = tuple(points_bbox(path_points(p[0]), p[1]) if p is not None else None for p in paths)
+        self.number_boxes = tuple(number_boxes)
+        self.index = GridIndex(self.boxes)
+
+    def _require_outlines(self):
+        """
+        :return: outlines of regions. Private method for MapGeometry objects.
+        :rtype: tuple[None | Outline]
+
+        :raises RuntimeError: if numpy is not installed
+        """
+        if self.outlines is None:
+            raise RuntimeError("Hit-testing and label placement require 'numpy'. Install it with 'pip install numpy'.")
+        return self.outlines
+
+    def hit(self, x, y):
+        """
+        Find the region drawn at point (<x>, <y>): the last one in map order (topmost) whose outline contains it.
+
+        :return: position of region, None if no region is there
+        :rtype: None | int
+        """
+        outlines = self._require_outlines()
+        for k in reversed(self.index.at(x, y)):
+            if outlines[k].contains(x, y):
+                return k
+        return None
+
+    def label_point(self, k):
+        """
+        Get a point to place the label of region at position <k> at: the label point of its outline (see
+        Outline.label_point()) if the region is drawn there. Otherwise (covered by a region drawn on top, e.g. DC over
+        Maryland) the point is searched on LABEL_LINES horizontal lines across the region: the middle of the widest
+        span of the region left uncovered by regions drawn on top, that hit-tests back to the region (see hit(...)).
+
+        :return: label point, None if region has no geometry. If the region is covered entirely, the label point of its
+            outline.
+        :rtype: None | (float, float)
+        """
+        outlines = self._require_outlines()
+        outline = outlines[k]
+        if outline is None:
+            return None
+        point = outline.label_point()
+        if point is None or self.hit(*point) == k:
+            return point
+
+        box = outline.bbox
+        above = [outlines[j] for j in self.index.query(box) if j > k and outlines[j] is not None]
+        candidates = []
+        for y in np.linspace(box[1], box[3], LABEL_LINES + 2)[1:-1].tolist():
+            spans = outline.spans(y)
+            for other in above:
+                spans = _subtract(spans, other.spans(y))
+            candidates.extend((x1 - x0, (x0 + x1) / 2, y) for x0, x1 in spans)
+        for _, x, y in sorted(candidates, reverse=True):
+            if self.hit(x, y) == k:
+                return x, y
+        return point
+
+
+def _subtract(spans, cuts):
+    """
+    Remove spans <cuts> from spans <spans> on a line.
+
+    :param spans: (x start, x end) of spans, ascending and disjoint
+    :type spans: list[(float, float)]
+    :param cuts: (x start, x end) of spans to remove, ascending and disjoint
+    :type cuts: list[(float, float)]
+
+    :return: (x start, x end) of remaining spans, ascending
+    :rtype: list[(float, float)]
+    """
+    left = []
+    for x0, x1 in spans:
+        for c0, c1 in cuts:
+            if c1 <= x0 or c0 >= x1:
+                continue
+            if c0 > x0:
+                left.append((x0, c0))
+            x0 = max(x0, c1)
+            if x0 >= x1:
+                break
+        if x0 < x1:
+            left.append((x0, x1))
+    return left
+
+# END OF FILE ////////////////////////////////////////////////////////////
@@ -0,0 +1,334 @@
+"""
+This module holds an opt-in instrumentation layer for mapper objects.
+
+While enabled, the public methods of MapperUS and ElectionUS and the stages below them are wrapped to record timings
+and counters:
+    * "<class>.<method>" - every public method call (inclusive of nested calls)\n
+    * "parse" - parsing of a map template (lazy.parse, once per template and process); counter "elements_parsed"\n
+    * "serialize" - serialization of the resident tree (SVGWriter.tobytes); counters "bytes_serialized" and
+      "elements_serialized" (elements actually re-serialized, not taken from the writer's cache)\n
+    * "storage.write" | "storage.read" - mapfile writes/reads; counters "bytes_written" | "bytes_read"\n
+    * "render.<format>" - rasterization (render.render)
+
+Results are collected in a Stats object and, optionally, passed to hook callbacks as they happen (e.g. to push them to
+a metrics system). Nothing is wrapped while disabled: enable() patches the methods and disable() restores the
+originals, so instrumentation costs nothing unless it is on.
+
+Classes:
+    Timing: Count, total and maximum time of an operation.\n
+    Stats: Timings and counters collected while instrumentation is enabled.
+
+Functions:
+    enable(hooks=None): Start instrumentation.\n
+    disable(): Stop instrumentation.\n
+    enabled(): Check if instrumentation is running.\n
+    stats(): Get current statistics.\n
+    instrumented(hooks=None): Context manager enabling instrumentation for a block.
+"""
+# --- Internal Imports --- #
+from mappers import render, storage, writer
+from mappers.electionUS import ElectionUS
+from mappers.mapperUS import MapperUS
+# --- External Imports --- #
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock
+from time import perf_counter
+
+
+class Timing:
+    """
+    Count, total and maximum time of an operation.
+    """
+
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0  # type: int
+        self.total = 0.0  # type: float
+        self.max = 0.0  # type: float
+
+    @property
+    def mean(self):
+        """
+        :return: mean time in seconds (0 if never called).
+        :rtype: float
+        """
+        return self.total / self.count if self.count else 0.0
+
+    def asdict(self):
+        """
+        :return: dictionary of count, total, mean and max time in seconds.
+        :rtype: dict
+        """
+        return {"count": self.count, "total": self.total, "mean": self.mean, "max": self.max}
+
+
+class Stats:
+    """
+    Timings and counters collected while instrumentation is enabled. Updated under a lock, safe to read any time.
+    """
+
+    def __init__(self):
+        self.timings = {}  # type: dict[str, Timing]
+        self.counters = {}  # type: dict[str, int]
+        self._lock = Lock()
+
+    def add_time(self, name, seconds):
+        """
+        Record one call of operation <name> taking <seconds>.
+
+        :param name: name of operation
+        :type name: str
+        :param seconds: duration of call
+        :type seconds: float
+
+        :return:
+        :rtype: None
+        """
+        with self._lock:
+            timing = self.timings.get(name)
+            if timing is None:
+                timing = self.timings[name] = Timing()
+            timing.count += 1
+            timing.total += seconds
+            if seconds > timing.max:
+                timing.max = seconds
+
+    def add_count(self, name, value=1):
+        """
+        Add <value> to counter <name>.
+
+        :param name: name of counter
+        :type name: str
+        :param value: increment
+        :type value: int
+
+        :return:
+        :rtype: None
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def reset(self):
+        """
+        Clear all timings and counters.
+
+        :return:
+        :rtype: None
+        """
+        with self._lock:
+            self.timings.clear()
+            self.counters.clear()
+
+    def asdict(self):
+        """
+        :return: dictionary of {"timings": {name: {...}}, "counters": {name: value}}.
+        :rtype: dict
+        """
+        with self._lock:
+            return {"timings": {name: t.asdict() for name, t in self.timings.items()},
+                    "counters": dict(self.counters)}
+
+    def report(self):
+        """
+        :return: human readable table of timings (slowest total first) and counters.
+        :rtype: str
+        """
+        data = self.asdict()
+        lines = ["{0:40s} {1:>8s} {2:>11s} {3:>10s} {4:>10s}".format("operation", "calls", "total ms", "mean ms",
+                                                                      "max ms")]
+        for name, t in sorted(data["timings"].items(), key=lambda item: -item[1]["total"]):
+            lines.append("{0:40s} {1:8d} {2:11.3f} {3:10.3f} {4:10.3f}".format(
+                name, t["count"], t["total"] * 1e3, t["mean"] * 1e3, t["max"] * 1e3))
+        for name, value in sorted(data["counters"].items()):
+            lines.append("{0:40s} {1:8d}".format(name, value))
+        return "\n".join(lines)
+
+
+_stats = None
+"""
+Statistics of current (or last) instrumentation run. None if never enabled.
+:type: None | Stats
+"""
+
+_hooks = []
+"""
+Hook callbacks, called as hook(kind, name, value) with kind "timing" (value in seconds) or "counter" (increment).
+:type: list[function]
+"""
+
+_patched = []
+"""
+Original attributes replaced by enable(...), as (owner, attribute name, original) tuples.
+:type: list[(object, str, object)]
+"""
+
+_state_lock = Lock()
+"""
+Lock guarding enable(...)/disable().
+:type: threading.Lock
+"""
+
+
+def _time(name, seconds):
+    """
+    Record a timing in statistics and pass it to hooks.
+    """
+    _stats.add_time(name, seconds)
+    for hook in _hooks:
+        hook("timing", name, seconds)
+
+
+def _count(name, value):
+    """
+    Record a counter increment in statistics and pass it to hooks.
+    """
+    _stats.add_count(name, value)
+    for hook in _hooks:
+        hook("counter", name, value)
+
+
+def _timed(name, func, measure=None):
+    """
+    Wrap <func> to record its duration as <name>.
+
+    :param name: name of operation
+    :type name: str
+    :param func: function to wrap
+    :type func: function
+    :param measure: function(args, kwargs, result) recording counters after a successful call
+    :type measure: None | function
+
+    :return: wrapped function
+    :rtype: function
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            _time(name, perf_counter() - start)
+        if measure is not None:
+            measure(args, kwargs, result)
+        return result
+    return wrapper
+
+
+def _patch(owner, attr, replacement):
+    """
+    Replace attribute <attr> of <owner>, remembering the original for disable().
+    """
+    _patched.append((owner, attr, owner.__dict__[attr]))
+    setattr(owner, attr, replacement)
+
+
+def enable(hooks=None):
+    """
+    Start instrumentation (if not running) with fresh statistics.
+
+    :param hooks: hook callbacks hook(kind, name, value), see _hooks
+    :type hooks: None | list[function]
+
+    :return: statistics being collected
+    :rtype: Stats
+    """
+    global _stats
+    with _state_lock:
+        _stats = Stats()
+        _hooks[:] = list(hooks or ())
+        if _patched:
+            return _stats
+
+        # Public methods of mapper classes
+        for cls in (MapperUS, ElectionUS):
+            for attr, value in list(cls.__dict__.items()):
+                if not attr.startswith("_") and callable(value) and not isinstance(value, (staticmethod, type)):
+                    _patch(cls, attr, _timed("{0}.{1}".format(cls.__name__, attr), value))
+
+        # Template parsing (subclasses extend MapperUS._build_template through super())
+        build = MapperUS.__dict__["_build_template"].__func__
+        _patch(MapperUS, "_build_template", classmethod(_timed(
+            "parse", build, lambda a, k, tree: _count("elements_parsed", sum(1 for _ in tree.getroot().iter())))))
+
+        # Serialization
+        _patch(writer.SVGWriter, "tobytes", _timed(
+            "serialize", writer.SVGWriter.tobytes, lambda a, k, data: _count("bytes_serialized", len(data))))
+        element = writer.SVGWriter._element
+
+        @wraps(element)
+        def counted_element(*args, **kwargs):
+            _count("elements_serialized", 1)
+            return element(*args, **kwargs)
+        _patch(writer.SVGWriter, "_element", counted_element)
+
+        # Mapfile storages
+        for cls in (storage.MemoryStorage, storage.TempStorage, storage.FileStorage):
+            _patch(cls, "write", _timed(
+                "storage.write", cls.__dict__["write"], lambda a, k, r: _count("bytes_written", len(a[1]))))
+            _patch(cls, "read", _timed(
+                "storage.read", cls.__dict__["read"], lambda a, k, data: _count("bytes_read", len(data))))
+
+        # Rasterization (looked up through the module by Mapper.export)
+        original = render.render
+
+        @wraps(original)
+        def timed_render(svg, fmt="png", *args, **kwargs):
+            start = perf_counter()
+            try:
+                return original(svg, fmt, *args, **kwargs)
+            finally:
+                _time("render.{0}".format(fmt), perf_counter() - start)
+        _patch(render, "render", timed_render)
+    return _stats
+
+
+def disable():
+    """
+    Stop instrumentation and restore all original methods. Statistics stay available through stats().
+
+    :return:
+    :rtype: None
+    """
+    with _state_lock:
+        while _patched:
+            owner, attr, original = _patched.pop()
+            setattr(owner, attr, original)
+        _hooks[:] = []
+
+
+def enabled():
+    """
+    :return: True if instrumentation is running.
+    :rtype: bool
+    """
+    return bool(_patched)
+
+
+def stats():
+    """
+    :return: statistics of the current (or last) instrumentation run, None if never enabled.
+    :rtype: None | Stats
+    """
+    return _stats
+
+
+@contextmanager
+def instrumented(hooks=None):
+    """
+    Context manager enabling instrumentation for a block.
+
+    :param hooks: hook callbacks, see enable(...)
+    :type hooks: None | list[function]
+
+    :return: context manager yielding the statistics being collected
+    :rtype: contextlib.AbstractContextManager[Stats]
+    """
+    collected = enable(hooks)
+    try:
+        yield collected
+    finally:
+        disable()
+
+# END OF FILE ////////////////////////////////////////////////////////////
@@ -0,0 +1,162 @@
+"""
+This module holds a lazy loader of *.svg map files that skips parsing bulky attributes (path geometry) until needed.
+
+Almost all bytes of a map are 'd' path data, which mappers never read: they only touch ids, fills and texts. The
+loader cuts these attribute values out of the raw file with a single byte scan, parses only the remaining 'skeleton' of the
+document and puts a LazyAttribute holding the value's raw bytes in its place. A LazyAttribute is shared, not copied,
+by every mapper built from the template; SVGWriter splices its raw bytes into the output as they are. The value is
+only decoded when a caller asks for it (see MapperUS.get_region_geometry(...)).
+
+Classes:
+    LazyAttribute: Attribute value materialized on demand.
+
+Functions:
+    parse(filename, lazy=LAZY): Parse a map file, loading attributes <lazy> lazily.\n
+    copy_tree(element): Copy a tree, sharing its attribute values.
+"""
+# --- External Imports --- #
+import re
+import xml.etree.ElementTree as ET
+
+LAZY = ("d",)
+"""
+Names of attributes loaded lazily by default.
+:type: tuple[str]
+"""
+
+class LazyAttribute:
+    """
+    Attribute value materialized on demand. Holds the raw (still XML-escaped) bytes of the value as written in its
+    source file. Copies of a tree share the same object.
+    """
+
+    __slots__ = ("raw",)
+
+    def __init__(self, raw):
+        """
+        Constructor method for LazyAttribute.
+
+        :param raw: raw value as written in the source file (XML-escaped, without quotes)
+        :type raw: bytes
+        """
+        self.raw = raw
+
+    @property
+    def value(self):
+        """
+        :return: decoded value.
+        :rtype: str
+        """
+        return ET.fromstring(b'<a v="' + self.raw + b'"/>').attrib["v"]
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __str__(self):
+        return self.value
+
+    def __repr__(self):
+        return "LazyAttribute({0} bytes)".format(len(self))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def parse(filename, lazy=LAZY):
+    """
+    Parse map file <filename>, loading attributes <lazy> as LazyAttribute values.
+
+    :param filename: filepath of *.svg map file
+    :type filename: str
+    :param lazy: names of attributes to load lazily
+    :type lazy: tuple[str]
+
+    :return: parsed tree
+    :rtype: xml.etree.ElementTree.ElementTree
+    """
+    with open(filename, "rb") as f:
+        source = f.read()
+    if not lazy:
+        return ET.ElementTree(ET.fromstring(source))
+
+    # Cut out each lazy value and put a token in its place: d="..." -> d="0", d="1", ...
+    names = b"|".join(re.escape(name.encode("ascii")) for name in lazy)
+    parts = re.split(rb"(\s(?:" + names + rb")\s*=\s*)(?:\"([^\"]*)\"|'([^']*)')", source)
+    skeleton = [parts[0]]
+    values = []
+    tokens = []  # Token and original bytes of each match
+    for k in range(1, len(parts), 4):
+        prefix, double, single, after = parts[k:k + 4]
+        raw = double if double is not None else single.replace(b'"', b"&quot;")  # Written between double quotes
+        token = prefix + b'"' + str(len(values)).encode("ascii") + b'"'
+        skeleton.append(token + after)
+        tokens.append((token, prefix + (b'"' + double + b'"' if double is not None else b"'" + single + b"'")))
+        values.append(LazyAttribute(raw))
+
+    # Parse skeleton and swap tokens for lazy values
+    root = ET.fromstring(b"".join(skeleton))
+    swapped = set()
+    keys = set(lazy)
+    for element in root.iter():
+        for key in keys.intersection(element.attrib):
+            token = element.attrib[key]
+            if token.isdigit() and int(token) < len(values):
+                element.attrib[key] = values[int(token)]
+                swapped.add(int(token))
+    if len(swapped) != len(values):
+        _restore(root, [tokens[k] for k in range(len(values)) if k not in swapped])
+    return ET.ElementTree(root)
+
+
+def _restore(root, tokens):
+    """
+    Put back the original bytes of matches that were not lazy attributes (e.g. in a text). Matches in comments need no
+    care, comments are not kept by the parser.
+
+    :param root: root of parsed skeleton
+    :type root: xml.etree.Element
+    :param tokens: token and original bytes of each match to restore
+    :type tokens: list[(bytes, bytes)]
+
+    :return:
+    :rtype: None
+    """
+    # Tokens are unique in the skeleton: every match of the attribute pattern in the source became one
+    originals = {token.decode("utf-8"): ET.fromstring(b"<a>" + original + b"</a>").text
+                 for token, original in tokens}
+
+    def restore(text):
+        if text and '"' in text:
+            for token, original in originals.items():
+                if token in text:
+                    text = text.replace(token, original)
+        return text
+
+    for element in root.iter():
+        element.text = restore(element.text)
+        element.tail = restore(element.tail)
+        for key, value in element.attrib.items():
+            if isinstance(value, str) and '"' in value:
+                element.attrib[key] = restore(value)
+
+def copy_tree(element):
+    """
+    Copy the tree under <element>. Attribute values, texts and tails are immutable and shared with the original
+    (LazyAttribute values included), which is much cheaper than copy.deepcopy(...) of the tree.
+
+    :param element: root of tree to copy
+    :type element: xml.etree.Element
+
+    :return: root of copy
+    :rtype: xml.etree.Element
+    """
+    copy = ET.Element(element.tag, element.attrib)
+    copy.text = element.text
+    copy.tail = element.tail
+    copy.extend([copy_tree(child) for child in element])
+    return copy
+
+# END OF FILE ////////////////////////////////////////////////////////////
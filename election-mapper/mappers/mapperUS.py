@@ -5,83 +5,681 @@ See 'abstracts.py' for generic documentation about mapper objects.
 
 Attribs:
     DIR (str) - Absolute filepath for this module's directory\n
-    CONFIG_FILE (str) - Absolute filepath for this module's configuration file
+    CONFIG_FILE (str) - Absolute filepath for this module's configuration file\n
+    TEMPLATE_CACHE_SIZE (int) - Number of parsed templates kept per process
 
 Classes:
     MapperUS (Mapper): Class of 'mapper' object specialized for US *.svg map files only.
 
+Functions:
+    synchronized(method): Decorator running a method while holding its object's lock.
+
+Thread safety:
+    MapperUS objects may be shared between threads. Each object holds a re-entrant lock that every public method
+    (mutation + write-through included) runs under, so concurrent calls are serialized per object. Creating objects
+    from many threads is safe too: the object counter and the template cache are guarded by class-level locks and
+    the SVG namespace is registered once per template.
+
 Info:
     :Date: 2017-01-31
     :Authors: B\. Seid
 """
 # --- Internal Imports --- #
 from mappers.abstracts import Mapper
+from mappers.compact import collapse_fills, compress, simplify_path, strip_whitespace
+from mappers.config import USConfig, load_config
+from mappers.geometry import MapGeometry, ancestors, ctm, text_bbox
+from mappers.lazy import copy_tree, parse
+from mappers.regions import NO_COLOR, NO_NUMBER, RegionStore
+from mappers.storage import Storage, FileStorage, TempStorage
+from mappers.tiles import TilePyramid
+from mappers.writer import SVGWriter
 # --- External Imports --- #
-from shutil import copyfile
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
 from os import path
+from threading import Lock, RLock
 import xml.etree.ElementTree as ET
 
 # Global parameters
 DIR = path.dirname(__file__)
 CONFIG_FILE = path.join(DIR, "../config/USconfig.conf")
+TEMPLATE_CACHE_SIZE = 8  # Configurations reloaded or overridden per object each add a template
+
+
+def synchronized(method):
+    """
+    Decorator for methods of MapperUS objects (and subclasses): run <method> while holding the object's lock.
+
+    :param method: method to wrap
+    :type method: function
+
+    :return: wrapped method
+    :rtype: function
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
 
 
 class MapperUS(Mapper):
-    # TODO : Implement counties editing
-    # TODO : Determine if need to add "states" or "counties" parameter to MapperUS object (self)
-    # TODO : Test svg list searching by US counties. Needed for "change_region_color" and "get_region_color".
+    """
+    Mapper of US *.svg maps at "states" or "counties" level.
+
+    A counties map (FILE_COUNTIES in configuration) holds its regions in one or more <g id="counties"> groups, either
+    directly or in one nested <g> per state, with each county's FIPS code as id and a fill color
+    (e.g. <path id="01001" fill="#C0C0C0" .../>).
+    """
 
     index = 0
     """
-    Class variable, keep track of # of open MapperUS objects.
+    Class variable, keep track of # of created MapperUS objects. Only modified under _index_lock.
     :type: int
     """
 
-    _cfg = {}
+    _index_lock = Lock()
+    """
+    Class variable, lock guarding MapperUS.index.
+    :type: threading.Lock
+    """
+
+    _templates_lock = Lock()
+    """
+    Class variable, lock guarding MapperUS._templates and the caches keyed by template (see _cache_put(...)).
+    :type: threading.Lock
+    """
+
+    _id = None
+    """
+    Unique number of this object, allocated from MapperUS.index.
+    :type: int
+    """
+
+    _lock = None
+    """
+    Re-entrant lock held by every public method of this object (see synchronized(...)).
+    :type: threading.RLock
+    """
+
+    _cfg = None
+    """
+    Configuration of this object, loaded once per process from .conf file (plus any per-object overrides).
+    :type: mappers.config.USConfig
+    """
+
+    _templates = OrderedDict()
+    """
+    Class variable, process-wide cache of parsed base templates keyed by (class, "states" | "counties", config).
+    New objects deep-copy their tree from here instead of copying and re-parsing the template file.
+    Least recently used first: beyond TEMPLATE_CACHE_SIZE templates, the oldest is evicted along with its entries in
+    _stores, _geometries and _simplified (see _evict(...)).
+    :type: collections.OrderedDict[(type, str, mappers.config.USConfig), xml.etree.ElementTree.ElementTree]
+    """
+
+    _stores = {}
+    """
+    Class variable, process-wide cache of the initial region state of each cached template, keyed as _templates.
+    New objects copy their region store from here instead of reading it from their tree.
+    :type: dict[(type, str), mappers.regions.RegionStore]
+    """
+
+    _geometries = {}
+    """
+    Class variable, process-wide cache of the region geometry (outlines, bounding boxes, spatial index) of each cached
+    template, keyed as _templates. Built on first use (see _geometry()).
+    :type: dict[(type, str), mappers.geometry.MapGeometry]
+    """
+
+    _simplified = {}
+    """
+    Class variable, process-wide cache of simplified region path data, keyed by (template key, tolerance, decimals).
+    Built on first use of each tolerance (see _simplified_paths(...)).
+    :type: dict[((type, str), float, int), tuple[None | str]]
+    """
+
+    _key = None
+    """
+    Key of this object's template in the process-wide caches (see _templates).
+    :type: (type, str, mappers.config.USConfig)
+    """
+
+    _tile_pyramids = None
+    """
+    Tile pyramids exported by export_tiles(...), keyed by their parameters.
+    :type: None | dict[tuple, mappers.tiles.TilePyramid]
+    """
+
+    _tree = None
+    """
+    Parsed xml tree of the mapfile, kept resident for the lifetime of the object.
+    :type: xml.etree.ElementTree.ElementTree
+    """
+
+    _writer = None
+    """
+    Incremental serializer of the resident tree. Every change must be reported to it through _modified(...).
+    :type: mappers.writer.SVGWriter
+    """
+
+    _dirty = False
+    """
+    True if the resident tree holds changes that have not been written to the mapfile.
+    :type: bool
+    """
+
+    _inmemory = False
+    """
+    If True, changes are only written to the mapfile on flush()/save() (or on exiting a 'with' block).
+    If False, every change is written through to the mapfile immediately.
+    :type: bool
+    """
+
+    _ids = None
+    """
+    Index of element id -> first element with that id in the resident tree.
+    :type: dict[str, xml.etree.Element]
+    """
+
+    _members = None
+    """
+    Index of group id -> {child id -> child element} for region, number, candidate and bar groups.
+    :type: dict[str, dict[str, xml.etree.Element]]
+    """
+
+    _store = None
+    """
+    Compact state of regions (colors, numbers), the source of truth for region state. Changes are projected into the
+    resident tree by _project() before it is serialized.
+    :type: mappers.regions.RegionStore
+    """
+
+    _region_elements = None
+    """
+    Region element at each position of _store.
+    :type: list[xml.etree.Element]
+    """
+
+    _number_elements = None
+    """
+    Number element (None if none) at each position of _store.
+    :type: list[None | xml.etree.Element]
+    """
+
+    _style = None
+    """
+    <style> element holding region colors in class coloring mode (CLASS_COLORS), None otherwise. Regions then carry
+    a class per color instead of a fill attribute.
+    :type: None | xml.etree.Element
+    """
+
+    _palette = None
+    """
+    Class coloring mode: class name of each region color in use (see _class_of(...)).
+    :type: None | dict[int, str]
+    """
+
+    _rules = None
+    """
+    Class coloring mode: color of each class in the stylesheet.
+    :type: None | dict[str, int]
+    """
+
+    _unprojected = None
     """
-    Dictionary containing configuration variables from .conf file
-    :type: dict
+    Positions of regions whose color (first set) or number (second set) changed in _store since the last projection.
+    :type: (set[int], set[int])
     """
 
-    def __init__(self, stco="states"):
+    def __init__(self, stco="states", inmemory=False, config=None, storage=None):
         """
         Constructor method for MapperUS.
 
         :param stco: "states" | "counties"
         :type stco: str
+
+        :param inmemory: If True, keep changes in memory until flush()/save() is called.
+        :type inmemory: bool
+
+        :param config: configuration to use instead of .conf file, or dictionary of values overriding it.
+        :type config: None | dict | mappers.config.USConfig
+
+        :param storage: storage of mapfile (see 'storage.py'), or filepath to save mapfile to.
+            If None, a temporary file in configuration's DIR_SAVEAS directory.
+        :type storage: None | str | mappers.storage.Storage
         """
         # Load configuration data
-        exec(open(CONFIG_FILE).read(), self._cfg)
-
-        # Create new mapfile based on class index
-        f = path.join(DIR, self._cfg["FILE_SAVEAS"].format(MapperUS.index))
-        MapperUS.index += 1
-        ET.register_namespace("", self._cfg["NAMESPACE"])
+        if isinstance(config, USConfig):
+            self._cfg = config
+        else:
+            self._cfg = load_config(CONFIG_FILE).replace(**(config or {}))
 
         # Select type of map to copy over
-        if str(stco) == "states":
-            copyfile(path.join(DIR, self._cfg["FILE_STATES"]), f)
-        elif str(stco) == "counties":
-            raise NotImplementedError("County level map not implemented yet.")
-            # copyfile(path.join(DIR, self._cfg["FILE_COUNTIES"]), f)
-        else:
-            # Bad value input, revert index and raise exception
-            MapperUS.index -= 1
-            raise ValueError("Invalid class argument. Choose 'states' or 'counties' only.")
+        template = self._template(str(stco), self._cfg)
 
-        # Set properties
-        self._mapfile = f
-        root = ET.parse(f).getroot()
-        t = root.find('.')
+        # Allocate unique object number
+        with MapperUS._index_lock:
+            self._id = MapperUS.index
+            MapperUS.index += 1
+        self._lock = RLock()
+
+        # Select storage of mapfile (uniquely named temporary file by default)
+        if storage is None:
+            storage = TempStorage(directory=self._cfg.DIR_SAVEAS)
+        elif not isinstance(storage, Storage):
+            storage = FileStorage(storage)
+
+        # Set properties. Mapfile is not written until first flush (immediately unless in 'inmemory' mode).
+        self._storage = storage
+        self._inmemory = bool(inmemory)
+        self._tree = ET.ElementTree(copy_tree(template.getroot()))
+        t = self._tree.getroot()
         self._mapheight = int(t.attrib['height'])
         self._mapwidth = int(t.attrib['width'])
+        self._writer = SVGWriter(t, {self._cfg.NAMESPACE: ""})
+        self._key = (type(self), str(stco), self._cfg)
+        self._build_index(self._key)
+        if self._cfg.CLASS_COLORS:
+            self._init_classes()
+        self._modified()
+
+    @classmethod
+    def _template(cls, stco, cfg):
+        """
+        Get parsed template of map type <stco> from the process-wide cache, building it on first use.
+        The returned tree is shared and must not be modified; copy it instead (see lazy.copy_tree(...)).
+        Private class method for MapperUS objects.
+
+        :param stco: "states" | "counties"
+        :type stco: str
+        :param cfg: configuration of template
+        :type cfg: mappers.config.USConfig
+
+        :return: cached template
+        :rtype: xml.etree.ElementTree.ElementTree
+        """
+        key = (cls, stco, cfg)
+        with MapperUS._templates_lock:
+            template = MapperUS._templates.get(key)
+            if template is not None:
+                MapperUS._templates.move_to_end(key)
+                return template
+
+            # Register SVG namespace (global ElementTree state) once, before first parse
+            ET.register_namespace("", cfg.NAMESPACE)
+            template = MapperUS._templates[key] = cls._build_template(stco, cfg)
+            while len(MapperUS._templates) > TEMPLATE_CACHE_SIZE:
+                MapperUS._evict(next(iter(MapperUS._templates)))
+        return template
+
+    @staticmethod
+    def _evict(key):
+        """
+        Drop template <key> and everything cached for it from the process-wide caches. Objects built from it keep
+        their own tree. Private static method for MapperUS objects, called holding MapperUS._templates_lock.
+
+        :param key: template key (see _templates)
+        :type key: (type, str, mappers.config.USConfig)
+
+        :return:
+        :rtype: None
+        """
+        del MapperUS._templates[key]
+        MapperUS._stores.pop(key, None)
+        MapperUS._geometries.pop(key, None)
+        for k in [k for k in MapperUS._simplified if k[0] == key]:
+            del MapperUS._simplified[k]
+
+    @staticmethod
+    def _cache_put(cache, key, template, value):
+        """
+        Put <value> in process-wide cache <cache> (_stores, _geometries or _simplified) under <key>, unless its
+        template has been evicted meanwhile (an entry would then never be dropped). Private static method for
+        MapperUS objects.
+
+        :param cache: cache to put value in
+        :type cache: dict
+        :param key: key of value in cache
+        :type key: tuple
+        :param template: template key (see _templates) the value was built from
+        :type template: (type, str, mappers.config.USConfig)
+        :param value: value to cache
+
+        :return: <value>
+        """
+        with MapperUS._templates_lock:
+            if template in MapperUS._templates:
+                cache[key] = value
+        return value
+
+    @classmethod
+    def _build_template(cls, stco, cfg):
+        """
+        Parse base map template of map type <stco>. Subclasses may extend this to decorate the template once.
+        Path geometry is loaded lazily (see 'lazy.py') and shared by all objects using the template.
+        Private class method for MapperUS objects.
 
-    def __del__(self):
-        super().__del__()  # delete mapfile
+        :param stco: "states" | "counties"
+        :type stco: str
+        :param cfg: configuration of template
+        :type cfg: mappers.config.USConfig
+
+        :return: parsed template
+        :rtype: xml.etree.ElementTree.ElementTree
+        """
+        if stco == "states":
+            return parse(path.join(DIR, cfg.FILE_STATES))
+        elif stco == "counties":
+            f = path.join(DIR, cfg.FILE_COUNTIES)
+            if not path.exists(f):
+                raise FileNotFoundError(
+                    "County level map not found at '{0}'. Set FILE_COUNTIES in configuration.".format(f)
+                )
+            return parse(f)
+        else:
+            raise ValueError("Invalid class argument. Choose 'states' or 'counties' only.")
 
     def __str__(self):
         return str(self.map)
 
+    @property
+    def id(self):
+        """
+        :return: unique number of this object.
+        :rtype: int
+        """
+        return self._id
+
+    @synchronized
+    def close(self):
+        super().close()
+
+    @property
+    def inmemory(self):
+        """
+        :return: True if changes are held in memory until flush()/save().
+        :rtype: bool
+        """
+        return self._inmemory
+
+    @property
+    def dirty(self):
+        """
+        :return: True if there are changes not yet written to the mapfile.
+        :rtype: bool
+        """
+        return self._dirty
+
+    def _modified(self, *elements):
+        """
+        Mark the resident tree as changed. Writes through to the mapfile unless in 'inmemory' mode.
+        Private method for MapperUS objects.
+
+        :param elements: changed elements (attributes, text or children). If none given, the whole tree.
+        :type elements: xml.etree.Element
+
+        :return:
+        :rtype: None
+        """
+        self._writer.invalidate(*elements)
+        self._dirty = True
+        if not self._inmemory:
+            self.flush()
+
+    @contextmanager
+    def _batch(self):
+        """
+        Context manager holding this object's lock and deferring writes to the mapfile until the block exits, so many
+        changes are written once (as in 'inmemory' mode).
+        Private method for MapperUS objects.
+
+        :return: context manager
+        :rtype: contextlib.AbstractContextManager
+        """
+        with self._lock:
+            inmemory, self._inmemory = self._inmemory, True
+            try:
+                yield
+            finally:
+                self._inmemory = inmemory
+                if not inmemory:
+                    self.flush()
+
+    @synchronized
+    def flush(self):
+        if self._dirty:
+            self._storage.write(self.to_svg())
+            self._dirty = False
+
+    @synchronized
+    def save(self, filename=None):
+        self.flush()
+        if filename is not None:
+            with open(filename, "wb") as f:
+                f.write(self.to_svg())
+
+    def _build_index(self, key=None):
+        """
+        Build the id index and region store of the resident tree.
+        Private method for MapperUS objects.
+
+        * self._ids maps each id to the first element (in document order) carrying it, same as _parse_tag(...)[0].
+        * self._members maps the id of each region/candidate/bar group to a dict of its children by id. Ids are only
+          unique within a group (e.g. "AK" is both a state path and a number text), hence one dict per group.
+        * self._store holds the state of the regions (see 'regions.py').
+
+        :param key: template key (see _templates) of an unmodified tree, to copy the region store from cache
+        :type key: None | (type, str, mappers.config.USConfig)
+
+        :return:
+        :rtype: None
+        """
+        self._ids = {}
+        for element in self._tree.getroot().iter():
+            if "id" in element.attrib:
+                self._ids.setdefault(element.attrib["id"], element)
+
+        self._members = {}
+        for gid in self._indexed_groups():
+            self._reindex(gid)
+
+        # Region state is read from the tree once per template, then kept in the store
+        regions = self._regions()
+        numbers = self._members.get(self._cfg.ID_NUMBERS, {})
+        store = MapperUS._stores.get(key) if key is not None else None
+        if store is None:
+            store = RegionStore.from_elements(regions, numbers)
+            if key is not None:
+                self._cache_put(MapperUS._stores, key, key, store.copy())  # Identical if built concurrently
+        else:
+            store = store.copy()
+        self._store = store
+        self._region_elements = list(regions.values())
+        self._number_elements = [numbers.get(identifier) for identifier in regions]
+        self._unprojected = (set(), set())
+
+    def _project(self):
+        """
+        Write region colors and numbers changed in the store into the resident tree. Their elements have already been
+        reported to the writer by the setters.
+        Private method for MapperUS objects.
+
+        :return:
+        :rtype: None
+        """
+        store = self._store
+        colors, numbers = self._unprojected
+        if self._style is not None:
+            if colors:
+                for k in colors:
+                    self._region_elements[k].attrib["class"] = self._class_of(store.colors[k])
+                self._write_rules()
+        else:
+            for k in colors:
+                self._region_elements[k].attrib["fill"] = "#{:06x}".format(store.colors[k])
+        for k in numbers:
+            child = self._number_elements[k]
+            child.text = str(store.numbers[k])
+            if store.number_colors[k] != NO_COLOR:
+                child.attrib["fill"] = "#{:06x}".format(store.number_colors[k])
+        colors.clear()
+        numbers.clear()
+
+    def _init_classes(self):
+        """
+        Switch the resident tree to class coloring mode: move region fills into one class per color and a <style>
+        element (first child of the root). Private method for MapperUS objects.
+
+        :return:
+        :rtype: None
+        """
+        self._palette, self._rules = {}, {}
+        self._style = ET.Element("{{{0}}}style".format(self._cfg.NAMESPACE), {"id": self._cfg.ID_STYLE})
+        self._tree.getroot().insert(0, self._style)
+        self._ids.setdefault(self._cfg.ID_STYLE, self._style)
+        for element, color in zip(self._region_elements, self._store.colors):
+            element.attrib.pop("fill", None)
+            element.attrib["class"] = self._class_of(color)
+        self._write_rules()
+
+    def _class_of(self, color):
+        """
+        Get class of region color <color>, adding a rule to the stylesheet for a new color (named by
+        _style_names(...)). Private method for MapperUS objects.
+
+        :param color: color in RGB hex (0x??????)
+        :type color: int
+
+        :return: class name
+        :rtype: str
+        """
+        name = self._palette.get(color)
+        if name is None:
+            name = self._style_names([color])[color]
+            if self._rules.get(name, color) != color:  # Name still held by another color (e.g. a candidate's old one)
+                name = "{0}-{1}".format(name, len(self._rules))
+            self._palette[color] = name
+            self._rules[name] = color
+        return name
+
+    def _rename_classes(self):
+        """
+        Rename classes of colors whose name changed (see _style_names(...), e.g. a candidate now has that color).
+        Regions of renamed classes are re-projected. Does nothing unless in class coloring mode.
+        Private method for MapperUS objects.
+
+        :return:
+        :rtype: None
+        """
+        if self._style is None:
+            return
+        store = self._store
+        changed = []
+        for color, name in self._style_names(sorted(self._palette)).items():
+            old = self._palette[color]
+            if old != name and self._rules.get(name, color) == color:
+                del self._rules[old]
+                self._palette[color] = name
+                self._rules[name] = color
+                for identifier in store.regions_with(color):
+                    k = store.index[identifier]
+                    self._unprojected[0].add(k)
+                    changed.append(self._region_elements[k])
+        if changed:
+            self._modified(*changed)
+
+    def _write_rules(self):
+        """
+        Drop rules of colors no region has anymore and write the rules of the stylesheet to the <style> element, if
+        they changed. Private method for MapperUS objects.
+
+        :return:
+        :rtype: None
+        """
+        used = self._store.count_colors()
+        for color in [color for color in self._palette if color not in used]:
+            del self._rules[self._palette.pop(color)]
+        text = "".join(".{0}{{fill:#{1:06x}}}".format(name, color) for name, color in self._rules.items())
+        if text != self._style.text:
+            self._style.text = text
+            self._writer.invalidate(self._style)
+
+    def _indexed_groups(self):
+        """
+        :return: ids of groups whose children are indexed by id.
+        :rtype: list[str]
+        """
+        return [self._cfg.ID_STATES, self._cfg.ID_NUMBERS, self._cfg.ID_COUNTIES,
+                self._cfg.ID_CAND_NM, self._cfg.ID_CAND_SQ, self._cfg.ID_CAND_PX, self._cfg.ID_CAND_EV, self._cfg.ID_BAR]
+
+    def _reindex(self, *gids):
+        """
+        Rebuild the member index of groups <gids>. Must be called after adding or removing children of a group.
+        Private method for MapperUS objects.
+
+        :param gids: ids of groups to re-index
+        :type gids: str
+
+        :return:
+        :rtype: None
+        """
+        for gid in gids:
+            if gid == self._cfg.ID_COUNTIES:
+                groups = [e for e in self._tree.getroot().iter() if e.attrib.get("id") == gid]  # Multiple counties ids
+            else:
+                groups = [self._ids[gid]] if gid in self._ids else []
+            if not groups:
+                self._members.pop(gid, None)
+                continue
+
+            members = {}
+            for group in groups:
+                for child in group:
+                    # Counties may be grouped in one <g> per state
+                    if gid == self._cfg.ID_COUNTIES and child.tag.rpartition("}")[2] == "g":
+                        for county in child:
+                            if "id" in county.attrib:
+                                members.setdefault(county.attrib["id"], county)
+                    elif "id" in child.attrib:
+                        members.setdefault(child.attrib["id"], child)
+            self._members[gid] = members
+
+    def _find(self, tag):
+        """
+        Find first element with id <tag> using the id index.
+
+        :param tag: id of element
+        :type tag: str
+
+        :return: element with id <tag>
+        :rtype: xml.etree.Element
+
+        :raises KeyError: if no element has id <tag>
+        """
+        return self._ids[tag]
+
+    @synchronized
+    def to_svg(self, scale=1.0):
+        self._project()
+        root = self._tree.getroot()
+        if scale == 1:
+            return self._writer.tobytes()
+        if scale <= 0:
+            raise ValueError("Scale cannot be 0 or less.")
+
+        # Scale through viewBox, then restore original size attributes (root start tag is never cached)
+        attrib = dict(root.attrib)
+        try:
+            root.attrib.setdefault("viewBox", "0 0 {w} {h}".format(w=self.mapwidth, h=self.mapheight))
+            root.attrib["width"] = str(self.mapwidth * scale)
+            root.attrib["height"] = str(self.mapheight * scale)
+            return self._writer.tobytes()
+        finally:
+            root.attrib.clear()
+            root.attrib.update(attrib)
+
     _parse_tag = staticmethod(lambda root, tag: root.findall(".//*[@id='{0}']".format(tag)))
     """
     Find list of element ids associated with 'tag' in 'root' using findall(...).\n
@@ -97,194 +695,494 @@ class MapperUS(Mapper):
     """
 
     @Mapper.mapheight.setter
+    @synchronized
     def mapheight(self, value):
         value = int(value)
         if value <= 0:
             raise ValueError("Map height cannot be 0 or less pixels.")
 
-        # Write height to file
-        tree = ET.parse(self.map)
-        root = tree.getroot()
+        # Write height to map
+        root = self._tree.getroot()
         t = root.find('.')
         t.attrib['height'] = str(value)
-        tree.write(self.map)
+        self._modified(t)
         self._mapheight = value
 
     @Mapper.mapwidth.setter
+    @synchronized
     def mapwidth(self, value):
         value = int(value)
         if value <= 0:
             raise ValueError("Map width cannot be 0 or less pixels.")
 
-        # Write width to file
-        tree = ET.parse(self.map)
-        root = tree.getroot()
+        # Write width to map
+        root = self._tree.getroot()
         t = root.find('.')
         t.attrib['width'] = str(value)
-        tree.write(self.map)
+        self._modified(t)
         self._mapwidth = value
 
-    def set_region_color(self, identifier, color):
-        tree = ET.parse(self.map)
-        root = tree.getroot()
+    def _regions(self):
+        """
+        Get index of this map's regions (states or counties).
+        Private method for MapperUS objects.
 
-        # Check in states list (if exists)
-        try:
-            states = MapperUS._parse_tag(root, self._cfg["ID_STATES"])[0]
-            for child in states:
-                if child.attrib["id"] == identifier:
-                    child.attrib["fill"] = "#{:06x}".format(color)
-                    tree.write(self.map)
-                    break
-
-            # Exit function
-            return
-        except IndexError as i:
-            pass
+        :return: dictionary of region identifier -> region element
+        :rtype: dict[str, xml.etree.Element]
+        """
+        for gid in (self._cfg.ID_STATES, self._cfg.ID_COUNTIES):
+            if gid in self._members:
+                return self._members[gid]
 
-        # Check in each of counties list (if exists)
-        try:
-            countieslist = MapperUS._parse_tag(root, self._cfg["ID_COUNTIES"])  # no [0], Multiple counties ids
-
-            # Searching by counties not tested. Raise NotImplementedError until further testing as been done.
-            raise NotImplementedError("Searching counties for US map not implemented this time.")
-            # TODO : Implement change_region_color for counties
-
-            # for counties in countieslist:
-            #     for child in counties:
-            #         if child.attrib["id"] == identifier:
-            #             child.attrib["fill"] = "#{:06x}".format(color)
-            #             tree.write(self.map)
-            #             break
-            #
-            #     # Exit function
-            #     return
-        except IndexError as i:
-            # No list found, should not happen
-            raise Exception("No state/counties list found.")
+        # No list found, should not happen
+        raise Exception("No state/counties list found.")
 
+    @staticmethod
+    def _check_color(identifier, color):
+        """
+        Check that <color> is a color in RGB hex (0x000000 to 0xffffff) before it is stored. Private static method
+        for MapperUS objects.
+
+        :param identifier: region the color is for (named in error)
+        :type identifier: str
+        :param color: color to check
+        :type color: int
+
+        :return:
+        :rtype: None
+
+        :raises ValueError: if color is out of range
+        """
+        if not 0 <= color <= 0xFFFFFF:
+            raise ValueError("Invalid color {0!r} for region '{1}'. Colors are RGB hex (0x000000 to 0xffffff).".format(
+                color, identifier))
+
+    @synchronized
+    def set_region_color(self, identifier, color):
+        k = self._store.position(identifier)
+        if k is not None:
+            self._check_color(identifier, color)
+        if k is not None and self._store.set_color(k, color):
+            self._unprojected[0].add(k)
+            self._modified(self._region_elements[k])
+
+    @synchronized
     def set_region_number(self, identifier, number, color=None):
-        tree = ET.parse(self.map)
-        root = tree.getroot()
+        # Numbers list may not exist (e.g. counties map)
+        k = self._store.position(identifier)
+        if k is not None and self._number_elements[k] is not None and self._store.set_number(k, int(number), color):
+            self._unprojected[1].add(k)
+            self._modified(self._number_elements[k])
 
-        # Check in states list (if exists)
-        try:
-            states = MapperUS._parse_tag(root, self._cfg["ID_NUMBERS"])[0]
-            for child in states:
-                if child.attrib["id"] == identifier:
-                    child.text = str(number)
-                    if color is not None:  # Change number color if given
-                        child.attrib["fill"] = "#{:06x}".format(color)
-                    tree.write(self.map)
-                    break
-
-            # Exit function
-            return
-        except IndexError as i:
-            pass
+    @synchronized
+    def set_region_colors(self, mapping):
+        store = self._store
+        unknown, changed = [], []
+        for identifier, color in mapping.items():  # Check all colors before changing any
+            if identifier in store:
+                self._check_color(identifier, color)
+        for identifier, color in mapping.items():
+            k = store.position(identifier)
+            if k is None:
+                unknown.append(identifier)
+            elif store.set_color(k, color):
+                self._unprojected[0].add(k)
+                changed.append(self._region_elements[k])
 
-        # Check in each of counties list (if exists)
-        try:
-            countieslist = MapperUS._parse_tag(root, self._cfg["ID_COUNTIES"])  # no [0], Multiple counties ids
-
-            # Searching by counties not tested. Raise NotImplementedError until further testing as been done.
-            raise NotImplementedError("Searching counties for US map not implemented this time.")
-            # TODO : Implement change_region_number for counties
-
-            # for counties in countieslist:
-            #     for child in counties:
-            #         if child.attrib["id"] == identifier:
-            #             child.attrib["fill"] = "#{:06x}".format(color)
-            #             tree.write(self.map)
-            #             break
-            #
-            #     # Exit function
-            #     return
-        except IndexError as i:
-            # No list found, should not happen
-            raise Exception("No state/counties list found.")
+        # Write once for whole mapping and exit function
+        if changed:
+            self._modified(*changed)
+        return unknown
+
+    @synchronized
+    def set_region_numbers(self, mapping):
+        # Numbers list may not exist (e.g. counties map)
+        store = self._store
+        unknown, changed = [], []
+        for identifier, (number, color) in mapping.items():
+            k = store.position(identifier)
+            if k is None or self._number_elements[k] is None:
+                unknown.append(identifier)
+            elif store.set_number(k, int(number), color):
+                self._unprojected[1].add(k)
+                changed.append(self._number_elements[k])
+
+        # Write once for whole mapping and exit function
+        if changed:
+            self._modified(*changed)
+        return unknown
+
+    @synchronized
+    def recolor_regions(self, old, new):
+        """
+        Change the color of all regions colored <old> to <new>. In class coloring mode (CLASS_COLORS), if the class of
+        <old> is also the name of <new> (see _style_names(...), e.g. a candidate's class), only its rule changes in the
+        stylesheet: no region element is changed or re-serialized. Otherwise regions move to the class of <new>.
+
+        :param old: color of regions in RGB hex (0x??????)
+        :type old: int
+        :param new: color to change to in RGB hex (0x??????)
+        :type new: int
+
+        :return: identifiers of recolored regions, in map order.
+        :rtype: list[str]
+        """
+        identifiers = self._store.regions_with(old)
+        if old == new or not identifiers:
+            return identifiers
+        self._check_color(identifiers[0], new)
+        if self._style is None:
+            self.set_region_colors(dict.fromkeys(identifiers, new))
+            return identifiers
+
+        positions = self._store.replace_color(old, new)
+        name = self._palette.pop(old, None)
+        changed = []
+        if name is not None:
+            del self._rules[name]
+            if new not in self._palette and self._style_names([new])[new] == name:
+                # Regions keep their class, which now stands for the new color
+                self._palette[new] = name
+                self._rules[name] = new
+            else:
+                # Class is named after the old color (or the new color has its own): move regions to the new class
+                self._unprojected[0].update(positions)
+                changed = [self._region_elements[k] for k in positions]
+        self._write_rules()
+        self._modified(self._style, *changed)
+        return identifiers
 
+    @synchronized
     def get_region_color(self, identifier):
-        tree = ET.parse(self.map)
-        root = tree.getroot()
+        k = self._store.position(identifier)
+        if k is not None:
+            return self._store.colors[k]
 
-        # Check in states list (if exists)
-        try:
-            states = MapperUS._parse_tag(root, self._cfg["ID_STATES"])[0]
-            for child in states:
-                if child.attrib["id"] == identifier:
-                    return int(child.attrib["fill"].lstrip("#"), 16)  # Convert from hex to int
+        # Return none if no region found with string matching <identifier>
+        return None
 
-            # Return none if no state found with string matching <identifier>
-            return None
-        except IndexError as i:
-            pass
+    @synchronized
+    def get_all_region_colors(self):
+        return dict(zip(self._store.ids, self._store.colors))
 
-        # Check in each of counties list (if exists)
-        try:
-            countieslist = MapperUS._parse_tag(root, self._cfg["ID_COUNTIES"])  # no [0], Multiple counties ids
-
-            # Searching by counties not tested. Raise NotImplementedError until further testing as been done.
-            raise NotImplementedError("Searching counties for US map not implemented this time.")
-            # TODO : Implement get_region_color for counties
-
-            # for counties in countieslist:
-            #     for child in counties:
-            #         if child.attrib["id"] == identifier:
-            #             return child.attrib["fill"]
-            #
-            # Return none if no county found with string matching <identifier>
-            # return None
-        except IndexError as i:
-            # No list found, should not happen
-            raise Exception("No state/counties list found.")
+    @synchronized
+    def get_color_regions(self, color):
+        """
+        Get list of regions colored with <color>, using the reverse color index of the region store.
 
+        :param color: color in RGB hex (0x??????)
+        :type color: int
+
+        :return: list of identifiers colored with <color>, in map order.
+        :rtype: list[str]
+        """
+        return self._store.regions_with(color)
+
+    @synchronized
+    def count_region_colors(self):
+        """
+        Count regions of each color.
+
+        :return: number of regions per color in RGB hex (0x??????), by ascending color.
+        :rtype: dict[int, int]
+        """
+        return self._store.count_colors()
+
+    def diff_regions(self, other):
+        """
+        Compare region colors and numbers with another map (e.g. two result snapshots of the same map type).
+        Only regions present in both maps are compared.
+
+        :param other: map to compare with
+        :type other: MapperUS
+
+        :return: identifiers of regions whose color, number or number color differ, in map order.
+        :rtype: list[str]
+        """
+        # Take one lock at a time: holding both could deadlock with other.diff_regions(self)
+        with other._lock:
+            theirs = other._store.copy()
+        with self._lock:
+            return self._store.diff(theirs)
+
+    @property
+    @synchronized
+    def regions(self):
+        """
+        :return: snapshot of the compact state of regions (see 'regions.py'). The copy is independent of this object:
+            change regions through set_region_*(...).
+        :rtype: mappers.regions.RegionStore
+        """
+        return self._store.copy()
+
+    @synchronized
     def get_region_number(self, identifier):
-        # Return number as an STRING
-        tree = ET.parse(self.map)
-        root = tree.getroot()
-
-        # Check in numbers list
-        numbers = MapperUS._parse_tag(root, self._cfg["ID_NUMBERS"])[0]
-        for child in numbers:
-            if child.attrib["id"] == identifier:
-                # If "text" has state abbrv. in it (e.g. VT 5), remove abbrv. and return
-                if child.text[0:2].isalpha():
-                    return str(child.text[3:].strip())
-                # No state abbrv. found, return number
-                else:
-                    return str(child.text)
-        # Return None if identifier not found
-        return None
+        # Return number as an STRING, None if region has no number
+        k = self._store.position(identifier)
+        if k is None or self._store.numbers[k] == NO_NUMBER:
+            return None
+        return str(self._store.numbers[k])
 
-    def get_region_list(self):
-        tree = ET.parse(self.map)
-        root = tree.getroot()
+    @synchronized
+    def get_region_geometry(self, identifier):
+        # Path data is only decoded here, templates keep it as raw bytes (see 'lazy.py')
+        child = self._regions().get(identifier)
+        if child is None or "d" not in child.attrib:
+            return None
+        return str(child.attrib["d"])
 
-        # Check for state list
-        # states = root.findall(".//*[@id='states']")[0]
-        try:
-            states = MapperUS._parse_tag(root, self._cfg["ID_STATES"])[0]
-            r = []
-            for x in states:
-                r.append(x.attrib["id"])
-            if r is not None:
-                return r
-        except IndexError as i:
-            pass
-
-        # Check each counties list
-        # counties = root.findall(".//*[@id='counties']")
-        try:
-            countieslist = MapperUS._parse_tag(root, self._cfg["ID_COUNTIES"])  # no [0], Multiple counties ids
-            r = []
-            for counties in countieslist:
-                for x in counties:
-                    r.append(x.attrib["id"])
-            if r is not None:
-                return r
-        except IndexError as i:
-            # No list found, should not happen
-            raise Exception("No state/counties list found.")
+    @synchronized
+    def get_region_bbox(self, identifier):
+        """
+        Get bounding box of region <identifier> in map coordinates (root user units, transforms applied).
+
+        :param identifier: identifier of region
+        :type identifier: str
+
+        :return: (x, y, width, height) of region, None if region not found or without geometry.
+        :rtype: None | (float, float, float, float)
+        """
+        k = self._store.position(identifier)
+        box = self._geometry().boxes[k] if k is not None else None
+        if box is None:
+            return None
+        return box[0], box[1], box[2] - box[0], box[3] - box[1]
+
+    @synchronized
+    def get_region_at(self, x, y):
+        """
+        Hit-test the map: find the region drawn at point (<x>, <y>) in map coordinates (e.g. a click).
+
+        :param x: x of point
+        :type x: float
+        :param y: y of point
+        :type y: float
+
+        :return: identifier of topmost region at point, None if there is none.
+        :rtype: None | str
+
+        :raises RuntimeError: if numpy is not installed
+        """
+        k = self._geometry().hit(float(x), float(y))
+        return self._store.ids[k] if k is not None else None
+
+    @synchronized
+    def get_regions_in(self, x, y, width, height):
+        """
+        Get regions whose bounding boxes overlap a rectangle in map coordinates (e.g. a dirty rectangle to redraw).
+
+        :param x: x of rectangle
+        :type x: float
+        :param y: y of rectangle
+        :type y: float
+        :param width: width of rectangle
+        :type width: float
+        :param height: height of rectangle
+        :type height: float
+
+        :return: identifiers of regions, in map order
+        :rtype: list[str]
+        """
+        ids = self._store.ids
+        return [ids[k] for k in self._geometry().index.query((x, y, x + width, y + height))]
+
+    @synchronized
+    def get_region_label_point(self, identifier):
+        """
+        Get a point of region <identifier> to place a label at, in map coordinates. The region is drawn at that point,
+        not covered by another one (see geometry.MapGeometry.label_point(...)).
+
+        :param identifier: identifier of region
+        :type identifier: str
+
+        :return: (x, y) of label, None if region not found or without geometry.
+        :rtype: None | (float, float)
+
+        :raises RuntimeError: if numpy is not installed
+        """
+        k = self._store.position(identifier)
+        return self._geometry().label_point(k) if k is not None else None
+
+    def _geometry(self):
+        """
+        Get geometry of regions and numbers by region position: path data is parsed and transformed once per
+        template, since geometry and transforms of regions never change.
+        Private method for MapperUS objects.
+
+        :return: geometry of map
+        :rtype: mappers.geometry.MapGeometry
+        """
+        geometry = MapperUS._geometries.get(self._key)
+        if geometry is None:
+            with self._lock:
+                parents = ancestors(self._tree.getroot())
+                matrices = {}
+                paths = [(str(element.attrib["d"]), ctm(element, parents, matrices))
+                         if "d" in element.attrib else None for element in self._region_elements]
+                numbers = []
+                for element in self._number_elements:
+                    if element is None:
+                        numbers.append(None)
+                        continue
+                    size, parent = None, element
+                    while size is None and parent is not None:  # Inherited font size
+                        size, parent = parent.attrib.get("font-size"), parents.get(parent)
+                    numbers.append(text_bbox(float(element.attrib.get("x", 0)), float(element.attrib.get("y", 0)), 6,
+                                             float(str(size or 16).rstrip("px")), ctm(element, parents, matrices)))
+                geometry = self._cache_put(MapperUS._geometries, self._key, self._key, MapGeometry(paths, numbers))
+        return geometry
+
+    @synchronized
+    def _snapshot(self):
+        """
+        Get the serialized map and its state, for incremental exporters (see 'tiles.py').
+        Private method for MapperUS objects.
+
+        :return: SVG document, copy of region store, serialized elements other than regions and numbers (chrome),
+            width and height in pixels, function converting boxes from map coordinates to pixels
+        :rtype: (bytes, mappers.regions.RegionStore, list, int, int, function)
+        """
+        doc = self.to_svg()
+        root = self._tree.getroot()
+
+        # Top-level elements holding regions or numbers
+        parents = ancestors(root)
+        containers = set()
+        for element in self._region_elements + self._number_elements:
+            while element is not None and parents.get(element) is not root:
+                element = parents.get(element)
+            containers.add(element)
+        chrome = [sorted(root.attrib.items())]
+        chrome += [None if child in containers else self._writer.fragment(child) for child in root]
+
+        # Map coordinates -> pixels (root viewBox, if any)
+        width, height = self.mapwidth, self.mapheight
+        vx, vy, vw, vh = [float(v) for v in root.attrib.get("viewBox", "0 0 {0} {1}".format(width, height))
+                          .replace(",", " ").split()]
+        sx, sy = width / vw, height / vh
+
+        def to_pixels(box):
+            return (box[0] - vx) * sx, (box[1] - vy) * sy, (box[2] - vx) * sx, (box[3] - vy) * sy
+        return doc, self._store.copy(), chrome, width, height, to_pixels
+
+    def export_tiles(self, directory, zooms=(0, 1, 2, 3), format="png", size=256, backend=None, full=False):
+        """
+        Export the map as a z/x/y tile pyramid for zoomable web maps (see 'tiles.py'). Repeated exports with the same
+        parameters only render the tiles overlapping regions changed since the previous one. The map is only locked
+        while its SVG is taken, not while tiles are rendered.
+
+        :param directory: root directory of tiles ('<directory>/<z>/<x>/<y>.<format>')
+        :type directory: str
+        :param zooms: zoom levels to export (2^z tiles across the longer side of the map)
+        :type zooms: collections.Iterable[int]
+        :param format: "png" | "jpg" | "webp"
+        :type format: str
+        :param size: width and height of tiles in pixels
+        :type size: int
+        :param backend: name of rasterizer backend to use. If None, first available one.
+        :type backend: None | str
+        :param full: If True, render all tiles.
+        :type full: bool
+
+        :return: rendered tiles as (z, x, y)
+        :rtype: list[(int, int, int)]
+        """
+        zooms = tuple(zooms)
+        key = (path.abspath(directory), zooms, format, size, backend)
+        with self._lock:
+            if self._tile_pyramids is None:
+                self._tile_pyramids = {}
+            pyramid = self._tile_pyramids.get(key)
+            if pyramid is None:
+                pyramid = self._tile_pyramids[key] = TilePyramid(self, directory, zooms, format, size, backend)
+        return pyramid.export(full)
+
+    def export_compact(self, dest=None, tolerance=None, decimals=1, classes=True, encoding=None):
+        """
+        Export the map as a compact SVG document for serving to many clients (see 'compact.py'). The map itself is
+        not changed.
+
+        :param dest: filepath or writable binary file object to write document to. If None, document is only returned.
+        :type dest: None | str | io.BufferedIOBase
+        :param tolerance: simplify region paths, dropping vertices closer than <tolerance> map units to the simplified
+            outline (0 only rounds them). If None, paths are written as they are.
+        :type tolerance: None | float
+        :param decimals: decimal places of simplified path coordinates
+        :type decimals: int
+        :param classes: If True, collapse fill colors shared by several elements into CSS classes.
+        :type classes: bool
+        :param encoding: precompress document, "gzip" | "br". If None, not compressed.
+        :type encoding: None | str
+
+        :return: document bytes
+        :rtype: bytes
+
+        :raises RuntimeError: if <tolerance> is given and numpy is not installed, or encoding is "br" and brotli is not
+            installed
+        """
+        paths = self._simplified_paths(float(tolerance), int(decimals)) if tolerance is not None else None
+        with self._lock:
+            self._project()
+            root = self._tree.getroot()
+            copy = copy_tree(root)
+            copies = dict(zip(root.iter(), copy.iter()))
+            if paths is not None:
+                for element, d in zip(self._region_elements, paths):
+                    if d is not None:
+                        copies[element].attrib["d"] = d
+            strip_whitespace(copy)
+            if classes:
+                style = ET.Element("{{{0}}}style".format(self._cfg.NAMESPACE))
+                if collapse_fills(copy, self._style_names, style):
+                    copy.insert(0, style)
+        data = SVGWriter(copy, {self._cfg.NAMESPACE: ""}).tobytes()
+        return self._write_dest(compress(data, encoding), dest)
+
+    def _simplified_paths(self, tolerance, decimals):
+        """
+        Get simplified path data of regions by region position, from the process-wide cache. Tolerance is converted to
+        the units of each path (e.g. Alaska is drawn scaled down). Private method for MapperUS objects.
+
+        :param tolerance: tolerance in map units (see export_compact(...))
+        :type tolerance: float
+        :param decimals: decimal places of coordinates
+        :type decimals: int
+
+        :return: path data of each region, None if region has no geometry
+        :rtype: tuple[None | str]
+        """
+        key = (self._key, tolerance, decimals)
+        paths = MapperUS._simplified.get(key)
+        if paths is None:
+            with self._lock:
+                parents = ancestors(self._tree.getroot())
+                matrices = {}
+                paths = []
+                for element in self._region_elements:
+                    if "d" not in element.attrib:
+                        paths.append(None)
+                        continue
+                    a, b, c, d = ctm(element, parents, matrices)[0:4]
+                    scale = abs(a * d - b * c) ** 0.5 or 1.0
+                    paths.append(simplify_path(str(element.attrib["d"]), tolerance / scale, decimals))
+            paths = self._cache_put(MapperUS._simplified, key, self._key, tuple(paths))
+        return paths
+
+    def _style_names(self, colors):
+        """
+        Name the CSS classes of fill colors <colors> in compact exports (see export_compact(...)). Subclasses may name
+        colors after what they stand for. Private method for MapperUS objects.
+
+        :param colors: colors in RGB hex (0x??????), ascending
+        :type colors: list[int]
+
+        :return: class name by color
+        :rtype: dict[int, str]
+        """
+        return {color: "f{0:06x}".format(color) for color in colors}
+
+    @synchronized
+    def get_region_list(self):
+        return list(self._regions())
 
 # END OF FILE ////////////////////////////////////////////////////////////
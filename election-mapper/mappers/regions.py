@@ -0,0 +1,267 @@
+"""
+This module holds the compact region state model of mapper objects.
+
+A map's regions (states or counties) are numbered in map order. Their fill colors, electoral numbers and number colors
+are held in flat arrays of ints indexed by region position, rather than as "#rrggbb" strings inside xml attributes.
+MapperUS edits and queries this store and only projects changed regions into its xml tree when the map is serialized,
+so lookups never parse attribute strings and bulk queries (colors in use, differences between two maps) run over the
+arrays - vectorized if 'numpy' is installed.
+
+Attribs:
+    NO_NUMBER (int) - Number of a region without a number element\n
+    NO_COLOR (int) - Number color of a region whose number has no fill attribute
+
+Classes:
+    RegionStore: Region identifiers, colors and numbers of a map.
+"""
+# --- External Imports --- #
+from array import array
+from collections import Counter
+try:
+    import numpy as np
+except ImportError:  # Optional, only speeds up bulk queries
+    np = None
+
+# Global parameters
+NO_NUMBER = -0x80000000
+NO_COLOR = -1
+
+_TYPECODES = {"colors": ("I", "uint32"), "numbers": ("i", "int32"), "number_colors": ("i", "int32")}
+
+
+class RegionStore:
+    """
+    Region identifiers, colors and numbers of a map, indexed by region position (map order):
+        * ids - identifier of each region\n
+        * index - position of each identifier\n
+        * colors - fill color in RGB hex (0x??????), array('I')\n
+        * numbers - electoral number (NO_NUMBER if none), array('i')\n
+        * number_colors - fill color of number (NO_COLOR if unset), array('i')
+
+    Stores of maps built from the same template share their (immutable) ids and index.
+    """
+
+    __slots__ = ("ids", "index", "colors", "numbers", "number_colors", "_by_color")
+
+    def __init__(self, ids, colors, numbers=None, number_colors=None, index=None):
+        """
+        Constructor method for RegionStore.
+
+        :param ids: identifier of each region
+        :type ids: tuple[str]
+        :param colors: fill color of each region
+        :type colors: collections.Iterable[int]
+        :param numbers: number of each region. If None, no region has a number.
+        :type numbers: None | collections.Iterable[int]
+        :param number_colors: number color of each region. If None, all are NO_COLOR.
+        :type number_colors: None | collections.Iterable[int]
+        :param index: position of each identifier, if already known
+        :type index: None | dict[str, int]
+        """
+        n = len(ids)
+        self.ids = tuple(ids)
+        self.index = {identifier: k for k, identifier in enumerate(self.ids)} if index is None else index
+        self.colors = array("I", colors)
+        self.numbers = array("i", numbers) if numbers is not None else array("i", [NO_NUMBER]) * n
+        self.number_colors = array("i", number_colors) if number_colors is not None else array("i", [NO_COLOR]) * n
+        self._by_color = None  # Reverse index color -> set of positions, built on first use
+        if not len(self.colors) == len(self.numbers) == len(self.number_colors) == n:
+            raise ValueError("Need one color, number and number color per region.")
+
+    @classmethod
+    def from_elements(cls, regions, numbers=None):
+        """
+        Read region state from xml elements.
+
+        :param regions: region elements by identifier, in map order (e.g. <path id="TX" fill="#C0C0C0" .../>)
+        :type regions: dict[str, xml.etree.Element]
+        :param numbers: number elements by region identifier (e.g. <text id="VT">VT 3</text>)
+        :type numbers: None | dict[str, xml.etree.Element]
+
+        :return: region state
+        :rtype: RegionStore
+        """
+        numbers = numbers or {}
+        values, fills = [], []
+        for identifier in regions:
+            element = numbers.get(identifier)
+            values.append(_parse_number(element.text) if element is not None else NO_NUMBER)
+            fill = element.attrib.get("fill", "") if element is not None else ""
+            fills.append(int(fill.lstrip("#"), 16) if fill.startswith("#") else NO_COLOR)
+        colors = (int(element.attrib["fill"].lstrip("#"), 16) for element in regions.values())
+        return cls(tuple(regions), colors, values, fills)
+
+    def copy(self):
+        """
+        :return: independent copy of this store (sharing ids and index).
+        :rtype: RegionStore
+        """
+        return RegionStore(self.ids, self.colors, self.numbers, self.number_colors, self.index)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, identifier):
+        return identifier in self.index
+
+    def position(self, identifier):
+        """
+        :return: position of region <identifier>, None if not a region.
+        :rtype: None | int
+        """
+        return self.index.get(identifier)
+
+    def set_color(self, k, color):
+        """
+        Set fill color of region at position <k>, keeping the reverse color index up to date.
+
+        :param k: position of region
+        :type k: int
+        :param color: color in RGB hex (0x??????)
+        :type color: int
+
+        :return: True if the color changed
+        :rtype: bool
+        """
+        old = self.colors[k]
+        if old == color:
+            return False
+        self.colors[k] = color
+        if self._by_color is not None:
+            self._by_color[old].discard(k)
+            self._by_color.setdefault(color, set()).add(k)
+        return True
+
+    def replace_color(self, old, new):
+        """
+        Change the fill color of all regions colored <old> to <new>, keeping the reverse color index up to date.
+
+        :param old: color to replace in RGB hex (0x??????)
+        :type old: int
+        :param new: new color in RGB hex (0x??????)
+        :type new: int
+
+        :return: positions of recolored regions, ascending
+        :rtype: list[int]
+        """
+        if old == new:
+            return []
+        self.regions_with(old)  # Build reverse index
+        positions = sorted(self._by_color.pop(old, ()))
+        colors = self.colors
+        for k in positions:
+            colors[k] = new
+        self._by_color.setdefault(new, set()).update(positions)
+        return positions
+
+    def set_number(self, k, number, color=None):
+        """
+        Set number (and number color, if given) of region at position <k>.
+
+        :param k: position of region
+        :type k: int
+        :param number: number of region
+        :type number: int
+        :param color: color of number in RGB hex (0x??????). If None, unchanged.
+        :type color: None | int
+
+        :return: True if number or number color changed
+        :rtype: bool
+        """
+        changed = self.numbers[k] != number
+        self.numbers[k] = number
+        if color is not None and self.number_colors[k] != color:
+            self.number_colors[k] = color
+            changed = True
+        return changed
+
+    def regions_with(self, color):
+        """
+        :return: identifiers of regions colored <color>, in map order.
+        :rtype: list[str]
+        """
+        if self._by_color is None:
+            self._by_color = {}
+            for k, c in enumerate(self.colors):
+                self._by_color.setdefault(c, set()).add(k)
+        ids = self.ids
+        return [ids[k] for k in sorted(self._by_color.get(color, ()))]
+
+    def count_colors(self):
+        """
+        :return: number of regions per fill color, by ascending color.
+        :rtype: dict[int, int]
+        """
+        if np is not None:
+            colors, counts = np.unique(self.view("colors"), return_counts=True)
+            return dict(zip(colors.tolist(), counts.tolist()))
+        return dict(sorted(Counter(self.colors).items()))
+
+    def diff(self, other):
+        """
+        Compare with the state of another map. Only regions present in both maps are compared.
+
+        :param other: state of other map
+        :type other: RegionStore
+
+        :return: identifiers of regions whose color, number or number color differ, in map order
+        :rtype: list[str]
+        """
+        if other.ids == self.ids:
+            # Same regions in the same order: compare arrays as they are
+            if np is not None:
+                differ = np.zeros(len(self), dtype=bool)
+                for name in _TYPECODES:
+                    differ |= self.view(name) != other.view(name)
+                return [self.ids[k] for k in np.flatnonzero(differ).tolist()]
+            return [identifier for identifier, a, b, c, d, e, f in zip(
+                self.ids, self.colors, other.colors, self.numbers, other.numbers,
+                self.number_colors, other.number_colors) if a != b or c != d or e != f]
+
+        result = []
+        for k, identifier in enumerate(self.ids):
+            j = other.index.get(identifier)
+            if j is not None and (self.colors[k], self.numbers[k], self.number_colors[k]) != \
+                    (other.colors[j], other.numbers[j], other.number_colors[j]):
+                result.append(identifier)
+        return result
+
+    def view(self, name):
+        """
+        Get a read-only NumPy view (no copy) of array <name>.
+
+        :param name: "colors" | "numbers" | "number_colors"
+        :type name: str
+
+        :return: view of array
+        :rtype: numpy.ndarray
+
+        :raises RuntimeError: if numpy is not installed
+        """
+        if np is None:
+            raise RuntimeError("Array views require 'numpy'. Install it with 'pip install numpy'.")
+        data = getattr(self, name)
+        view = np.frombuffer(data, dtype=_TYPECODES[name][1]) if len(data) else np.empty(0, _TYPECODES[name][1])
+        view.flags.writeable = False
+        return view
+
+
+def _parse_number(text):
+    """
+    Parse text of a number element, with or without state abbreviation (e.g. "VT 3" or "3").
+
+    :param text: text of number element
+    :type text: None | str
+
+    :return: number, NO_NUMBER if text holds no number
+    :rtype: int
+    """
+    text = (text or "").strip()
+    if text[0:2].isalpha():
+        text = text[3:].strip()
+    try:
+        return int(text)
+    except ValueError:
+        return NO_NUMBER
+
+# END OF FILE ////////////////////////////////////////////////////////////
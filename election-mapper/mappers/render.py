@@ -0,0 +1,211 @@
+"""
+This module holds the rasterizer backends used to turn SVG maps into PNG | JPG | WebP images.
+
+Backends are tried in order of registration. The default ones are:
+    * "cairosvg" - in-process rasterizer, used if the 'cairosvg' package is installed. JPG and WebP output also
+      require 'Pillow' (PNG is converted in memory).\n
+    * "imagemagick" - fallback that pipes the SVG through an ImageMagick subprocess (stdin -> stdout, no temp files).
+
+More backends can be added with register_backend(...).
+
+Functions:
+    register_backend(name, formats, func, available=None, first=False): Add a rasterizer backend.\n
+    available_backends(fmt=None): Get names of usable backends.\n
+    render(svg, fmt="png", scale=1.0, backend=None): Render SVG bytes to image bytes.
+"""
+# --- External Imports --- #
+from functools import lru_cache
+from io import BytesIO
+from shutil import which
+import subprocess
+
+FORMATS = ("svg", "png", "jpg", "webp")
+"""
+Output formats understood by render(...). "jpeg" is accepted as an alias of "jpg".
+:type: tuple[str]
+"""
+
+_backends = []
+"""
+Registered backends in order of preference, as (name, formats, func, available) tuples.
+:type: list[(str, tuple[str], function, function)]
+"""
+
+
+def register_backend(name, formats, func, available=None, first=False):
+    """
+    Register a rasterizer backend.
+
+    :param name: unique name of backend
+    :type name: str
+    :param formats: image formats the backend can produce (e.g. ("png", "jpg"))
+    :type formats: tuple[str]
+    :param func: function(svg, fmt, scale) -> bytes rendering <svg> bytes to image bytes of format <fmt>
+    :type func: function
+    :param available: function(fmt) -> bool telling if backend can currently produce image format <fmt> (e.g.
+        required package installed). If None, always.
+    :type available: None | function
+    :param first: If True, prefer this backend over all previously registered ones.
+    :type first: bool
+
+    :return:
+    :rtype: None
+    """
+    unregister_backend(name)
+    entry = (name, tuple(formats), func, available or (lambda fmt: True))
+    if first:
+        _backends.insert(0, entry)
+    else:
+        _backends.append(entry)
+
+
+def unregister_backend(name):
+    """
+    Remove backend <name> (if registered).
+
+    :param name: name of backend
+    :type name: str
+
+    :return:
+    :rtype: None
+    """
+    _backends[:] = [b for b in _backends if b[0] != name]
+
+
+def available_backends(fmt=None):
+    """
+    Get names of backends that can currently be used, in order of preference.
+
+    :param fmt: If given, only backends producing image format <fmt>.
+    :type fmt: None | str
+
+    :return: list of backend names
+    :rtype: list[str]
+    """
+    fmt = _format(fmt) if fmt is not None else None
+    return [name for name, formats, func, available in _backends
+            if any(f in formats and available(f) for f in ([fmt] if fmt is not None else formats))]
+
+
+def render(svg, fmt="png", scale=1.0, backend=None):
+    """
+    Render <svg> bytes to an image.
+
+    :param svg: SVG document
+    :type svg: bytes
+    :param fmt: "svg" | "png" | "jpg" | "webp"
+    :type fmt: str
+    :param scale: scale factor of output image relative to the SVG's width and height
+    :type scale: float
+    :param backend: name of backend to use. If None, first available backend supporting <fmt>.
+    :type backend: None | str
+
+    :return: image bytes
+    :rtype: bytes
+
+    :raises ValueError: if <fmt> or <backend> is unknown
+    :raises RuntimeError: if no backend is available for <fmt>
+    """
+    fmt = _format(fmt)
+    if scale <= 0:
+        raise ValueError("Scale cannot be 0 or less.")
+    if fmt == "svg":
+        return svg
+
+    for name, formats, func, available in _backends:
+        if backend is not None and name != backend:
+            continue
+        if fmt in formats and available(fmt):
+            return func(svg, fmt, scale)
+
+    if backend is not None and backend not in [b[0] for b in _backends]:
+        raise ValueError("Unknown render backend '{0}'.".format(backend))
+    raise RuntimeError(
+        "No render backend available for '{0}'. Install 'cairosvg' (and 'Pillow' for jpg) or ImageMagick.".format(fmt)
+    )
+
+
+def _format(fmt):
+    """
+    Normalize and check image format <fmt>.
+
+    :param fmt: image format
+    :type fmt: str
+
+    :return: normalized format
+    :rtype: str
+    """
+    fmt = str(fmt).lower().lstrip(".")
+    fmt = "jpg" if fmt == "jpeg" else fmt
+    if fmt not in FORMATS:
+        raise ValueError("Invalid format '{0}'. Choose one of {1}.".format(fmt, ", ".join(FORMATS)))
+    return fmt
+
+
+# ------------------------------- CairoSVG (in-process) ------------------------------- #
+
+@lru_cache(maxsize=None)
+def _cairosvg_available():
+    try:
+        import cairosvg
+    except (ImportError, OSError):  # OSError: package installed but cairo library missing
+        return False
+    return True
+
+
+@lru_cache(maxsize=None)
+def _pillow_available():
+    try:
+        import PIL.Image
+    except ImportError:
+        return False
+    return True
+
+
+def _render_cairosvg(svg, fmt, scale):
+    import cairosvg
+    png = cairosvg.svg2png(bytestring=svg, scale=scale)
+    if fmt == "png":
+        return png
+
+    from PIL import Image
+    image = Image.open(BytesIO(png)).convert("RGBA")
+    if fmt == "webp":
+        out = BytesIO()
+        image.save(out, format="WEBP", lossless=True)
+        return out.getvalue()
+
+    # JPG has no alpha channel; flatten PNG onto white background
+    flat = Image.new("RGB", image.size, (255, 255, 255))
+    flat.paste(image, mask=image.split()[3])
+    out = BytesIO()
+    flat.save(out, format="JPEG", quality=95)
+    return out.getvalue()
+
+
+# ------------------------------- ImageMagick (subprocess) ------------------------------- #
+
+def _imagemagick():
+    """
+    :return: ImageMagick executable ("magick" for v7, "convert" for v6) or None if not installed.
+    :rtype: None | str
+    """
+    return which("magick") or which("convert")
+
+
+def _render_imagemagick(svg, fmt, scale):
+    # 96 dpi is the SVG user unit; density scales the rasterized output
+    cmd = [_imagemagick(), "-density", str(96 * scale), "-background", "white" if fmt == "jpg" else "none",
+           "svg:-", "{0}:-".format(fmt)]
+    proc = subprocess.run(cmd, input=svg, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        raise RuntimeError("ImageMagick failed. MSG: {0}".format(proc.stderr.decode(errors="replace").strip()))
+    return proc.stdout
+
+
+register_backend("cairosvg", ("png", "jpg", "webp"), _render_cairosvg,
+                 available=lambda fmt: _cairosvg_available() and (fmt == "png" or _pillow_available()))
+register_backend("imagemagick", ("png", "jpg", "webp"), _render_imagemagick,
+                 available=lambda fmt: _imagemagick() is not None)
+
+# END OF FILE ////////////////////////////////////////////////////////////
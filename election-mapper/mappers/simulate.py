@@ -0,0 +1,230 @@
+"""
+This module holds a Monte Carlo simulator of election scenarios producing win probabilities and electoral vote
+distributions, and drawing them as probability-shaded ElectionUS maps.
+
+Each region's vote share of each candidate is normal with a given mean and variance. Regional errors may be correlated
+across regions through a correlation matrix (applied to every candidate). Scenarios are sampled in chunks to bound
+memory and tallied with mappers.tally.Tally; chunks are spread over a pool of worker processes for large numbers of
+scenarios. Every chunk has its own random stream spawned from one seed, so results do not depend on the number of
+workers.
+
+Requires 'numpy'.
+
+Attribs:
+    CHUNK (int) - Default number of scenarios sampled at once\n
+    PROB_THRESHOLDS (tuple[float]) - Default win probability thresholds between shading tiers
+
+Classes:
+    Simulation: Aggregated results of a simulation.
+
+Functions:
+    simulate(mean, var, ev, n=100000, corr=None, chunk=CHUNK, workers=None, seed=None): Run a simulation.\n
+    apply_simulation(election, candidates, result, regions=None, thresholds=PROB_THRESHOLDS, title=None, bar=True):
+    Draw a simulation on an ElectionUS map.
+"""
+# --- Internal Imports --- #
+from mappers.tally import Tally, palette
+# --- External Imports --- #
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+import os
+try:
+    import numpy as np
+except ImportError:  # Only required by this module
+    np = None
+
+# Global parameters
+CHUNK = 20000
+PROB_THRESHOLDS = (0.6, 0.8)
+
+
+class Simulation:
+    """
+    Aggregated results of a simulation of <n> scenarios over R regions and C candidates:
+        * wins (R, C) - number of scenarios each candidate wins each region\n
+        * ev_hist (C, total + 1) - number of scenarios each candidate wins 0 ... total electoral votes\n
+        * majority (C) - number of scenarios each candidate wins more than half of all electoral votes\n
+        * seconds - wall time of simulation
+    """
+
+    __slots__ = ("n", "wins", "ev_hist", "majority", "seconds")
+
+    def __init__(self, n, wins, ev_hist, majority, seconds):
+        self.n = n  # type: int
+        self.wins = wins  # type: numpy.ndarray
+        self.ev_hist = ev_hist  # type: numpy.ndarray
+        self.majority = majority  # type: numpy.ndarray
+        self.seconds = seconds  # type: float
+
+    @property
+    def win_prob(self):
+        """
+        :return: probability of each candidate winning each region, shape (regions, candidates).
+        :rtype: numpy.ndarray
+        """
+        return self.wins / self.n
+
+    @property
+    def majority_prob(self):
+        """
+        :return: probability of each candidate winning more than half of all electoral votes.
+        :rtype: numpy.ndarray
+        """
+        return self.majority / self.n
+
+    @property
+    def ev_mean(self):
+        """
+        :return: expected electoral votes of each candidate.
+        :rtype: numpy.ndarray
+        """
+        return self.ev_hist @ np.arange(self.ev_hist.shape[1]) / self.n
+
+    @property
+    def throughput(self):
+        """
+        :return: simulated scenarios per second.
+        :rtype: float
+        """
+        return self.n / self.seconds if self.seconds > 0 else float("inf")
+
+
+def simulate(mean, var, ev, n=100000, corr=None, chunk=CHUNK, workers=None, seed=None):
+    """
+    Simulate <n> election scenarios.
+
+    :param mean: mean vote share of shape (regions, candidates)
+    :type mean: numpy.ndarray | list
+    :param var: variance of vote share, same shape as <mean>
+    :type var: numpy.ndarray | list
+    :param ev: electoral votes by region (see mappers.tally.electoral_votes(...))
+    :type ev: numpy.ndarray | list[int]
+    :param n: number of scenarios
+    :type n: int
+    :param corr: correlation matrix of regional errors, shape (regions, regions). If None, uncorrelated.
+    :type corr: None | numpy.ndarray
+    :param chunk: number of scenarios sampled at once (memory ~ chunk x regions x candidates x 16 bytes)
+    :type chunk: int
+    :param workers: number of worker processes. If None, number of CPUs. If 1 or less (or a single chunk), simulate
+        in this process.
+    :type workers: None | int
+    :param seed: seed of random streams. If None, fresh entropy.
+    :type seed: None | int
+
+    :return: aggregated results
+    :rtype: Simulation
+    """
+    if np is None:
+        raise RuntimeError("Simulating requires 'numpy'. Install it with 'pip install numpy'.")
+    start = perf_counter()
+    mean = np.asarray(mean, dtype=np.float64)
+    sd = np.sqrt(np.asarray(var, dtype=np.float64))
+    ev = np.asarray(ev, dtype=np.int64)
+    if mean.ndim != 2 or sd.shape != mean.shape or ev.shape != mean.shape[:1]:
+        raise ValueError("Need mean and var of shape (regions, candidates) and ev of shape (regions,).")
+    if n <= 0 or chunk <= 0:
+        raise ValueError("Number of scenarios and chunk size cannot be 0 or less.")
+
+    # Cholesky factor of regional correlation
+    factor = None
+    if corr is not None:
+        corr = np.asarray(corr, dtype=np.float64)
+        if corr.shape != (mean.shape[0],) * 2:
+            raise ValueError("Need correlation matrix of shape ({0}, {0}).".format(mean.shape[0]))
+        try:
+            factor = np.linalg.cholesky(corr)
+        except np.linalg.LinAlgError:
+            raise ValueError("Correlation matrix is not positive definite.")
+
+    # One task (size + independent random stream) per chunk
+    sizes = [chunk] * (n // chunk) + ([n % chunk] if n % chunk else [])
+    streams = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(size, stream, mean, sd, factor, ev) for size, stream in zip(sizes, streams)]
+
+    workers = (os.cpu_count() or 1) if workers is None else int(workers)
+    if workers <= 1 or len(tasks) == 1:
+        parts = [_simulate_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            parts = list(pool.map(_simulate_chunk, tasks))
+
+    # Sum chunk aggregates
+    wins, ev_hist, majority = (sum(part[k] for part in parts) for k in range(3))
+    return Simulation(n, wins, ev_hist, majority, perf_counter() - start)
+
+
+def _simulate_chunk(task):
+    """
+    Sample and tally one chunk of scenarios (runs in worker processes).
+
+    :param task: (size, random stream, mean, standard deviation, Cholesky factor | None, electoral votes)
+    :type task: tuple
+
+    :return: region wins (R, C), electoral vote histogram (C, total + 1), majority wins (C)
+    :rtype: (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+    """
+    size, stream, mean, sd, factor, ev = task
+    rng = np.random.default_rng(stream)
+    nreg, ncand = mean.shape
+
+    # Standard normal errors of shape (size, candidates, regions), correlated across regions
+    z = rng.standard_normal((size, ncand, nreg))
+    if factor is not None:
+        z = z @ factor.T
+    shares = mean + z.transpose(0, 2, 1) * sd
+
+    tally = Tally(shares, ev)
+    total = int(ev.sum())
+    wins = np.stack([(tally.winners == k).sum(axis=0) for k in range(ncand)], axis=1)
+    ev_hist = np.stack([np.bincount(tally.ev_totals[:, k], minlength=total + 1) for k in range(ncand)])
+    majority = (tally.ev_totals * 2 > total).sum(axis=0)
+    return wins, ev_hist, majority
+
+
+def apply_simulation(election, candidates, result, regions=None, thresholds=PROB_THRESHOLDS, title=None, bar=True):
+    """
+    Draw <result> on <election> in one batch: each region is shaded in the colors of its most likely winner by win
+    probability, candidates show their expected electoral votes and (optionally) the vote bar.
+
+    :param election: map to draw results on
+    :type election: mappers.electionUS.ElectionUS
+    :param candidates: (name, party) per candidate of simulation. <party>: see mappers.tally.palette(...)
+    :type candidates: list[(str, str | int)]
+    :param result: simulation results
+    :type result: Simulation
+    :param regions: region identifier per region of simulation. If None, all regions of the map in map order.
+    :type regions: None | list[str]
+    :param thresholds: ascending win probability thresholds between shading tiers
+    :type thresholds: tuple[float]
+    :param title: If given, set title of map.
+    :type title: None | str
+    :param bar: If True, set vote bar to candidates' expected electoral votes.
+    :type bar: bool
+
+    :return: change-set of the map (see ElectionUS.apply_update(...))
+    :rtype: dict
+    """
+    regions = election.get_region_list() if regions is None else list(regions)
+    prob = result.win_prob
+    if prob.shape != (len(regions), len(candidates)):
+        raise ValueError("Need a simulation of {0} regions and {1} candidates.".format(len(regions), len(candidates)))
+
+    table = palette([party for _, party in candidates], len(thresholds) + 1)
+    leader = prob.argmax(axis=1)
+    tiers = np.searchsorted(np.asarray(thresholds), prob.max(axis=1), side="right")
+    ev_mean = np.rint(result.ev_mean).astype(np.int64).tolist()
+
+    delta = {
+        "colors": dict(zip(regions, table[leader, tiers].tolist())),
+        "votes": {name: ev for (name, _), ev in zip(candidates, ev_mean)},
+    }
+    if title is not None:
+        delta["title"] = title
+    if bar:
+        data = {k: [name, int(table[k, -1]), ev] for k, ((name, _), ev) in enumerate(zip(candidates, ev_mean))}
+        data["total"] = max(result.ev_hist.shape[1] - 1, sum(ev_mean), 1)
+        data["tri"] = None
+        delta["bar"] = data
+    return election.apply_update(delta)
+
+# END OF FILE ////////////////////////////////////////////////////////////
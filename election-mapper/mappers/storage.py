@@ -0,0 +1,191 @@
+"""
+This module holds the storage backends a mapper writes its working copy of the *.svg map ('mapfile') to.
+
+Storages:
+    * MemoryStorage - keeps the mapfile in a BytesIO buffer; nothing touches the disk.\n
+    * TempStorage - unique temporary file in a configurable directory (e.g. "/dev/shm" for tmpfs), created on first
+      write and deleted on close().\n
+    * FileStorage - explicit user filepath; never deleted.
+
+Storages are released deterministically with close() (or a 'with' block on the mapper). TempStorage files left
+open are still removed when the storage is garbage collected or the interpreter exits.
+
+Classes:
+    Storage (ABCMeta): Abstract class of mapfile storages.\n
+    MemoryStorage (Storage): In-memory storage.\n
+    TempStorage (Storage): Temporary file storage.\n
+    FileStorage (Storage): User filepath storage.
+"""
+# --- External Imports --- #
+from abc import ABCMeta, abstractmethod
+from io import BytesIO
+from os import close, path, remove
+from tempfile import mkstemp
+import weakref
+
+
+class Storage(metaclass=ABCMeta):
+    """
+    Abstract class of mapfile storages.
+    """
+
+    persistent = False
+    """
+    True if the mapfile outlives close(), i.e. pending changes are worth writing before closing.
+    :type: bool
+    """
+
+    @property
+    @abstractmethod
+    def path(self):
+        """
+        :return: filepath of mapfile, or None if mapfile is not stored on disk (or not written yet).
+        :rtype: None | str
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def write(self, data):
+        """
+        Replace content of mapfile with <data>.
+
+        :param data: SVG document
+        :type data: bytes
+
+        :return:
+        :rtype: None
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def read(self):
+        """
+        :return: content of mapfile (empty if never written).
+        :rtype: bytes
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Release storage. Does nothing unless overridden.
+
+        :return:
+        :rtype: None
+        """
+        pass
+
+
+class MemoryStorage(Storage):
+    """
+    In-memory storage. The mapfile is a BytesIO buffer and has no filepath. The buffer is kept on close().
+    """
+
+    persistent = True
+
+    def __init__(self):
+        self._buffer = BytesIO()
+
+    @property
+    def path(self):
+        return None
+
+    @property
+    def buffer(self):
+        """
+        :return: buffer holding the mapfile.
+        :rtype: io.BytesIO
+        """
+        return self._buffer
+
+    def write(self, data):
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._buffer.write(data)
+
+    def read(self):
+        return self._buffer.getvalue()
+
+
+class TempStorage(Storage):
+    """
+    Temporary file storage. A uniquely named file is created in <directory> on first write and deleted on close().
+    """
+
+    def __init__(self, directory=None, prefix="svgUS", suffix=".svg"):
+        """
+        Constructor method for TempStorage.
+
+        :param directory: directory of temporary file (e.g. "/dev/shm"). If None, the system's temporary directory.
+        :type directory: None | str
+        :param prefix: filename prefix
+        :type prefix: str
+        :param suffix: filename suffix
+        :type suffix: str
+        """
+        self._directory = directory
+        self._prefix = prefix
+        self._suffix = suffix
+        self._path = None
+        self._finalizer = None
+
+    @property
+    def path(self):
+        return self._path
+
+    def write(self, data):
+        if self._path is None:
+            fd, self._path = mkstemp(suffix=self._suffix, prefix=self._prefix, dir=self._directory)
+            close(fd)
+            self._finalizer = weakref.finalize(self, TempStorage._remove, self._path)
+        with open(self._path, "wb") as f:
+            f.write(data)
+
+    def read(self):
+        if self._path is None:
+            return b""
+        with open(self._path, "rb") as f:
+            return f.read()
+
+    def close(self):
+        if self._finalizer is not None:
+            self._finalizer()  # removes file, runs at most once
+        self._path = None
+        self._finalizer = None
+
+    @staticmethod
+    def _remove(filename):
+        if path.exists(filename):
+            remove(filename)
+
+
+class FileStorage(Storage):
+    """
+    Storage at an explicit user filepath. The file is kept on close().
+    """
+
+    persistent = True
+
+    def __init__(self, filename):
+        """
+        Constructor method for FileStorage.
+
+        :param filename: filepath of mapfile
+        :type filename: str
+        """
+        self._path = path.abspath(filename)
+
+    @property
+    def path(self):
+        return self._path
+
+    def write(self, data):
+        with open(self._path, "wb") as f:
+            f.write(data)
+
+    def read(self):
+        if not path.exists(self._path):
+            return b""
+        with open(self._path, "rb") as f:
+            return f.read()
+
+# END OF FILE ////////////////////////////////////////////////////////////
@@ -0,0 +1,283 @@
+"""
+This module holds the tallying engine: the external 'logic' class (see 'abstracts.py') that turns election results into
+map changes.
+
+Votes are given as a NumPy array of regions x candidates (or scenarios x regions x candidates). Winners, margins,
+shading tiers and electoral vote totals are computed in vectorized form, so thousands of regions and scenarios can be
+tallied per second. Results of a single scenario are drawn on an ElectionUS map with one ElectionUS.apply_update(...)
+call (one write).
+
+Shading tiers come from 'config/colors.conf': a candidate's party "RED" is shaded RED_1 (closest margin) to RED_3
+(safest), a tier per margin threshold plus one.
+
+Requires 'numpy'.
+
+Attribs:
+    DIR (str) - Absolute filepath for this module's directory\n
+    COLORS_FILE (str) - Absolute filepath for the color configuration file\n
+    THRESHOLDS (tuple[float]) - Default margin thresholds between shading tiers
+
+Classes:
+    Tally: Vectorized tally of votes by region and candidate.
+
+Functions:
+    load_colors(filename=COLORS_FILE): Load (or get cached) named colors.\n
+    palette(parties, tiers=3, colors=None): Get shading colors of parties.\n
+    electoral_votes(mapper, regions=None): Get electoral votes of regions from the map's numbers.\n
+    apply_results(election, candidates, votes, regions=None, thresholds=THRESHOLDS, title=None, bar=True):
+    Tally votes and draw results on an ElectionUS map.
+"""
+# --- External Imports --- #
+from os import path
+from threading import Lock
+try:
+    import numpy as np
+except ImportError:  # Only required by this module
+    np = None
+
+# Global parameters
+DIR = path.dirname(__file__)
+COLORS_FILE = path.join(DIR, "../config/colors.conf")
+THRESHOLDS = (0.05, 0.15)
+
+_colors = {}
+"""
+Loaded color files keyed by absolute filepath.
+:type: dict[str, (float, dict[str, int])]
+"""
+
+_colors_lock = Lock()
+"""
+Lock guarding _colors while a color file is (re)loaded.
+:type: threading.Lock
+"""
+
+
+def _require_numpy():
+    """
+    :raises RuntimeError: if numpy is not installed
+    """
+    if np is None:
+        raise RuntimeError("Tallying requires 'numpy'. Install it with 'pip install numpy'.")
+
+
+def load_colors(filename=COLORS_FILE):
+    """
+    Load color file <filename> (NAME = 0xRRGGBB lines). The file is executed once per process and cached; it is only
+    reloaded if its modification time has changed since it was last loaded.
+
+    :param filename: filepath of color file
+    :type filename: str
+
+    :return: color (RGB hex) by name
+    :rtype: dict[str, int]
+    """
+    filename = path.abspath(filename)
+    mtime = path.getmtime(filename)
+    cached = _colors.get(filename)
+    if cached is None or cached[0] != mtime:
+        with _colors_lock:
+            cached = _colors.get(filename)
+            if cached is None or cached[0] != mtime:
+                namespace = {}
+                with open(filename) as f:
+                    exec(f.read(), namespace)
+                colors = {k: v for k, v in namespace.items() if k.isupper() and isinstance(v, int)}
+                cached = _colors[filename] = (mtime, colors)
+    return dict(cached[1])
+
+
+def palette(parties, tiers=3, colors=None):
+    """
+    Get shading colors of <parties>, lightest (closest margin) first.
+
+    :param parties: per candidate, name of party colors in color file (e.g. "RED" for RED_1, RED_2, ...) or a single
+        color in RGB hex (0x??????) used for all tiers
+    :type parties: list[str | int]
+    :param tiers: number of shading tiers
+    :type tiers: int
+    :param colors: named colors. If None, load_colors().
+    :type colors: None | dict[str, int]
+
+    :return: array of candidates x tiers colors
+    :rtype: numpy.ndarray
+
+    :raises ValueError: if a party has no color for some tier
+    """
+    _require_numpy()
+    colors = load_colors() if colors is None else colors
+    table = np.empty((len(parties), tiers), dtype=np.int64)
+    for k, party in enumerate(parties):
+        if isinstance(party, int):
+            table[k] = party
+            continue
+        for t in range(tiers):
+            name = "{0}_{1}".format(str(party).upper(), t + 1)
+            if name not in colors:
+                raise ValueError("No color '{0}' for party '{1}' in color file.".format(name, party))
+            table[k, t] = colors[name]
+    return table
+
+
+def electoral_votes(mapper, regions=None):
+    """
+    Get electoral votes of <regions> from the map's numbers (0 for regions without a number, e.g. counties).
+
+    :param mapper: map holding the numbers
+    :type mapper: mappers.mapperUS.MapperUS
+    :param regions: region identifiers. If None, all regions of the map in map order.
+    :type regions: None | list[str]
+
+    :return: electoral votes by region
+    :rtype: numpy.ndarray
+    """
+    _require_numpy()
+    regions = mapper.get_region_list() if regions is None else regions
+    numbers = (mapper.get_region_number(r) for r in regions)
+    return np.fromiter((int(n) if n and n.isdigit() else 0 for n in numbers), dtype=np.int64, count=len(regions))
+
+
+class Tally:
+    """
+    Vectorized tally of votes by region and candidate.
+
+    For votes of shape (..., regions, candidates):
+        * winners (..., regions) - index of winning candidate, -1 if region has no votes, -2 if tied\n
+        * margins (..., regions) - (first - second) / total votes, 0 if region has no votes\n
+        * tiers (..., regions) - shading tier of margin, 0 (closest) to len(thresholds)\n
+        * totals (..., candidates) - total votes per candidate\n
+        * ev_totals (..., candidates) - electoral votes won per candidate
+    """
+
+    __slots__ = ("votes", "ev", "thresholds", "winners", "margins", "tiers", "totals", "ev_totals")
+
+    NO_VOTES = -1
+    TIED = -2
+
+    def __init__(self, votes, ev=None, thresholds=THRESHOLDS):
+        """
+        Constructor method for Tally.
+
+        :param votes: votes of shape (regions, candidates), or (scenarios, regions, candidates)
+        :type votes: numpy.ndarray | list
+        :param ev: electoral votes by region. If None, no electoral votes are counted.
+        :type ev: None | numpy.ndarray | list[int]
+        :param thresholds: ascending margin thresholds between shading tiers
+        :type thresholds: tuple[float]
+        """
+        _require_numpy()
+        votes = np.asarray(votes)
+        if votes.ndim < 2 or votes.shape[-1] == 0:
+            raise ValueError("Votes must be an array of (scenarios x) regions x candidates.")
+        nreg, ncand = votes.shape[-2:]
+        ev = np.zeros(nreg, dtype=np.int64) if ev is None else np.asarray(ev, dtype=np.int64)
+        if ev.shape != (nreg,):
+            raise ValueError("Need electoral votes for {0} regions, got shape {1}.".format(nreg, ev.shape))
+
+        self.votes = votes
+        self.ev = ev
+        self.thresholds = tuple(thresholds)
+
+        # Winners and margins between first and second candidate
+        total = votes.sum(axis=-1)
+        if ncand > 1:
+            # Running first/second over the (short) candidate axis, faster than sorting along it
+            first = np.maximum(votes[..., 0], votes[..., 1])
+            second = np.minimum(votes[..., 0], votes[..., 1])
+            for k in range(2, ncand):
+                second = np.maximum(second, np.minimum(first, votes[..., k]))
+                first = np.maximum(first, votes[..., k])
+            lead = first - second
+        else:
+            lead = votes[..., 0]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.margins = np.where(total > 0, lead / np.where(total > 0, total, 1), 0.0)
+        winners = votes.argmax(axis=-1)
+        winners[(lead == 0) & (total > 0)] = Tally.TIED
+        winners[total <= 0] = Tally.NO_VOTES
+        self.winners = winners
+        self.tiers = np.searchsorted(np.asarray(self.thresholds), self.margins, side="right")
+        self.totals = votes.sum(axis=-2)
+
+        # Electoral votes per candidate (and scenario): bincount over candidate index offset by scenario
+        flat = winners.reshape(-1, nreg)
+        won = flat >= 0
+        idx = (flat + ncand * np.arange(flat.shape[0])[:, None])[won]
+        weights = np.broadcast_to(ev, flat.shape)[won]
+        self.ev_totals = np.bincount(idx, weights=weights, minlength=flat.shape[0] * ncand) \
+            .astype(np.int64).reshape(winners.shape[:-1] + (ncand,))
+
+    def colors(self, table, blank=None, tie=None):
+        """
+        Get shading color of every region.
+
+        :param table: candidates x tiers colors (see palette(...))
+        :type table: numpy.ndarray
+        :param blank: color of regions without votes. If None, DEFAULT_1 of color file.
+        :type blank: None | int
+        :param tie: color of tied regions. If None, SWING of color file.
+        :type tie: None | int
+
+        :return: colors in RGB hex (0x??????) of shape (..., regions)
+        :rtype: numpy.ndarray
+        """
+        table = np.asarray(table)
+        if table.shape[1] <= len(self.thresholds):
+            raise ValueError("Need {0} shading tiers, got {1}.".format(len(self.thresholds) + 1, table.shape[1]))
+        if blank is None or tie is None:
+            named = load_colors()
+            blank = named["DEFAULT_1"] if blank is None else blank
+            tie = named["SWING"] if tie is None else tie
+        colors = table[np.maximum(self.winners, 0), self.tiers]
+        colors[self.winners == Tally.NO_VOTES] = blank
+        colors[self.winners == Tally.TIED] = tie
+        return colors
+
+
+def apply_results(election, candidates, votes, regions=None, thresholds=THRESHOLDS, title=None, bar=True):
+    """
+    Tally <votes> and draw the results on <election> in one batch: region colors shaded by margin, candidates'
+    electoral votes and (optionally) the vote bar. Candidates must already be added to the map to show their votes.
+
+    :param election: map to draw results on
+    :type election: mappers.electionUS.ElectionUS
+    :param candidates: (name, party) per column of <votes>. <party>: see palette(...)
+    :type candidates: list[(str, str | int)]
+    :param votes: votes of shape (regions, candidates)
+    :type votes: numpy.ndarray | list
+    :param regions: region identifier per row of <votes>. If None, all regions of the map in map order.
+    :type regions: None | list[str]
+    :param thresholds: ascending margin thresholds between shading tiers
+    :type thresholds: tuple[float]
+    :param title: If given, set title of map.
+    :type title: None | str
+    :param bar: If True, set vote bar to candidates' electoral votes.
+    :type bar: bool
+
+    :return: tally and change-set of the map (see ElectionUS.apply_update(...))
+    :rtype: (Tally, dict)
+    """
+    regions = election.get_region_list() if regions is None else list(regions)
+    tally = Tally(votes, electoral_votes(election, regions), thresholds)
+    if tally.votes.ndim != 2 or tally.votes.shape != (len(regions), len(candidates)):
+        raise ValueError("Need votes of shape ({0}, {1}), got {2}.".format(
+            len(regions), len(candidates), tally.votes.shape))
+
+    table = palette([party for _, party in candidates], len(thresholds) + 1)
+    colors = tally.colors(table)
+    ev_totals = tally.ev_totals.tolist()
+
+    delta = {
+        "colors": dict(zip(regions, colors.tolist())),
+        "votes": {name: ev for (name, _), ev in zip(candidates, ev_totals)},
+    }
+    if title is not None:
+        delta["title"] = title
+    if bar:
+        data = {k: [name, int(table[k, -1]), ev] for k, ((name, _), ev) in enumerate(zip(candidates, ev_totals))}
+        data["total"] = max(int(tally.ev.sum()), 1)
+        data["tri"] = None
+        delta["bar"] = data
+    return tally, election.apply_update(delta)
+
+# END OF FILE ////////////////////////////////////////////////////////////
@@ -0,0 +1,169 @@
+"""
+This module holds the tile exporter of mapper objects, producing a z/x/y tile pyramid for zoomable web maps.
+
+At zoom level z the map is covered by a grid of square tiles of <size> pixels, 2^z tiles across its longer side
+(tile 0/0/0 shows the whole map), written to '<directory>/<z>/<x>/<y>.<format>'. Tiles are rendered from the SVG
+of the map with a viewBox cropping it to the tile, through the backends of 'render.py'.
+
+A pyramid remembers the state of the map at its last export. On the next export only the tiles overlapping regions
+whose color or number changed since (see MapperUS.get_region_bbox(...)) are rendered again. Any other change to the
+map (title, candidates, bars, size) re-renders the whole pyramid.
+
+Attribs:
+    PAD (float) - Margin added around changed regions, in map units (covers outline strokes)
+
+Classes:
+    TilePyramid: Incremental z/x/y tile exporter of a map.
+"""
+# --- Internal Imports --- #
+from mappers import render
+# --- External Imports --- #
+from math import ceil, floor
+from tempfile import mkstemp
+from threading import Lock
+import os
+
+# Global parameters
+PAD = 2.0
+
+
+class TilePyramid:
+    """
+    Incremental z/x/y tile exporter of a map. Exports of one pyramid are serialized by its own lock; the map is
+    only locked while its SVG and state are taken.
+    """
+
+    def __init__(self, mapper, directory, zooms=(0, 1, 2, 3), fmt="png", size=256, backend=None):
+        """
+        Constructor method for TilePyramid.
+
+        :param mapper: map to export
+        :type mapper: mappers.mapperUS.MapperUS
+        :param directory: root directory of tiles
+        :type directory: str
+        :param zooms: zoom levels to export
+        :type zooms: collections.Iterable[int]
+        :param fmt: image format of tiles, "png" | "jpg" | "webp"
+        :type fmt: str
+        :param size: width and height of tiles in pixels
+        :type size: int
+        :param backend: name of rasterizer backend (see 'render.py'). If None, first available one.
+        :type backend: None | str
+        """
+        self.mapper = mapper
+        self.directory = directory
+        self.zooms = tuple(sorted(set(int(z) for z in zooms)))
+        self.fmt = render._format(fmt)
+        self.size = int(size)
+        self.backend = backend
+        if self.fmt == "svg":
+            raise ValueError("Tiles must be raster images, not 'svg'.")
+        if self.size <= 0 or not self.zooms or self.zooms[0] < 0:
+            raise ValueError("Tile size must be positive and zoom levels 0 or more.")
+        self._state = None  # (region store, chrome) of last export
+        self._lock = Lock()
+
+    def grid(self, z, width=None, height=None):
+        """
+        Get the tile grid of zoom level <z>.
+
+        :param z: zoom level
+        :type z: int
+        :param width: map width in pixels. If None, the map's.
+        :type width: None | int
+        :param height: map height in pixels. If None, the map's.
+        :type height: None | int
+
+        :return: tile side in map pixels, number of tile columns, number of tile rows
+        :rtype: (float, int, int)
+        """
+        width = self.mapper.mapwidth if width is None else width
+        height = self.mapper.mapheight if height is None else height
+        side = max(width, height) / 2 ** z
+        return side, int(ceil(width / side)), int(ceil(height / side))
+
+    def path(self, z, x, y):
+        """
+        :return: filepath of tile z/x/y.
+        :rtype: str
+        """
+        return os.path.join(self.directory, str(z), str(x), "{0}.{1}".format(y, self.fmt))
+
+    def export(self, full=False):
+        """
+        Render the tiles changed since the last export (all tiles on first export).
+
+        :param full: If True, render all tiles.
+        :type full: bool
+
+        :return: rendered tiles as (z, x, y), by zoom level
+        :rtype: list[(int, int, int)]
+        """
+        with self._lock:
+            return self._export(full)
+
+    def _export(self, full):
+        """
+        See export(...). Private method for TilePyramid objects, called holding the pyramid's lock.
+        """
+        doc, store, chrome, width, height, to_pixels = self.mapper._snapshot()
+
+        # Boxes (in map pixels) of changed regions, None to render all tiles
+        boxes = None
+        if not full and self._state is not None and self._state[1] == chrome:
+            geometry = self.mapper._geometry()
+            boxes = []
+            for identifier in store.diff(self._state[0]):
+                k = store.position(identifier)
+                for box in (geometry.boxes[k], geometry.number_boxes[k]):
+                    if box is not None:
+                        x0, y0, x1, y1 = to_pixels(box)
+                        boxes.append((x0 - PAD, y0 - PAD, x1 + PAD, y1 + PAD))
+
+        rendered = []
+        for z in self.zooms:
+            side, nx, ny = self.grid(z, width, height)
+            tiles = set()
+            if boxes is None:
+                tiles.update((x, y) for x in range(nx) for y in range(ny))
+            for x0, y0, x1, y1 in boxes or ():
+                tiles.update((x, y) for x in range(max(0, int(floor(x0 / side))), min(nx, int(floor(x1 / side)) + 1))
+                             for y in range(max(0, int(floor(y0 / side))), min(ny, int(floor(y1 / side)) + 1)))
+            for x, y in sorted(tiles):
+                self._write(self.path(z, x, y), self._render(doc, x * side, y * side, side))
+                rendered.append((z, x, y))
+
+        self._state = (store, chrome)
+        return rendered
+
+    def _render(self, doc, x, y, side):
+        """
+        Render the square <side> x <side> at (<x>, <y>) (map pixels) of SVG document <doc> to a tile.
+        Private method for TilePyramid objects.
+
+        :return: image bytes
+        :rtype: bytes
+        """
+        # Nest the map in an outer SVG whose viewBox crops it to the tile
+        head = '<svg xmlns="http://www.w3.org/2000/svg" width="{0}" height="{0}" viewBox="{1!r} {2!r} {3!r} {3!r}">' \
+            .format(self.size, float(x), float(y), float(side))
+        return render.render(head.encode("utf-8") + doc + b"</svg>", self.fmt, backend=self.backend)
+
+    @staticmethod
+    def _write(filename, data):
+        """
+        Write <data> to <filename> atomically (readers never see a partial tile).
+        Private method for TilePyramid objects.
+        """
+        directory = os.path.dirname(filename)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, filename)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+# END OF FILE ////////////////////////////////////////////////////////////
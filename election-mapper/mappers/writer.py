@@ -0,0 +1,258 @@
+"""
+This module holds an incremental SVG writer used by mappers to serialize their resident xml tree.
+
+ElementTree.tostring(...) re-serializes the whole document on every call, although almost all of a map's bytes (the
+region path geometry) never change. SVGWriter caches the serialized bytes of every element (tail included) and, on
+each write, only re-serializes the elements that were invalidated since the last write plus their ancestors. Clean
+subtrees are spliced into the output from the cache as they are, so the cost of a write is proportional to the
+changes rather than to the size of the map.
+
+An element is cached as a list of byte pieces, and a parent's list holds references to its children's pieces rather
+than a copy of their bytes; the document is only joined into one buffer by tobytes(). Lazily loaded attribute values
+(see 'lazy.py') are pieces of their own, spliced raw from the template's source bytes, so the geometry shared by all
+mappers of a template is neither decoded nor copied per mapper.
+
+Output is the same as ElementTree.tostring(root, encoding="utf-8") for the same namespace prefixes, except that a
+namespace is still declared on the root after the last element using it has been removed, and that lazily loaded
+values are written as they appear in their source file (e.g. an escaped or literal newline is kept as such).
+
+Classes:
+    SVGWriter: Incremental serializer of an xml tree.
+"""
+# --- External Imports --- #
+import weakref
+import xml.etree.ElementTree as ET
+
+XML_NAMESPACE = "http://www.w3.org/XML/1998/namespace"
+"""
+Namespace of 'xml:' attributes (e.g. xml:space). Always bound to prefix 'xml' and never declared.
+:type: str
+"""
+
+
+def _escape_cdata(text):
+    """
+    Escape element text for output.
+
+    :param text: text to escape
+    :type text: str
+
+    :return: escaped text
+    :rtype: str
+    """
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    return text
+
+
+def _escape_attrib(text):
+    """
+    Escape attribute value for output.
+
+    :param text: value to escape
+    :type text: str
+
+    :return: escaped value
+    :rtype: str
+    """
+    text = _escape_cdata(text)
+    if "\"" in text:
+        text = text.replace("\"", "&quot;")
+    if "\r" in text:
+        text = text.replace("\r", "&#13;")
+    if "\n" in text:
+        text = text.replace("\n", "&#10;")
+    if "\t" in text:
+        text = text.replace("\t", "&#09;")
+    return text
+
+
+class SVGWriter:
+    """
+    Incremental serializer of the xml tree under <root>.
+
+    The owner of the tree must call invalidate(...) with every element whose tag, attributes, text, tail or children
+    it changed; otherwise tobytes() keeps returning the cached bytes of that element.
+    """
+
+    def __init__(self, root, namespaces=None):
+        """
+        Constructor method for SVGWriter.
+
+        :param root: root element of tree to serialize
+        :type root: xml.etree.Element
+        :param namespaces: namespace uri -> prefix ("" for the default namespace). Other namespaces get prefixes
+            ns1, ns2, ... in order of first use.
+        :type namespaces: None | dict[str, str]
+        """
+        self._root = root
+        self._prefixes = {XML_NAMESPACE: "xml"}
+        self._prefixes.update(namespaces or {})
+        self._auto = 0  # Number of generated prefixes
+        self._used = set()  # Namespaces to declare on root
+        self._qnames = {}  # Qualified name -> output name
+        self._cache = weakref.WeakKeyDictionary()  # Element -> serialized byte pieces (dropped with element)
+        self._dirty = set()
+        self._parents = None
+
+    def invalidate(self, *elements):
+        """
+        Mark <elements> (and their ancestors) as changed. If no element is given, the whole tree is re-serialized.
+
+        :param elements: changed elements of the tree
+        :type elements: xml.etree.Element
+
+        :return:
+        :rtype: None
+        """
+        if not elements:
+            self._cache.clear()
+            self._dirty.clear()
+            self._parents = None
+            return
+
+        for element in elements:
+            if element is not self._root and (self._parents is None or element not in self._parents):
+                self._parents = {c: p for p in self._root.iter() for c in p}  # New element, rebuild parent map
+            while element is not None and element not in self._dirty:
+                self._dirty.add(element)
+                element = self._parents.get(element) if self._parents is not None else None
+
+    def tobytes(self):
+        """
+        Serialize the tree, re-using cached bytes of unchanged subtrees.
+
+        :return: UTF-8 encoded document (no xml declaration)
+        :rtype: bytes
+        """
+        root = self._root
+        inner = []
+        for child in root:
+            inner.extend(self._serialize(child))
+
+        # Namespace declarations go on the root; they are only known once all children are serialized
+        tag = self._qname(root.tag)
+        declarations = "".join(
+            ' xmlns{0}="{1}"'.format(":" + prefix if prefix else "", _escape_attrib(uri))
+            for prefix, uri in sorted((self._prefixes[uri], uri) for uri in self._used if uri != XML_NAMESPACE)
+        )
+        self._dirty.clear()
+        return b"".join(self._element(root, tag, inner, declarations))
+
+    def fragment(self, element):
+        """
+        Serialize a single element of the tree (tail excluded), e.g. to replace it in a page showing the document.
+        Namespaced names use the document's prefixes, which are only declared on the root.
+
+        :param element: element of the tree
+        :type element: xml.etree.Element
+
+        :return: serialized element
+        :rtype: bytes
+        """
+        chunk = b"".join(self._serialize(element))
+        tail = _escape_cdata(element.tail or "").encode("utf-8")
+        return chunk[:len(chunk) - len(tail)]
+
+    def _serialize(self, element):
+        """
+        Get serialized byte pieces of <element> (tail included), from cache if it is unchanged.
+        The returned list is cached and must not be modified.
+        Private method for SVGWriter objects.
+
+        :param element: element to serialize
+        :type element: xml.etree.Element
+
+        :return: serialized element
+        :rtype: list[bytes]
+        """
+        pieces = self._cache.get(element)
+        if pieces is None or element in self._dirty:
+            tag = element.tag
+            if tag is ET.Comment:
+                pieces = ["<!--{0}-->{1}".format(element.text, _escape_cdata(element.tail or "")).encode("utf-8")]
+            elif tag is ET.ProcessingInstruction:
+                pieces = ["<?{0}?>{1}".format(element.text, _escape_cdata(element.tail or "")).encode("utf-8")]
+            else:
+                inner = []
+                for child in element:
+                    inner.extend(self._serialize(child))
+                pieces = self._element(element, self._qname(tag), inner)
+            self._cache[element] = pieces
+        return pieces
+
+    def _element(self, element, tag, inner, declarations=""):
+        """
+        Serialize <element> around the already serialized byte pieces of its children.
+        Private method for SVGWriter objects.
+
+        :param element: element to serialize
+        :type element: xml.etree.Element
+        :param tag: output name of element's tag
+        :type tag: str
+        :param inner: serialized children
+        :type inner: list[bytes]
+        :param declarations: namespace declarations (root only)
+        :type declarations: str
+
+        :return: serialized element
+        :rtype: list[bytes]
+        """
+        pieces = []
+        start = ["<", tag, declarations]
+        for key, value in element.attrib.items():
+            if isinstance(value, str):
+                start.append(' {0}="{1}"'.format(self._qname(key), _escape_attrib(value)))
+            else:
+                # Lazily loaded value (mappers.lazy.LazyAttribute): splice its raw bytes, already escaped
+                start.append(' {0}="'.format(self._qname(key)))
+                pieces.append("".join(start).encode("utf-8"))
+                pieces.append(value.raw)
+                start = ['"']
+
+        text = element.text
+        if text or inner:
+            start.append(">")
+            if text:
+                start.append(_escape_cdata(text))
+            end = "</{0}>".format(tag)
+        else:
+            end = " />"
+        if element.tail:
+            end += _escape_cdata(element.tail)
+        pieces.append("".join(start).encode("utf-8"))
+        pieces.extend(inner)
+        pieces.append(end.encode("utf-8"))
+        return pieces
+
+    def _qname(self, name):
+        """
+        Get output name of tag/attribute <name>, prefixing its namespace.
+        Private method for SVGWriter objects.
+
+        :param name: tag/attribute name, "{uri}local" if qualified
+        :type name: str
+
+        :return: output name
+        :rtype: str
+        """
+        qname = self._qnames.get(name)
+        if qname is None:
+            if name[:1] == "{":
+                uri, local = name[1:].split("}", 1)
+                prefix = self._prefixes.get(uri)
+                if prefix is None:
+                    self._auto += 1
+                    prefix = self._prefixes[uri] = "ns{0}".format(self._auto)
+                self._used.add(uri)
+                qname = "{0}:{1}".format(prefix, local) if prefix else local
+            else:
+                qname = name
+            self._qnames[name] = qname
+        return qname
+
+# END OF FILE ////////////////////////////////////////////////////////////